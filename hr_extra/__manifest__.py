@@ -27,12 +27,14 @@
         'data/hr_work_entry_type_domtrab.xml',
         'security/res_groups.xml',
         'security/ir.model.access.csv',
+        'security/ir_rule.xml',
         'views/hr_catalogs_views.xml',
         'views/hr_employee_views.xml',
         'views/resource_calendar_views.xml',
         'views/res_config_settings_views.xml',
         'views/ctrol_asistencias_views.xml',
         'views/checador_sync_log_views.xml',
+        'views/ctrol_asistencias_run_views.xml',
         'views/hr_leaves_views.xml',
         'views/reporte_asistencias_views.xml',
         'wizard/wizard_festivo_masivo_views.xml',
@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
+import base64
+import csv
+import hashlib
+import io
 import json
 import hmac
 import logging
 from datetime import datetime, timedelta
 from functools import wraps
-from odoo import http, SUPERUSER_ID
+from odoo import api, fields, http, SUPERUSER_ID
 from odoo.http import request, Response
+from odoo.tools.mimetypes import guess_mimetype
 from odoo.exceptions import AccessDenied
+from odoo.modules.registry import Registry
+from odoo.addons.hr_extra.models.checador_api_cache import checador_api_cache
+from odoo.addons.hr_extra.models.ctrol_asistencias import EXPORT_FIELDS
 try:
     import pytz
     PYTZ_AVAILABLE = True
@@ -22,6 +30,15 @@ except ImportError:
 
 _logger = logging.getLogger(__name__)
 
+MAX_CHECKS_PER_DAY = 6          # Máximo de checadas por empleado por día LOCAL
+BATCH_MAX_ITEMS = 1000          # Máximo de checadas por petición en /api/v1/attendances/batch
+SYNC_TOMBSTONE_DAYS = 90        # Días que se conservan las bajas (cleanup_old_logs); syncs más antiguas reciben carga completa
+# Campos de ctrol.asistencias que el checador puede enviar (body documentado de POST /api/v1/attendances)
+ATTENDANCE_FIELDS = ('registration_number', 'check_type', 'check_date', 'photo_url', 'latitude', 'longitude', 'log_status',
+    'lateness_time', 'left_early_time', 'is_active', 'verification_status', 'match_percentage', 'log_message')
+PHOTO_MODES = ('url', 'inline', 'none')
+PHOTO_SIZES = {'128': 'image_128', '256': 'image_256', '512': 'image_512', '1024': 'image_1024', '1920': 'image_1920'}
+
 
 class ApiChecadoresController(http.Controller):
     # Controlador principal para la API de Checadores con JWT.
@@ -33,18 +50,16 @@ class ApiChecadoresController(http.Controller):
         return True, None
 
     def _get_checador_tz(self):
-        # Obtiene la zona horaria del usuario api_checadores o fallback a la compañía.
-        ICP = request.env['ir.config_parameter'].sudo()
-        username = ICP.get_param('api_checadores.username', '')
-        if username:
-            user = request.env['res.users'].sudo().search([('login', '=', username)], limit=1)
-            if user and user.tz:
-                return user.tz
+        # Zona horaria del checador (caché local al proceso, ver ctrol.asistencias._get_checador_tz).
+        return request.env['ctrol.asistencias'].sudo()._get_checador_tz()
 
-        company = request.env.company
-        if company.resource_calendar_id and company.resource_calendar_id.tz:
-            return company.resource_calendar_id.tz
-        return 'America/Mexico_City'
+    def _get_api_settings(self):
+        # Configuración del API desde la caché local al proceso; descarta la caché si otro worker publicó cambios.
+        checador_api_cache.sync_version(request.env)
+        ICP = request.env['ir.config_parameter'].sudo()
+        return checador_api_cache.get(request.env, 'settings', lambda: {
+            'enabled': (ICP.get_param('api_checadores.enabled', 'False') or '').lower() == 'true',
+            'username': ICP.get_param('api_checadores.username', ''),})
 
 
     def _local_to_utc(self, local_dt, tz_name):
@@ -62,31 +77,49 @@ class ApiChecadoresController(http.Controller):
         except Exception:
             return local_dt
 
+    def _parse_check_date(self, raw_value):
+        # Parsea check_date del checador (hora LOCAL naive). Lanza ValueError/TypeError si el formato es inválido.
+        date_raw = raw_value.replace('Z', '').replace('T', ' ').strip()
+        if '.' in date_raw:
+            date_raw = date_raw.split('.')[0]
+        return datetime.strptime(date_raw, '%Y-%m-%d %H:%M:%S')
 
     def _get_jwt_secret(self):
-        # Obtiene la clave secreta para firmar JWT
-        secret = request.env['ir.config_parameter'].sudo().get_param('api_checadores.jwt_secret', '')
-        if not secret:
-            # Generar una nueva si no existe
-            import secrets
-            secret = secrets.token_urlsafe(32)
-            request.env['ir.config_parameter'].sudo().set_param('api_checadores.jwt_secret', secret)
-        return secret
-
-    def _json_response(self, data, status=200):
+        # Obtiene la clave secreta para firmar JWT (caché local al proceso)
+        def load_secret():
+            secret = request.env['ir.config_parameter'].sudo().get_param('api_checadores.jwt_secret', '')
+            if not secret:
+                # Generar una nueva si no existe
+                import secrets
+                secret = secrets.token_urlsafe(32)
+                request.env['ir.config_parameter'].sudo().set_param('api_checadores.jwt_secret', secret)
+            return secret
+        return checador_api_cache.get(request.env, 'jwt_secret', load_secret)
+
+    def _json_response(self, data, status=200, headers=None):
         # Genera respuesta JSON estándar.
         return Response(
             json.dumps(data, ensure_ascii=False, default=str),
             status=status,
             mimetype='application/json',
             headers=[('Access-Control-Allow-Origin', '*'), ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'), 
-                ('Access-Control-Allow-Headers', 'Content-Type, Authorization'),])
+                ('Access-Control-Allow-Headers', 'Content-Type, Authorization'),] + (headers or []))
 
     def _error_response(self, message, status=400, error_code=None):
         # Genera respuesta de error estándar.
         return self._json_response({'status': 'error', 'timestamp': datetime.now().isoformat(), 
             'error': {'code': error_code or f'ERR_{status}', 'message': message,}}, status=status)
 
+    def _get_photo_options(self, kw):
+        # Modo de foto para listados: 'url' (default, hash + URL), 'inline' (base64 como antes) o 'none'.
+        photo_mode = (kw.get('photo_mode') or 'url').lower()
+        photo_size = kw.get('photo_size') or None
+        if photo_mode not in PHOTO_MODES:
+            return None, None, self._error_response(f"photo_mode inválido. Use: {', '.join(PHOTO_MODES)}", status=400, error_code='INVALID_PHOTO_MODE')
+        if photo_size and photo_size not in PHOTO_SIZES:
+            return None, None, self._error_response(f"photo_size inválido. Use: {', '.join(PHOTO_SIZES)}", status=400, error_code='INVALID_PHOTO_SIZE')
+        return photo_mode, photo_size, None
+
     def _validate_jwt_token(self):
         """ Valida el token JWT enviado en el header Authorization.
         Returns:
@@ -95,8 +128,7 @@ class ApiChecadoresController(http.Controller):
         if not jwt_ok:
             return False, error
         
-        api_enabled = request.env['ir.config_parameter'].sudo().get_param('api_checadores.enabled', 'False')
-        if api_enabled.lower() != 'true':
+        if not self._get_api_settings()['enabled']:
             return False, self._error_response('API de checadores no está habilitada', status=503, error_code='API_DISABLED')
         
         # Obtener token del header Authorization
@@ -112,6 +144,11 @@ class ApiChecadoresController(http.Controller):
             return False, self._error_response('Formato de Authorization inválido. Use: Bearer <token>', status=401, error_code='INVALID_AUTH_FORMAT')
         
         token = parts[1]
+        # Token verificado recientemente: se reutiliza sin volver a decodificar
+        payload = checador_api_cache.get_token(request.env, token)
+        if payload:
+            return True, payload
+
         secret = self._get_jwt_secret()
         try:
             # Decodificar y validar token
@@ -121,6 +158,7 @@ class ApiChecadoresController(http.Controller):
                 return False, self._error_response('Token expirado', status=401, error_code='TOKEN_EXPIRED')
             
             # Token válido
+            checador_api_cache.set_token(request.env, token, payload, payload['exp'])
             return True, payload            
         except jwt.ExpiredSignatureError:
             _logger.warning(f"API Checadores: Token expirado desde IP: {request.httprequest.remote_addr}")
@@ -152,8 +190,7 @@ class ApiChecadoresController(http.Controller):
                 return self._error_response('PyJWT no está instalado', status=500, error_code='JWT_NOT_INSTALLED')
             
             # Verificar que la API esté habilitada
-            api_enabled = request.env['ir.config_parameter'].sudo().get_param('api_checadores.enabled', 'False')
-            if api_enabled.lower() != 'true':
+            if not self._get_api_settings()['enabled']:
                 return self._error_response('API de checadores no está habilitada', status=503, error_code='API_DISABLED')
             
             # Parsear body JSON
@@ -197,9 +234,8 @@ class ApiChecadoresController(http.Controller):
     @http.route('/api/v1/health', type='http', auth='none', methods=['GET'], csrf=False)
     def health_check(self):
         # Health check del servicio (sin autenticación).
-        api_enabled = request.env['ir.config_parameter'].sudo().get_param('api_checadores.enabled', 'False')
         return self._json_response({'status': 'ok', 'timestamp': datetime.now().isoformat(), 'service': 'api_checadores', 'version': '2.5.1', 
-            'authentication': 'JWT', 'jwt_available': JWT_AVAILABLE, 'api_enabled': api_enabled.lower() == 'true', })
+            'authentication': 'JWT', 'jwt_available': JWT_AVAILABLE, 'api_enabled': self._get_api_settings()['enabled'], })
 
     @http.route('/api/v1/employees', type='http', auth='none', methods=['GET', 'OPTIONS'], csrf=False)
     def get_employees(self, **kwargs):
@@ -216,6 +252,8 @@ class ApiChecadoresController(http.Controller):
             - active_only: Solo empleados activos (default true)
             - limit: Límite de resultados (default 100, max 1000)
             - offset: Desplazamiento para paginación (default 0)
+            - photo_mode: 'url' (default: photo_hash + photo_url), 'inline' (base64 en photo) o 'none'
+            - photo_size: 128, 256, 512, 1024 o 1920 para la URL de la foto
         """
         if request.httprequest.method == 'OPTIONS':
             return self._json_response({'status': 'ok'})
@@ -237,6 +275,10 @@ class ApiChecadoresController(http.Controller):
                 filters['limit'] = kwargs['limit']
             if kwargs.get('offset'):
                 filters['offset'] = kwargs['offset']
+            photo_mode, photo_size, error = self._get_photo_options(kwargs)
+            if error:
+                return error
+            filters.update({'photo_mode': photo_mode, 'photo_size': photo_size})
             
             # Usar sudo() con el usuario SUPERUSER_ID para evitar problemas de contexto
             HrEmployee = request.env(user=SUPERUSER_ID)['hr.employee']
@@ -325,6 +367,143 @@ class ApiChecadoresController(http.Controller):
             return self._error_response('Error interno del servidor', status=500, error_code='INTERNAL_ERROR')
 
 
+    @http.route('/api/v1/employees/<int:employee_id>/photo', type='http', auth='none', methods=['GET', 'OPTIONS'], csrf=False)
+    def get_employee_photo(self, employee_id, size='1920', **kwargs):
+        """Foto del empleado en binario, redimensionada según size (128, 256, 512, 1024, 1920).
+        
+        El ETag es el photo_hash que entregan los listados; con If-None-Match igual responde 304 sin cuerpo,
+        así el dispositivo solo descarga las fotos que cambiaron. """
+        if request.httprequest.method == 'OPTIONS':
+            return self._json_response({'status': 'ok'})
+        
+        is_valid, result = self._validate_jwt_token()
+        if not is_valid:
+            return result
+        
+        if size not in PHOTO_SIZES:
+            return self._error_response(f"size inválido. Use: {', '.join(PHOTO_SIZES)}", status=400, error_code='INVALID_PHOTO_SIZE')
+        try:
+            employee = request.env(user=SUPERUSER_ID)['hr.employee'].browse(employee_id)
+            if not employee.exists():
+                return self._error_response(f'Empleado con ID {employee_id} no encontrado', status=404, error_code='EMPLOYEE_NOT_FOUND')
+            
+            checksum = employee._get_photo_checksums_for_api().get(employee.id)
+            if not checksum:
+                return self._error_response('El empleado no tiene foto disponible', status=404, error_code='PHOTO_NOT_FOUND')
+            
+            etag = f'"{checksum}-{size}"'
+            headers = [('ETag', etag), ('Cache-Control', 'private, max-age=0, must-revalidate'), ('Access-Control-Allow-Origin', '*'),
+                ('Access-Control-Expose-Headers', 'ETag')]
+            if_none_match = request.httprequest.headers.get('If-None-Match', '')
+            if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+                return Response(status=304, headers=headers)
+            
+            image = base64.b64decode(employee[PHOTO_SIZES[size]])
+            headers.append(('Content-Type', guess_mimetype(image, default='image/png')))
+            return Response(image, status=200, headers=headers)
+        except Exception as e:
+            _logger.error(f"API Checadores Error (employee/{employee_id}/photo): {str(e)}", exc_info=True)
+            return self._error_response('Error interno del servidor', status=500, error_code='INTERNAL_ERROR')
+
+
+    def _get_employee_counts(self, env):
+        # Empleados activos por puesto y por departamento en una sola consulta agrupada (job_id, department_id)
+        by_job, by_department = {}, {}
+        for job, department, count in env['hr.employee']._read_group([('active', '=', True)], ['job_id', 'department_id'], ['__count']):
+            if job:
+                by_job[job.id] = by_job.get(job.id, 0) + count
+            if department:
+                by_department[department.id] = by_department.get(department.id, 0) + count
+        return by_job, by_department
+
+    def _get_departments_data(self, env, counts):
+        return [{'id': dept.id, 'name': dept.name, 'manager': dept.manager_id.name if dept.manager_id else '', 
+            'parent_department': dept.parent_id.name if dept.parent_id else '', 'employee_count': counts.get(dept.id, 0),}
+            for dept in env['hr.department'].search([])]
+
+    def _get_job_positions_data(self, env, counts):
+        return [{'id': job.id, 'name': job.name or '', 'department': job.department_id.name if job.department_id else '',
+            'department_id': job.department_id.id if job.department_id else None, 'employee_count': counts.get(job.id, 0), 
+            'description': job.description or '',} for job in env['hr.job'].search([])]
+
+    def _get_schedules_data(self, env):
+        calendars = env['resource.calendar'].search([])
+        day_mapping = {'0': 'Lunes', '1': 'Martes', '2': 'Miércoles', '3': 'Jueves', '4': 'Viernes', '5': 'Sábado', '6': 'Domingo',}
+        schedules_data = []
+        for cal in calendars:
+            attendance_data = []
+            for att in cal.attendance_ids:
+                hours = int(att.hour_from)
+                minutes = int((att.hour_from - hours) * 60)
+                hour_from = f"{hours:02d}:{minutes:02d}:00"                    
+                hours = int(att.hour_to)
+                minutes = int((att.hour_to - hours) * 60)
+                hour_to = f"{hours:02d}:{minutes:02d}:00"
+                
+                attendance_data.append({'day_of_week': day_mapping.get(att.dayofweek, att.dayofweek), 'day_of_week_number': int(att.dayofweek),
+                    'hour_from': hour_from, 'hour_to': hour_to, 'name': att.name or '',})
+            
+            schedules_data.append({'id': cal.id, 'name': cal.name, 'tolerance_minutes': cal.tolerance_minutes or 15, 'hours_per_week': cal.hours_per_week,
+                'attendance': attendance_data, })
+        return schedules_data
+
+    def _get_catalog_version(self, env, counts):
+        # Versión del catálogo: altas/bajas/cambios de puestos, departamentos y horarios (count + max write_date por tabla)
+        # más los conteos de empleados. Revalidar cuesta dos consultas agregadas, sin serializar el catálogo.
+        env.cr.execute("""
+            SELECT (SELECT row(count(*), max(write_date))::text FROM hr_job),
+                   (SELECT row(count(*), max(write_date))::text FROM hr_department),
+                   (SELECT row(count(*), max(write_date))::text FROM resource_calendar),
+                   (SELECT row(count(*), max(write_date))::text FROM resource_calendar_attendance)""")
+        stats = list(env.cr.fetchone())
+        stats.append(sorted(counts[0].items()))
+        stats.append(sorted(counts[1].items()))
+        return hashlib.sha1(json.dumps(stats, default=str).encode('utf-8')).hexdigest()
+
+    @http.route('/api/v1/catalogs', type='http', auth='none', methods=['GET', 'OPTIONS'], csrf=False)
+    def get_catalogs(self, **kwargs):
+        """Snapshot versionado de catálogos (puestos, departamentos y horarios) para descargar una sola vez.
+        
+        Headers:
+            Authorization: Bearer <token>
+            If-None-Match: ETag recibido previamente (opcional); si el catálogo no cambió responde 304 sin cuerpo
+        
+        Returns:
+            {
+                "status": "success",
+                "version": "3f7a...",
+                "job_positions": [...],
+                "departments": [...],
+                "schedules": [...]
+            } """
+        if request.httprequest.method == 'OPTIONS':
+            return self._json_response({'status': 'ok'})
+        
+        is_valid, result = self._validate_jwt_token()
+        if not is_valid:
+            return result
+        
+        try:
+            env = request.env(user=SUPERUSER_ID)
+            counts = self._get_employee_counts(env)
+            version = self._get_catalog_version(env, counts)
+            etag = f'"{version}"'
+            headers = [('ETag', etag), ('Cache-Control', 'private, max-age=0, must-revalidate'), ('Access-Control-Expose-Headers', 'ETag')]
+            if_none_match = request.httprequest.headers.get('If-None-Match', '')
+            if etag in [tag.strip() for tag in if_none_match.split(',')]:
+                return Response(status=304, headers=headers + [('Access-Control-Allow-Origin', '*')])
+            
+            catalog = checador_api_cache.get_versioned(env, 'catalog', version, lambda: {
+                'job_positions': self._get_job_positions_data(env, counts[0]),
+                'departments': self._get_departments_data(env, counts[1]),
+                'schedules': self._get_schedules_data(env),})
+            return self._json_response(dict({'status': 'success', 'timestamp': datetime.now().isoformat(), 'version': version}, **catalog),
+                headers=headers)
+        except Exception as e:
+            _logger.error(f"API Checadores Error (catalogs): {str(e)}", exc_info=True)
+            return self._error_response('Error interno del servidor', status=500, error_code='INTERNAL_ERROR')
+
+
     @http.route('/api/v1/departments', type='http', auth='none', methods=['GET', 'OPTIONS'], csrf=False)
     def get_departments(self, **kwargs):
         # Obtiene lista de departamentos disponibles.
@@ -336,9 +515,8 @@ class ApiChecadoresController(http.Controller):
             return result
         
         try:
-            departments = request.env(user=SUPERUSER_ID)['hr.department'].search([])
-            departments_data = [{'id': dept.id, 'name': dept.name, 'manager': dept.manager_id.name if dept.manager_id else '', 
-                'parent_department': dept.parent_id.name if dept.parent_id else '', 'employee_count': dept.total_employee,} for dept in departments]
+            env = request.env(user=SUPERUSER_ID)
+            departments_data = self._get_departments_data(env, self._get_employee_counts(env)[1])
             return self._json_response({'status': 'success', 'timestamp': datetime.now().isoformat(), 'count': len(departments_data), 'data': departments_data,})
         except Exception as e:
             _logger.error(f"API Checadores Error (departments): {str(e)}", exc_info=True)
@@ -375,14 +553,8 @@ class ApiChecadoresController(http.Controller):
             return result
         
         try:
-            jobs = request.env(user=SUPERUSER_ID)['hr.job'].search([])
-            jobs_data = []
-            for job in jobs:
-                # Contar empleados activos con este puesto
-                employee_count = request.env(user=SUPERUSER_ID)['hr.employee'].search_count([('job_id', '=', job.id), ('active', '=', True)])
-                jobs_data.append({'id': job.id, 'name': job.name or '', 'department': job.department_id.name if job.department_id else '',
-                    'department_id': job.department_id.id if job.department_id else None, 'employee_count': employee_count, 
-                    'description': job.description or '',})
+            env = request.env(user=SUPERUSER_ID)
+            jobs_data = self._get_job_positions_data(env, self._get_employee_counts(env)[0])
             
             _logger.info(f"API Checadores: Consulta job_positions exitosa desde IP {request.httprequest.remote_addr}. "
                 f"Usuario JWT: {result.get('username')}. Puestos: {len(jobs_data)}")
@@ -404,24 +576,7 @@ class ApiChecadoresController(http.Controller):
             return result
         
         try:
-            calendars = request.env(user=SUPERUSER_ID)['resource.calendar'].search([])
-            day_mapping = {'0': 'Lunes', '1': 'Martes', '2': 'Miércoles', '3': 'Jueves', '4': 'Viernes', '5': 'Sábado', '6': 'Domingo',}
-            schedules_data = []
-            for cal in calendars:
-                attendance_data = []
-                for att in cal.attendance_ids:
-                    hours = int(att.hour_from)
-                    minutes = int((att.hour_from - hours) * 60)
-                    hour_from = f"{hours:02d}:{minutes:02d}:00"                    
-                    hours = int(att.hour_to)
-                    minutes = int((att.hour_to - hours) * 60)
-                    hour_to = f"{hours:02d}:{minutes:02d}:00"
-                    
-                    attendance_data.append({'day_of_week': day_mapping.get(att.dayofweek, att.dayofweek), 'day_of_week_number': int(att.dayofweek),
-                        'hour_from': hour_from, 'hour_to': hour_to, 'name': att.name or '',})
-                
-                schedules_data.append({'id': cal.id, 'name': cal.name, 'tolerance_minutes': cal.tolerance_minutes or 15, 'hours_per_week': cal.hours_per_week,
-                    'attendance': attendance_data, })
+            schedules_data = self._get_schedules_data(request.env(user=SUPERUSER_ID))
             return self._json_response({'status': 'success', 'timestamp': datetime.now().isoformat(), 'count': len(schedules_data), 'data': schedules_data,})
         except Exception as e:
             _logger.error(f"API Checadores Error (schedules): {str(e)}", exc_info=True)
@@ -482,12 +637,9 @@ class ApiChecadoresController(http.Controller):
             
             # Parsear la fecha del checador como hora LOCAL (el dispositivo envía hora local)
             try:
-                date_raw = data['check_date'].replace('Z', '').replace('T', ' ').strip()
-                if '.' in date_raw:
-                    date_raw = date_raw.split('.')[0]
                 # check_datetime es la hora LOCAL del checador (naive)
-                check_datetime = datetime.strptime(date_raw, '%Y-%m-%d %H:%M:%S')
-            except (ValueError, TypeError):
+                check_datetime = self._parse_check_date(data['check_date'])
+            except (ValueError, TypeError, AttributeError):
                 return self._error_response(f'Formato de fecha inválido: {data["check_date"]}. Use formato ISO 8601 (YYYY-MM-DDTHH:MM:SS)',
                     status=400, error_code='INVALID_DATE_FORMAT')
 
@@ -511,27 +663,14 @@ class ApiChecadoresController(http.Controller):
             else:
                 now_local = datetime.now()
 
-            # VALIDACIÓN 2: Máximo 6 checks por empleado por día LOCAL
-            # Convertir el día local a rango UTC para consultar ctrol.asistencias (que guarda en UTC)
+            # VALIDACIÓN 2: Máximo 6 checks por empleado por día LOCAL (columna materializada check_day_local)
             check_date_local = check_datetime.date()
-            if PYTZ_AVAILABLE:
-                try:
-                    tz = pytz.timezone(tz_name)
-                    day_start_utc = tz.localize(datetime.combine(check_date_local, datetime.min.time())).astimezone(pytz.utc).replace(tzinfo=None)
-                    day_end_utc = tz.localize(datetime.combine(check_date_local, datetime.max.time().replace(microsecond=0))).astimezone(pytz.utc).replace(tzinfo=None)
-                except Exception:
-                    day_start_utc = datetime.combine(check_date_local, datetime.min.time())
-                    day_end_utc = datetime.combine(check_date_local, datetime.max.time().replace(microsecond=0))
-            else:
-                day_start_utc = datetime.combine(check_date_local, datetime.min.time())
-                day_end_utc = datetime.combine(check_date_local, datetime.max.time().replace(microsecond=0))
+            key = (str(data['registration_number']), check_date_local)
+            checks_today = env['ctrol.asistencias'].count_checks_by_local_day([key]).get(key, 0)
 
-            checks_today = env['ctrol.asistencias'].search_count([('registration_number', '=', data['registration_number']), ('check_date', '>=', day_start_utc),
-                ('check_date', '<=', day_end_utc),])
-
-            if checks_today >= 6:
+            if checks_today >= MAX_CHECKS_PER_DAY:
                 return self._error_response(
-                    f'El empleado {data["registration_number"]} ya tiene {checks_today} registros para el día {check_date_local} (TZ: {tz_name}). Máximo permitido: 6',
+                    f'El empleado {data["registration_number"]} ya tiene {checks_today} registros para el día {check_date_local} (TZ: {tz_name}). Máximo permitido: {MAX_CHECKS_PER_DAY}',
                     status=400, error_code='MAX_CHECKS_EXCEEDED')
             
             # Preparar datos para crear registro
@@ -555,6 +694,147 @@ class ApiChecadoresController(http.Controller):
             return self._error_response('Error interno del servidor', status=500, error_code='INTERNAL_ERROR')
 
 
+    @http.route('/api/v1/attendances/batch', type='http', auth='none', methods=['POST', 'OPTIONS'], csrf=False, cors='*')
+    def attendance_create_batch(self, **kw):
+        """Alta masiva de asistencias en ctrol.asistencias (reenvío de checadas acumuladas por el dispositivo).
+
+        Body JSON: {"attendances": [{...}, {...}]}  o directamente la lista [{...}, {...}]
+            Cada elemento tiene el mismo formato que POST /api/v1/attendances (solo se guardan los campos de
+            ATTENDANCE_FIELDS). Máximo BATCH_MAX_ITEMS por petición.
+
+        Se aplican las mismas validaciones que en el alta individual, pero resueltas para todo el lote:
+        - Empleados por registration_number en una sola consulta
+        - Conteo de checks existentes por empleado/día LOCAL en una sola consulta agrupada
+        - Alta de todos los registros válidos con un único create_from_checador
+
+        Returns: {
+            "status": "success",
+            "count": 3, "created": 2, "errors": 1,
+            "data": [
+                {"index": 0, "status_code": 201, "status": "success", "id": 101, "checks_today": 1},
+                {"index": 1, "status_code": 404, "status": "error", "error": {"code": "EMPLOYEE_NOT_FOUND", "message": "..."}},
+                ...
+            ]
+        } """
+        if request.httprequest.method == 'OPTIONS':
+            return self._json_response({'status': 'ok'})
+
+        is_valid, result = self._validate_jwt_token()
+        if not is_valid:
+            return result
+
+        try:
+            data = json.loads(request.httprequest.data.decode('utf-8'))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return self._error_response('Body JSON inválido', status=400, error_code='INVALID_JSON')
+
+        items = data.get('attendances') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return self._error_response('Se requiere una lista de asistencias en "attendances"', status=400, error_code='MISSING_ATTENDANCES')
+        if len(items) > BATCH_MAX_ITEMS:
+            return self._error_response(f'Máximo {BATCH_MAX_ITEMS} asistencias por petición. Recibidas: {len(items)}', status=413,
+                error_code='BATCH_TOO_LARGE')
+
+        try:
+            env = request.env(user=SUPERUSER_ID)
+            tz_name = self._get_checador_tz()
+            results = [None] * len(items)
+
+            def item_error(index, status_code, error_code, message):
+                results[index] = {'index': index, 'status_code': status_code, 'status': 'error', 'error': {'code': error_code, 'message': message}}
+
+            # 1. Validación de formato por elemento (sin consultas)
+            parsed = []
+            for index, item in enumerate(items):
+                if not isinstance(item, dict):
+                    item_error(index, 400, 'INVALID_ITEM', 'Cada asistencia debe ser un objeto JSON')
+                    continue
+                if not item.get('registration_number'):
+                    item_error(index, 400, 'MISSING_REGISTRATION_NUMBER', 'Campo requerido: registration_number')
+                    continue
+                if not item.get('check_type'):
+                    item_error(index, 400, 'MISSING_CHECK_TYPE', 'Campo requerido: check_type')
+                    continue
+                if not item.get('check_date'):
+                    item_error(index, 400, 'MISSING_CHECK_DATE', 'Campo requerido: check_date')
+                    continue
+                if item.get('check_type') not in ['entrada', 'salida']:
+                    item_error(index, 400, 'INVALID_CHECK_TYPE', 'check_type debe ser "entrada" o "salida"')
+                    continue
+                try:
+                    check_datetime = self._parse_check_date(item['check_date'])
+                except (ValueError, TypeError, AttributeError):
+                    item_error(index, 400, 'INVALID_DATE_FORMAT',
+                        f'Formato de fecha inválido: {item["check_date"]}. Use formato ISO 8601 (YYYY-MM-DDTHH:MM:SS)')
+                    continue
+                parsed.append((index, item, str(item['registration_number']), check_datetime.date()))
+
+            # 2. Empleados del lote en una sola consulta
+            numbers = list({p[2] for p in parsed})
+            found_numbers = set()
+            if numbers:
+                found_numbers = set(env['hr.employee'].search([('registration_number', 'in', numbers)]).mapped('registration_number'))
+
+            # 3. Checks existentes por empleado/día LOCAL en una sola consulta agrupada
+            checks = env['ctrol.asistencias'].count_checks_by_local_day([(p[2], p[3]) for p in parsed if p[2] in found_numbers])
+
+            # 4. Regla de máximo por día aplicada en memoria, en el orden recibido
+            to_create = []
+            for index, item, number, local_day in parsed:
+                if number not in found_numbers:
+                    item_error(index, 404, 'EMPLOYEE_NOT_FOUND', f'Empleado con número {number} no encontrado')
+                    continue
+                key = (number, local_day)
+                checks_today = checks.get(key, 0)
+                if checks_today >= MAX_CHECKS_PER_DAY:
+                    item_error(index, 400, 'MAX_CHECKS_EXCEEDED',
+                        f'El empleado {number} ya tiene {checks_today} registros para el día {local_day} (TZ: {tz_name}). Máximo permitido: {MAX_CHECKS_PER_DAY}')
+                    continue
+                checks[key] = checks_today + 1
+                # Solo los campos aceptados por el alta individual; cualquier otra llave del cliente se descarta
+                vals = {field: item[field] for field in ATTENDANCE_FIELDS if field in item}
+                vals.update(registration_number=number, status='success', observaciones='')
+                to_create.append((index, checks[key], vals))
+
+            # 5. Alta de todos los registros válidos en un solo create
+            if to_create:
+                records = env['ctrol.asistencias'].create_from_checador([vals for _i, _c, vals in to_create])
+                for (index, checks_today, _vals), record in zip(to_create, records):
+                    results[index] = {'index': index, 'status_code': 201, 'status': 'success', 'id': record.id, 'checks_today': checks_today}
+
+            created = len(to_create)
+            _logger.info(f"API Checadores: Lote de asistencias - Recibidas: {len(items)}, Creadas: {created}, "
+                f"Errores: {len(items) - created}, Usuario JWT: {result.get('username')}")
+
+            return self._json_response({'status': 'success', 'timestamp': datetime.now().isoformat(), 'count': len(items), 'created': created,
+                'errors': len(items) - created, 'data': results})
+        except Exception as e:
+            _logger.error(f"API Checadores Error (attendance_create_batch): {str(e)}", exc_info=True)
+            return self._error_response('Error interno del servidor', status=500, error_code='INTERNAL_ERROR')
+
+
+    def _attendance_filters_domain(self, filters):
+        # Filtros comunes de /api/v1/attendances y /api/v1/attendances/export
+        domain = []
+        # Filtrar por registration_number (v2.4.0)
+        if filters.get('registration_number'):
+            domain.append(('registration_number', '=', filters['registration_number']))
+        # Mantener compatibilidad con employee_id (deprecated)
+        if filters.get('employee_id'):
+            domain.append(('employee_id', '=', int(filters['employee_id'])))
+        if filters.get('check_type'):
+            domain.append(('check_type', '=', filters['check_type']))
+        if filters.get('log_status'):
+            domain.append(('log_status', '=', filters['log_status']))
+        # Filtro por status de validación (T0049)
+        if filters.get('status'):
+            domain.append(('status', '=', filters['status']))
+        if filters.get('date_from'):
+            domain.append(('check_date', '>=', filters['date_from']))
+        if filters.get('date_to'):
+            domain.append(('check_date', '<=', filters['date_to']))
+        return domain
+
     @http.route('/api/v1/attendances', type='http', auth='none', methods=['GET'], csrf=False, cors='*')
     def attendance_list(self, **kw):
         """Obtiene lista de asistencias desde ctrol.asistencias con paginación.
@@ -591,24 +871,7 @@ class ApiChecadoresController(http.Controller):
                     pass
             
             # Construir dominio de búsqueda
-            domain = []
-            # Filtrar por registration_number (v2.4.0)
-            if filters.get('registration_number'):
-                domain.append(('registration_number', '=', filters['registration_number']))
-            # Mantener compatibilidad con employee_id (deprecated)
-            if filters.get('employee_id'):
-                domain.append(('employee_id', '=', int(filters['employee_id'])))
-            if filters.get('check_type'):
-                domain.append(('check_type', '=', filters['check_type']))
-            if filters.get('log_status'):
-                domain.append(('log_status', '=', filters['log_status']))
-            # Filtro por status de validación (T0049)
-            if filters.get('status'):
-                domain.append(('status', '=', filters['status']))
-            if filters.get('date_from'):
-                domain.append(('check_date', '>=', filters['date_from']))
-            if filters.get('date_to'):
-                domain.append(('check_date', '<=', filters['date_to']))
+            domain = self._attendance_filters_domain(filters)
             
             # Paginación - limit
             limit = int(filters.get('limit', 100))
@@ -644,38 +907,136 @@ class ApiChecadoresController(http.Controller):
             _logger.error(f"API Checadores Error (attendance_list): {str(e)}", exc_info=True)
             return self._error_response('Error interno del servidor', status=500, error_code='INTERNAL_ERROR')
 
+    @http.route('/api/v1/attendances/export', type='http', auth='none', methods=['GET'], csrf=False, cors='*')
+    def attendance_export(self, **kw):
+        """Exportación masiva de asistencias (ctrol.asistencias) en streaming, sin límite de filas ni de rango de fechas.
+        
+        Query Parameters (o body JSON, mismos filtros que /api/v1/attendances):
+            - format: ndjson (default, un objeto to_json por línea) o csv
+            - registration_number, check_type, log_status, status, date_from, date_to: filtros opcionales
+            - after_check_date / after_id: último registro recibido, para reanudar una exportación interrumpida
+            - limit: máximo de registros (opcional, sin tope)
+        
+        Los registros salen ordenados por (check_date, id) y se leen por bloques con cursor keyset en una
+        transacción propia, por lo que la memoria del servidor es constante. """
+        is_valid, result = self._validate_jwt_token()
+        if not is_valid:
+            return result
+        
+        filters = dict(kw)
+        if request.httprequest.data:
+            try:
+                filters.update(json.loads(request.httprequest.data.decode('utf-8')))
+            except ValueError:
+                return self._error_response('JSON inválido', status=400, error_code='INVALID_JSON')
+        
+        export_format = (filters.get('format') or 'ndjson').lower()
+        if export_format not in ('ndjson', 'csv'):
+            return self._error_response('format inválido. Use: ndjson, csv', status=400, error_code='INVALID_FORMAT')
+        try:
+            domain = self._attendance_filters_domain(filters)
+            limit = int(filters['limit']) if filters.get('limit') else None
+            after = None
+            if filters.get('after_id'):
+                if not filters.get('after_check_date'):
+                    return self._error_response('after_check_date es requerido con after_id', status=400, error_code='INVALID_CURSOR')
+                # check_date del último registro exportado (UTC, mismo formato que la exportación)
+                after = (self._parse_check_date(filters['after_check_date']), int(filters['after_id']))
+        except (TypeError, ValueError) as e:
+            return self._error_response(f'Parámetros inválidos: {e}', status=400, error_code='INVALID_PARAMS')
+        
+        dbname = request.env.cr.dbname
+        username = result.get('username')
+        remote_addr = request.httprequest.remote_addr
+        
+        def generate():
+            # El cursor de la petición se cierra al regresar del controlador: el streaming usa su propia transacción
+            total = 0
+            if export_format == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(EXPORT_FIELDS)
+                yield buffer.getvalue().encode('utf-8')
+            try:
+                with Registry(dbname).cursor() as cr:
+                    env = api.Environment(cr, SUPERUSER_ID, {})
+                    for chunk in env['ctrol.asistencias'].iter_export_chunks(domain, after=after, limit=limit):
+                        total += len(chunk)
+                        if export_format == 'csv':
+                            buffer.seek(0)
+                            buffer.truncate()
+                            writer.writerows([row[name] for name in EXPORT_FIELDS] for row in chunk)
+                            yield buffer.getvalue().encode('utf-8')
+                        else:
+                            yield ''.join(json.dumps(row, ensure_ascii=False, default=str) + '\n' for row in chunk).encode('utf-8')
+            except Exception as e:
+                # Los encabezados ya se enviaron: el cliente detecta el corte y reanuda con after_check_date/after_id
+                _logger.error(f"API Checadores Error (attendance_export): {str(e)}", exc_info=True)
+                return
+            _logger.info(f"API Checadores: Exportación de asistencias ({export_format}) - Registros: {total}, "
+                f"IP: {remote_addr}, Usuario JWT: {username}")
+        
+        mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+        filename = f"asistencias_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+        return Response(generate(), status=200, mimetype=mimetype, direct_passthrough=True,
+            headers=[('Content-Disposition', f'attachment; filename="{filename}"'), ('Access-Control-Allow-Origin', '*'), ('Cache-Control', 'no-store')])
+
     
+    def _encode_sync_cursor(self, state):
+        # Cursor opaco: estado de la paginación en base64 firmado con HMAC (clave JWT) para que el dispositivo no lo altere.
+        payload = base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode('utf-8')).decode('ascii').rstrip('=')
+        signature = hmac.new(self._get_jwt_secret().encode('utf-8'), payload.encode('ascii'), hashlib.sha256).hexdigest()[:32]
+        return f'{payload}.{signature}'
+
+    def _decode_sync_cursor(self, token):
+        try:
+            payload, signature = token.rsplit('.', 1)
+            expected = hmac.new(self._get_jwt_secret().encode('utf-8'), payload.encode('ascii'), hashlib.sha256).hexdigest()[:32]
+            if not hmac.compare_digest(signature, expected):
+                return None
+            return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)).decode('utf-8'))
+        except (ValueError, UnicodeError, TypeError):
+            return None
+
     @http.route('/api/v1/employees/sync', type='http', auth='none', methods=['GET', 'OPTIONS'], csrf=False, cors='*')
     def employees_sync(self, **kw):
-        """Sincronización incremental de empleados.
+        """Sincronización incremental de empleados con cursor.
         
-        Devuelve solo empleados modificados desde la última sincronización exitosa.
-        Registra cada sincronización en checador.sync.log para tracking.
+        Devuelve solo empleados modificados desde la última sincronización confirmada, paginados con un cursor
+        estable sobre (write_date, id) y acotados al instante en que inició la sincronización (current_sync).
+        Los empleados archivados o eliminados llegan en "deleted" como bajas explícitas.
+        La sincronización se registra en checador.sync.log solo al confirmar la última página en /api/v1/employees/sync/ack.
         
         Query Parameters:
             - device_id: Identificador del dispositivo (opcional, para tracking por dispositivo)
-            - limit: Límite de resultados (default 1000)
-            - offset: Desplazamiento para paginación
+            - limit: Límite de resultados por página (default 1000)
+            - cursor: next_cursor de la página anterior (omitir en la primera página)
+            - photo_mode: 'url' (default: photo_hash + photo_url), 'inline' (base64 en photo) o 'none'
+            - photo_size: 128, 256, 512, 1024 o 1920 para la URL de la foto
         
         Headers:
             Authorization: Bearer <token>
         
         Lógica:
             1. Busca última sincronización exitosa en checador.sync.log
-            2. Si no existe (primera vez), devuelve TODOS los empleados
-            3. Si existe, devuelve empleados con write_date > última_sync
-            4. Registra la sincronización actual en el log
+            2. Si no existe (o es anterior a la depuración de bajas), devuelve TODOS los empleados activos
+            3. Si existe, devuelve empleados con write_date > última_sync y las bajas posteriores
+            4. Mientras has_more sea true se pide la siguiente página con next_cursor
+            5. La última página trae ack_cursor; al confirmarlo se registra la sincronización
         
         Returns:
             {
                 "status": "success",
-                "sync_id": 45,
                 "last_sync": "2026-02-05T18:00:00",
                 "current_sync": "2026-02-06T10:00:00",
                 "is_first_sync": false,
                 "count": 3,
-                "total": 3,
-                "data": [...]} """
+                "total": 4,
+                "has_more": false,
+                "next_cursor": null,
+                "ack_cursor": "eyJk...",
+                "data": [...],
+                "deleted": [{"id": 12, "registration_number": "00012", "reason": "archived", "date": "..."}]} """
         if request.httprequest.method == 'OPTIONS':
             return self._json_response({'status': 'ok'})
         
@@ -688,60 +1049,97 @@ class ApiChecadoresController(http.Controller):
             # Obtener parámetros
             device_id = kw.get('device_id', '')
             limit = min(int(kw.get('limit', 1000)), 1000)
-            offset = int(kw.get('offset', 0))
-            
             if limit < 1:
                 limit = 1000
-            if offset < 0:
-                offset = 0
+            photo_mode, photo_size, error = self._get_photo_options(kw)
+            if error:
+                return error
             
             # Usar SUPERUSER_ID
             env = request.env(user=SUPERUSER_ID)
             SyncLog = env['checador.sync.log']
-            Employee = env['hr.employee']
+            Tombstone = env['checador.sync.tombstone']
+            Employee = env['hr.employee'].with_context(active_test=False)
             
-            # Obtener última sincronización exitosa
-            last_sync_date = SyncLog.get_last_successful_sync(sync_type='employees', device_id=device_id if device_id else None)
-            current_sync_date = datetime.now()
+            if kw.get('cursor'):
+                state = self._decode_sync_cursor(kw['cursor'])
+                if not state or state.get('d', '') != device_id or state.get('f'):
+                    return self._error_response('Cursor inválido para este dispositivo', status=400, error_code='INVALID_CURSOR')
+            else:
+                # Primera página: fija la referencia (última sync confirmada) y el corte del snapshot
+                last_sync_date = SyncLog.get_last_successful_sync(sync_type='employees', device_id=device_id if device_id else None)
+                if last_sync_date and last_sync_date < datetime.now() - timedelta(days=SYNC_TOMBSTONE_DAYS):
+                    # Las bajas más antiguas ya se depuraron: se fuerza carga completa
+                    last_sync_date = None
+                state = {'d': device_id, 's': last_sync_date and fields.Datetime.to_string(last_sync_date),
+                    'u': fields.Datetime.to_string(fields.Datetime.now()), 'p': 'emp', 'w': None, 'i': 0, 't': 0, 'n': 0}
+            
+            last_sync_date = fields.Datetime.to_datetime(state['s'])
+            current_sync_date = fields.Datetime.to_datetime(state['u'])
             is_first_sync = last_sync_date is None
             
-            # Construir dominio de búsqueda
+            # Condición de búsqueda (sin el cursor) acotada al corte del snapshot
             if is_first_sync:
                 # Primera sincronización: todos los empleados activos
-                domain = [('active', '=', True)]
-                _logger.info(f"API Sync: Primera sincronización para device_id={device_id or 'global'}")
+                where, params = "active = true AND write_date <= %s", [current_sync_date]
             else:
-                # Sincronización incremental: solo modificados desde última sync
-                # Incluye activos e inactivos (para detectar bajas)
-                domain = [('write_date', '>', last_sync_date)]
-                _logger.info(f"API Sync: Sincronización incremental desde {last_sync_date} para device_id={device_id or 'global'}")
+                # Sincronización incremental: solo modificados desde última sync, incluye archivados (bajas)
+                where, params = "write_date > %s AND write_date <= %s", [last_sync_date, current_sync_date]
+            tomb_domain = [] if is_first_sync else [('deleted_date', '>', last_sync_date), ('deleted_date', '<=', current_sync_date)]
             
-            total_count = Employee.search_count(domain)
-            employees = Employee.search(domain, limit=limit, offset=offset, order='write_date desc')
+            employees = Employee.browse()
+            if state['p'] == 'emp':
+                # Keyset sobre (write_date, id) en SQL: conserva los microsegundos de write_date que el ORM no expone
+                keyset, keyset_params = '', []
+                if state['w']:
+                    keyset, keyset_params = " AND (write_date, id) > (%s::timestamp, %s)", [state['w'], state['i']]
+                env.cr.execute(f"SELECT id, write_date FROM hr_employee WHERE {where}{keyset} ORDER BY write_date, id LIMIT %s",
+                    params + keyset_params + [limit])
+                rows = env.cr.fetchall()
+                employees = Employee.browse([row[0] for row in rows])
+                if rows:
+                    state.update({'w': rows[-1][1].isoformat(), 'i': rows[-1][0]})
+                if len(employees) < limit:
+                    state['p'] = 'del' if tomb_domain else 'end'
             
-            # Convertir a JSON con campo write_date adicional
+            tombstones = Tombstone.browse()
+            if state['p'] == 'del' and len(employees) < limit:
+                tombstones = Tombstone.search(tomb_domain + [('id', '>', state['t'])], limit=limit - len(employees), order='id asc')
+                if tombstones:
+                    state['t'] = tombstones[-1].id
+                if len(employees) + len(tombstones) < limit:
+                    state['p'] = 'end'
+            
+            # Convertir a JSON con campo write_date adicional; los archivados se envían como baja
+            active_employees = employees.filtered('active')
             employees_data = []
-            for emp in employees:
-                emp_data = emp.get_employee_data_for_api()
+            for emp, emp_data in zip(active_employees, active_employees.get_employees_data_for_api(photo_mode=photo_mode, photo_size=photo_size)):
                 emp_data['write_date'] = emp.write_date.isoformat() if emp.write_date else ''
                 emp_data['create_date'] = emp.create_date.isoformat() if emp.create_date else ''
                 employees_data.append(emp_data)
+            deleted_data = [{'id': emp.id, 'registration_number': emp.registration_number or '', 'reason': 'archived',
+                'date': emp.write_date.isoformat()} for emp in employees - active_employees]
+            deleted_data += [{'id': tomb.employee_id, 'registration_number': tomb.registration_number or '', 'reason': 'deleted',
+                'date': tomb.deleted_date.isoformat()} for tomb in tombstones]
             
-            # Registrar sincronización exitosa
-            sync_record = SyncLog.register_sync(sync_type='employees', device_id=device_id, records_count=len(employees_data), status='success',
-                ip_address=request.httprequest.remote_addr, user_jwt=result.get('username', ''), last_sync_ref=last_sync_date,
-                notes=f"Sincronización {'inicial' if is_first_sync else 'incremental'}. Total modificados: {total_count}")
+            state['n'] += len(employees_data) + len(deleted_data)
+            has_more = state['p'] != 'end'
+            if not has_more:
+                state['f'] = True
+            cursor = self._encode_sync_cursor(state)
+            env.cr.execute(f"SELECT count(*) FROM hr_employee WHERE {where}", params)
+            total_count = env.cr.fetchone()[0] + (Tombstone.search_count(tomb_domain) if tomb_domain else 0)
             
-            _logger.info(f"API Sync: Sincronización exitosa - "
-                        f"sync_id={sync_record.id}, "
+            _logger.info(f"API Sync: Página de sincronización {'inicial' if is_first_sync else 'incremental'} - "
                         f"device_id={device_id or 'global'}, "
-                        f"registros={len(employees_data)}/{total_count}, "
-                        f"primera_sync={is_first_sync}")
+                        f"registros={len(employees_data)}+{len(deleted_data)} bajas/{total_count}, "
+                        f"has_more={has_more}")
             
-            return self._json_response({'status': 'success', 'timestamp': current_sync_date.isoformat(), 'sync_id': sync_record.id, 
+            return self._json_response({'status': 'success', 'timestamp': datetime.now().isoformat(),
                 'last_sync': last_sync_date.isoformat() if last_sync_date else None, 'current_sync': current_sync_date.isoformat(),
-                'is_first_sync': is_first_sync, 'count': len(employees_data), 'total': total_count, 'limit': limit, 'offset': offset,
-                'device_id': device_id or None, 'data': employees_data})
+                'is_first_sync': is_first_sync, 'count': len(employees_data) + len(deleted_data), 'total': total_count, 'limit': limit,
+                'has_more': has_more, 'next_cursor': cursor if has_more else None, 'ack_cursor': None if has_more else cursor,
+                'device_id': device_id or None, 'data': employees_data, 'deleted': deleted_data})
             
         except Exception as e:
             _logger.error(f"API Checadores Error (employees_sync): {str(e)}", exc_info=True)
@@ -755,3 +1153,51 @@ class ApiChecadoresController(http.Controller):
                 pass  # Si falla el log de error, no interrumpir
             
             return self._error_response('Error interno del servidor', status=500, error_code='INTERNAL_ERROR')
+
+
+    @http.route('/api/v1/employees/sync/ack', type='http', auth='none', methods=['POST', 'OPTIONS'], csrf=False, cors='*')
+    def employees_sync_ack(self, **kw):
+        """Confirma una sincronización de empleados completa.
+        
+        Body (JSON o form): {"cursor": "<ack_cursor de la última página>", "device_id": "..."}
+        
+        Registra la sincronización exitosa con fecha igual al corte del snapshot (current_sync), de modo que
+        los cambios hechos mientras el dispositivo paginaba llegan en la siguiente sincronización. """
+        if request.httprequest.method == 'OPTIONS':
+            return self._json_response({'status': 'ok'})
+        
+        is_valid, result = self._validate_jwt_token()
+        if not is_valid:
+            return result
+        
+        try:
+            data = dict(kw)
+            if request.httprequest.data:
+                try:
+                    data.update(json.loads(request.httprequest.data.decode('utf-8')))
+                except ValueError:
+                    return self._error_response('JSON inválido', status=400, error_code='INVALID_JSON')
+            device_id = data.get('device_id', '') or ''
+            state = self._decode_sync_cursor(data.get('cursor') or '')
+            if not state or not state.get('f') or state.get('d', '') != device_id:
+                return self._error_response('Cursor de confirmación inválido para este dispositivo', status=400, error_code='INVALID_CURSOR')
+            
+            env = request.env(user=SUPERUSER_ID)
+            SyncLog = env['checador.sync.log']
+            current_sync_date = fields.Datetime.to_datetime(state['u'])
+            last_sync_date = fields.Datetime.to_datetime(state['s'])
+            # Confirmación repetida del mismo cursor: se devuelve el registro existente
+            sync_record = SyncLog.search([('sync_type', '=', 'employees'), ('status', '=', 'success'), ('device_id', '=', device_id),
+                ('sync_date', '=', current_sync_date)], limit=1)
+            if not sync_record:
+                sync_record = SyncLog.register_sync(sync_type='employees', device_id=device_id, records_count=state['n'], status='success',
+                    ip_address=request.httprequest.remote_addr, user_jwt=result.get('username', ''), last_sync_ref=last_sync_date,
+                    notes=f"Sincronización {'inicial' if last_sync_date is None else 'incremental'} confirmada. Registros: {state['n']}",
+                    sync_date=current_sync_date)
+            
+            _logger.info(f"API Sync: Sincronización confirmada - sync_id={sync_record.id}, device_id={device_id or 'global'}, registros={state['n']}")
+            return self._json_response({'status': 'success', 'timestamp': datetime.now().isoformat(), 'sync_id': sync_record.id,
+                'current_sync': current_sync_date.isoformat(), 'count': state['n'], 'device_id': device_id or None})
+        except Exception as e:
+            _logger.error(f"API Checadores Error (employees_sync_ack): {str(e)}", exc_info=True)
+            return self._error_response('Error interno del servidor', status=500, error_code='INTERNAL_ERROR')
@@ -1,7 +1,11 @@
 from . import hr_employee
+from . import hr_employee_payroll_scope
 from . import hr_catalogs
 from . import res_config_settings
 from . import ctrol_asistencias
+from . import ctrol_asistencias_run
 from . import crm_models
 from . import checador_sync_log
 from . import hr_attendance_extra
+from . import reporte_asistencias
+from . import reporte_asistencias_job
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import uuid
+
+# Caché local al proceso para la API de checadores (configuración, clave JWT, zona horaria y tokens ya verificados).
+# Cada worker de Odoo tiene su propia copia; para que un cambio hecho en un worker llegue a los demás se publica una
+# versión en ir.config_parameter (api_checadores.cache_version). get_param está en el ormcache del registro, por lo que
+# leer la versión en cada petición no cuesta SQL y set_param notifica el cambio a todos los workers.
+
+CACHE_VERSION_PARAM = 'api_checadores.cache_version'
+DEFAULT_TTL = 300          # segundos para configuración, clave y zona horaria
+TOKEN_TTL = 60             # segundos máximos que se reutiliza un token ya verificado
+MAX_TOKENS = 2000          # tope de tokens en memoria por proceso
+
+
+class ChecadorApiCache(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._versions = {}
+
+    def sync_version(self, env):
+        # Descarta las entradas de la base de datos si otro proceso publicó una versión nueva.
+        dbname = env.cr.dbname
+        version = env['ir.config_parameter'].sudo().get_param(CACHE_VERSION_PARAM, '')
+        if self._versions.get(dbname) != version:
+            with self._lock:
+                self._entries = {k: v for k, v in self._entries.items() if k[0] != dbname}
+                self._versions[dbname] = version
+
+    def get(self, env, key, loader, ttl=DEFAULT_TTL):
+        full_key = (env.cr.dbname, key)
+        entry = self._entries.get(full_key)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            return entry[1]
+        value = loader()
+        with self._lock:
+            self._entries[full_key] = (now + ttl, value)
+        return value
+
+    def get_versioned(self, env, key, version, loader, ttl=DEFAULT_TTL):
+        # Igual que get, pero la entrada se reconstruye también cuando cambia la versión de los datos de origen.
+        full_key = (env.cr.dbname, key)
+        entry = self._entries.get(full_key)
+        now = time.monotonic()
+        if entry and entry[0] > now and entry[1][0] == version:
+            return entry[1][1]
+        value = loader()
+        with self._lock:
+            self._entries[full_key] = (now + ttl, (version, value))
+        return value
+
+    def get_token(self, env, token):
+        entry = self._entries.get((env.cr.dbname, 'token', token))
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def set_token(self, env, token, payload, expires_at):
+        # El token se conserva como máximo TOKEN_TTL segundos y nunca más allá de su expiración.
+        ttl = min(TOKEN_TTL, expires_at - time.time())
+        if ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens = [k for k in self._entries if len(k) == 3 and k[1] == 'token']
+            if len(tokens) >= MAX_TOKENS:
+                # Primero se descartan los vencidos; si aún se excede el tope se vacían todos los tokens
+                expired = [k for k in tokens if self._entries[k][0] <= now]
+                for k in (expired if len(tokens) - len(expired) < MAX_TOKENS else tokens):
+                    del self._entries[k]
+            self._entries[(env.cr.dbname, 'token', token)] = (now + ttl, payload)
+
+    def invalidate(self, env):
+        # Limpia la caché de este proceso y publica una versión nueva para los demás workers.
+        dbname = env.cr.dbname
+        with self._lock:
+            self._entries = {k: v for k, v in self._entries.items() if k[0] != dbname}
+        version = uuid.uuid4().hex
+        env['ir.config_parameter'].sudo().set_param(CACHE_VERSION_PARAM, version)
+        self._versions[dbname] = version
+
+
+checador_api_cache = ChecadorApiCache()
@@ -49,9 +49,9 @@ class ChecadorSyncLog(models.Model):
 
     @api.model
     def register_sync(self, sync_type='employees', device_id=None, records_count=0, status='success', ip_address=None, user_jwt=None, last_sync_ref=None, 
-        notes=None):
-        # Registra una nueva sincronización.
-        return self.create({'sync_date': fields.Datetime.now(), 'sync_type': sync_type, 'device_id': device_id or '', 'records_synced': records_count,
+        notes=None, sync_date=None):
+        # Registra una nueva sincronización. sync_date permite fijar el corte del snapshot (sync por cursor).
+        return self.create({'sync_date': sync_date or fields.Datetime.now(), 'sync_type': sync_type, 'device_id': device_id or '', 'records_synced': records_count,
             'status': status, 'ip_address': ip_address or '', 'user_jwt': user_jwt or '', 'last_sync_reference': last_sync_ref, 'notes': notes or '',})
 
     @api.model
@@ -62,4 +62,24 @@ class ChecadorSyncLog(models.Model):
         old_logs = self.search([('sync_date', '<', cutoff_date)])
         count = len(old_logs)
         old_logs.unlink()
+        self.env['checador.sync.tombstone'].sudo().search([('deleted_date', '<', cutoff_date)]).unlink()
         return count
+
+
+class ChecadorSyncTombstone(models.Model):
+    _name = 'checador.sync.tombstone'
+    _description = 'Empleados Eliminados para Sincronización de Checadores'
+    _order = 'id'
+    _rec_name = 'registration_number'
+
+    # Un empleado eliminado ya no tiene write_date: se conserva aquí para que la sync incremental lo envíe como baja.
+    # Se depuran junto con los logs (cleanup_old_logs); un dispositivo con sync más antigua que el depurado recibe carga completa.
+    employee_id = fields.Integer(string='ID Empleado', required=True)
+    registration_number = fields.Char(string='No. Empleado')
+    name = fields.Char(string='Nombre')
+    deleted_date = fields.Datetime(string='Fecha de Eliminación', required=True, default=fields.Datetime.now, index=True)
+
+    @api.model
+    def register_deleted(self, employees):
+        return self.create([{'employee_id': emp.id, 'registration_number': emp.registration_number or '', 'name': emp.name or ''}
+            for emp in employees])
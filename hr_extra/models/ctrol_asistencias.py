@@ -1,12 +1,25 @@
 # -*- coding: utf-8 -*-
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError
+from odoo.tools import SQL, column_exists, create_column, create_index, table_exists
+import json
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
 import pytz
+from .checador_api_cache import checador_api_cache
 
 _logger = logging.getLogger(__name__)
 
+CHUNK_SIZE = 500   # Registros pendientes reservados por bloque en process_pending_logs
+CLAIM_RETRIES = 3   # Rondas de reintento de empleados diferidos por estar parcialmente bloqueados por otro worker
+CLAIM_RETRY_DELAY = 1   # Segundos de espera antes de cada ronda de reintento
+EXPORT_CHUNK_SIZE = 2000   # Filas por lectura en la exportación por cursor (/api/v1/attendances/export)
+EXPORT_FIELDS = ['id', 'employee_id', 'registration_number', 'employee_name', 'check_type', 'photo_url', 'latitude', 'longitude', 'check_date',
+    'log_status', 'status', 'observaciones', 'lateness_time', 'left_early_time', 'is_active', 'createdAt', 'updatedAt', 'verification_status',
+    'match_percentage', 'log_message', 'attendance_id', 'sigob_log_folio', 'user_valid_id', 'date_validated']
+
 
 class CtrolAsistencias(models.Model):
     _name = 'ctrol.asistencias'
@@ -29,6 +42,8 @@ class CtrolAsistencias(models.Model):
     check_date = fields.Datetime(string='Fecha de Registro', required=True, help='Fecha y hora del registro (UTC)')
     check_date_local = fields.Char(string='Hora Local Checador', readonly=True,
         help='Hora original enviada por el checador en su zona horaria local (solo auditoría)')
+    # Día LOCAL materializado para validar el máximo de checadas por día con el índice (registration_number, check_day_local)
+    check_day_local = fields.Date(string='Día Local', compute='_compute_check_day_local', store=True, readonly=True)
     log_status = fields.Selection([('pendiente', 'Pendiente'), ('error', 'Error'), ('importada', 'Importada'), ('fallido', 'Fallido')], 
         string='Estado', default='pendiente', required=True)
     lateness_time = fields.Char(string='Tiempo de Retraso', help='Formato HH:MM - Ejemplo: 07:15')
@@ -54,6 +69,45 @@ class CtrolAsistencias(models.Model):
     emp_snapshot = fields.Text(string='Snapshot empleado', readonly=True,
         help='Foto interna de datos del empleado para detectar cambios entre checadas')
 
+    def _auto_init(self):
+        # La columna se crea y rellena por SQL antes del ORM para no recalcular toda la tabla registro por registro
+        cr = self.env.cr
+        if table_exists(cr, self._table) and not column_exists(cr, self._table, 'check_day_local'):
+            create_column(cr, self._table, 'check_day_local', 'date')
+            cr.execute(r"""UPDATE ctrol_asistencias SET check_day_local = left(check_date_local, 10)::date
+                WHERE check_date_local ~ '^\d{4}-\d{2}-\d{2}'""")
+            cr.execute("""UPDATE ctrol_asistencias SET check_day_local = ((check_date AT TIME ZONE 'UTC') AT TIME ZONE %s)::date
+                WHERE check_day_local IS NULL AND check_date IS NOT NULL""", (self._get_checador_tz(),))
+        res = super(CtrolAsistencias, self)._auto_init()
+        create_index(cr, 'ctrol_asistencias_registration_day_idx', self._table, ['registration_number', 'check_day_local'])
+        return res
+
+    @api.depends('check_date_local', 'check_date')
+    def _compute_check_day_local(self):
+        tz = None
+        for record in self:
+            if record.check_date_local:
+                record.check_day_local = fields.Date.to_date(record.check_date_local[:10])
+            elif record.check_date:
+                tz = tz or pytz.timezone(self._get_checador_tz())
+                record.check_day_local = pytz.utc.localize(record.check_date).astimezone(tz).date()
+            else:
+                record.check_day_local = False
+
+    @api.model
+    def count_checks_by_local_day(self, keys):
+        """ Checadas existentes por (registration_number, día local) en una sola consulta sobre el índice compuesto.
+        Al contar filas reales, el resultado es correcto tras eliminar registros o reenviarlos a pendiente. """
+        keys = list(set(keys))
+        if not keys:
+            return {}
+        self.flush_model(['registration_number', 'check_day_local'])
+        self.env.cr.execute("""SELECT a.registration_number, a.check_day_local, COUNT(*) FROM ctrol_asistencias a
+            JOIN unnest(%s::varchar[], %s::date[]) AS k(registration_number, dia)
+                ON a.registration_number = k.registration_number AND a.check_day_local = k.dia
+            GROUP BY 1, 2""", ([k[0] for k in keys], [k[1] for k in keys]))
+        return {(row[0], row[1]): row[2] for row in self.env.cr.fetchall()}
+
     def _compute_is_system_user(self):
         is_admin = (self.env.user.has_group('base.group_system') or self.env.user.has_group('base.group_erp_manager'))
         for record in self:
@@ -61,12 +115,19 @@ class CtrolAsistencias(models.Model):
 
     @api.depends('registration_number', 'employee_id')
     def _compute_employee_name(self):
+        # Se resuelven todos los empleados del lote en una sola lectura (altas masivas desde el checador).
+        Employee = self.env['hr.employee'].sudo()
+        numbers = list({r.registration_number for r in self if r.registration_number})
+        by_number = {}
+        if numbers:
+            for emp in Employee.search([('registration_number', 'in', numbers)]):
+                by_number.setdefault(emp.registration_number, emp)
+        ids = list({r.employee_id for r in self if r.employee_id and r.registration_number not in by_number})
+        by_id = {emp.id: emp for emp in Employee.search([('id', 'in', ids)])} if ids else {}
         for record in self:
-            employee = False
-            if record.registration_number:
-                employee = self.env['hr.employee'].sudo().search([('registration_number', '=', record.registration_number)], limit=1)
+            employee = by_number.get(record.registration_number) if record.registration_number else False
             if not employee and record.employee_id:
-                employee = self.env['hr.employee'].sudo().search([('id', '=', record.employee_id)], limit=1)
+                employee = by_id.get(record.employee_id)
             if employee:
                 record.employee_name = employee.name
                 if not record.employee_id:
@@ -124,6 +185,65 @@ class CtrolAsistencias(models.Model):
             'sigob_log_folio': self.sigob_log_folio or '',
             'user_valid_id': self.user_valid_id or 0,
             'date_validated': self.date_validated.strftime('%Y-%m-%d %H:%M:%S') if self.date_validated else ''}
+
+    @api.model
+    def _export_row_to_json(self, row):
+        # Mismo formato que to_json a partir de la fila SQL (sin instanciar registros)
+        def fmt(value, pattern='%Y-%m-%d %H:%M:%S'):
+            return value.strftime(pattern) if value else ''
+        return {
+            'id': row['id'],
+            'employee_id': row['employee_id'] or 0,
+            'registration_number': row['registration_number'] or '',
+            'employee_name': row['employee_name'] or False,
+            'check_type': row['check_type'] or False,
+            'photo_url': row['photo_url'] or '',
+            'latitude': row['latitude'] or 0.0,
+            'longitude': row['longitude'] or 0.0,
+            'check_date': fmt(row['check_date']),
+            'log_status': row['log_status'] or False,
+            'status': row['status'] or False,
+            'observaciones': row['observaciones'] or '',
+            'lateness_time': row['lateness_time'] or '',
+            'left_early_time': row['left_early_time'] or '',
+            'is_active': bool(row['is_active']),
+            'createdAt': fmt(row['createdAt'], '%Y/%m/%d %H:%M:%S'),
+            'updatedAt': fmt(row['updatedAt'], '%Y/%m/%d %H:%M:%S'),
+            'verification_status': row['verification_status'] or '',
+            'match_percentage': row['match_percentage'] or 0,
+            'log_message': row['log_message'] or '',
+            'attendance_id': row['attendance_id'] or None,
+            'sigob_log_folio': row['sigob_log_folio'] or '',
+            'user_valid_id': row['user_valid_id'] or 0,
+            'date_validated': fmt(row['date_validated'])}
+
+    @api.model
+    def iter_export_chunks(self, domain, after=None, limit=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """ Recorre los registros del dominio en orden (check_date, id) por bloques de chunk_size con cursor keyset.
+
+        after: (check_date, id) del último registro ya recibido para reanudar la exportación.
+        limit: máximo total de registros (None = sin límite).
+        Cada bloque es una lista de dicts con el formato de to_json; la memoria no crece con el rango de fechas. """
+        table = self._table
+        columns = [SQL.identifier(table, name) for name in EXPORT_FIELDS]
+        sent = 0
+        while limit is None or sent < limit:
+            keyset = []
+            if after:
+                keyset = ['|', ('check_date', '>', after[0]), '&', ('check_date', '=', after[0]), ('id', '>', after[1])]
+            size = chunk_size if limit is None else min(chunk_size, limit - sent)
+            query = self._search(domain + keyset, limit=size, order='check_date, id')
+            self.env.cr.execute(query.select(*columns))
+            rows = self.env.cr.fetchall()
+            if not rows:
+                break
+            chunk = [self._export_row_to_json(dict(zip(EXPORT_FIELDS, row))) for row in rows]
+            last = rows[-1]
+            after = (last[EXPORT_FIELDS.index('check_date')], last[0])
+            sent += len(rows)
+            yield chunk
+            if len(rows) < size:
+                break
     
     @api.model
     def _local_to_utc(self, local_dt, tz_name):
@@ -138,7 +258,11 @@ class CtrolAsistencias(models.Model):
 
     @api.model
     def _get_checador_tz(self):
-        # Obtiene la zona horaria configurada para el usuario api_checadores.
+        # Obtiene la zona horaria configurada para el usuario api_checadores (caché local al proceso).
+        return checador_api_cache.get(self.env, 'checador_tz', self._compute_checador_tz)
+
+    @api.model
+    def _compute_checador_tz(self):
         ICP = self.env['ir.config_parameter'].sudo()
         username = ICP.get_param('api_checadores.username', '')
         if username:
@@ -153,40 +277,51 @@ class CtrolAsistencias(models.Model):
 
     @api.model
     def create_from_checador(self, vals):
-        """Crea un registro desde el checador validando datos.
+        """Crea uno o varios registros desde el checador validando datos.
+        Acepta un dict o una lista de dicts (alta masiva desde /api/v1/attendances/batch); en ambos casos
+        los empleados y la zona horaria se resuelven una sola vez y se hace un único create.
         Convierte la hora local del checador a UTC para almacenamiento correcto en Odoo.
         Preserva la hora original en check_date_local para auditoría."""
-        if vals.get('registration_number') and not vals.get('employee_id'):
-            employee = self.env['hr.employee'].sudo().search([('registration_number', '=', vals['registration_number'])], limit=1)
-            if employee:
-                vals['employee_id'] = employee.id
-        
-        # Parsear check_date como hora LOCAL del checador
-        raw_date = vals.get('check_date', '')
-        if raw_date:
-            date_str = str(raw_date).replace('T', ' ').replace('Z', '')
-            if '.' in date_str:
-                date_str = date_str.split('.')[0]
-            try:
-                local_dt = datetime.strptime(date_str.strip(), '%Y-%m-%d %H:%M:%S')
-            except ValueError:
-                local_dt = datetime.strptime(date_str.strip(), '%Y-%m-%d %H:%M')
-            
-            # Guardar la hora original del checador para auditoría
-            vals['check_date_local'] = local_dt.strftime('%Y-%m-%d %H:%M:%S')
-            # Convertir hora local → UTC para almacenamiento en Odoo
-            tz_name = self._get_checador_tz()
-            utc_dt = self._local_to_utc(local_dt, tz_name)
-            vals['check_date'] = utc_dt.strftime('%Y-%m-%d %H:%M:%S')
-            _logger.info(f"Checador TZ={tz_name} | Local={local_dt} → UTC={utc_dt}")
-        
-        record = self.create(vals)
-        _logger.info(f"Asistencia creada en ctrol.asistencias - ID: {record.id}, "
-                    f"Registration#: {vals.get('registration_number')}, "
-                    f"Tipo: {vals.get('check_type')}, Check_date_local: {vals.get('check_date_local')}, "
-                    f"Check_date_utc: {vals.get('check_date')}, "
-                    f"Status: {vals.get('status', 'success')}")
-        return record
+        vals_list = vals if isinstance(vals, list) else [vals]
+        numbers = list({v['registration_number'] for v in vals_list if v.get('registration_number') and not v.get('employee_id')})
+        employee_map = {}
+        if numbers:
+            for emp in self.env['hr.employee'].sudo().search([('registration_number', 'in', numbers)]):
+                employee_map.setdefault(emp.registration_number, emp.id)
+
+        tz_name = None
+        for item in vals_list:
+            if item.get('registration_number') and not item.get('employee_id') and item['registration_number'] in employee_map:
+                item['employee_id'] = employee_map[item['registration_number']]
+
+            # Parsear check_date como hora LOCAL del checador
+            raw_date = item.get('check_date', '')
+            if raw_date:
+                date_str = str(raw_date).replace('T', ' ').replace('Z', '')
+                if '.' in date_str:
+                    date_str = date_str.split('.')[0]
+                try:
+                    local_dt = datetime.strptime(date_str.strip(), '%Y-%m-%d %H:%M:%S')
+                except ValueError:
+                    local_dt = datetime.strptime(date_str.strip(), '%Y-%m-%d %H:%M')
+
+                # Guardar la hora original del checador para auditoría
+                item['check_date_local'] = local_dt.strftime('%Y-%m-%d %H:%M:%S')
+                # Convertir hora local → UTC para almacenamiento en Odoo
+                if tz_name is None:
+                    tz_name = self._get_checador_tz()
+                utc_dt = self._local_to_utc(local_dt, tz_name)
+                item['check_date'] = utc_dt.strftime('%Y-%m-%d %H:%M:%S')
+                _logger.debug(f"Checador TZ={tz_name} | Local={local_dt} → UTC={utc_dt}")
+
+        records = self.create(vals_list)
+        for record, item in zip(records, vals_list):
+            _logger.info(f"Asistencia creada en ctrol.asistencias - ID: {record.id}, "
+                        f"Registration#: {item.get('registration_number')}, "
+                        f"Tipo: {item.get('check_type')}, Check_date_local: {item.get('check_date_local')}, "
+                        f"Check_date_utc: {item.get('check_date')}, "
+                        f"Status: {item.get('status', 'success')}")
+        return records
     
 
     @staticmethod
@@ -262,6 +397,44 @@ class CtrolAsistencias(models.Model):
                 'type': 'success',
                 'sticky': False,},}
     
+    def _get_prev_snapshot(self):
+        # Último snapshot registrado para el mismo número de empleado (excluye el registro actual).
+        self.ensure_one()
+        prev_rec = self.sudo().search([('registration_number', '=', self.registration_number), ('id', '!=', self.id), ('emp_snapshot', '!=', False)],
+            order='check_date desc', limit=1)
+        return prev_rec.emp_snapshot if prev_rec else False
+
+    def _get_snapshot_log_vals(self, employee, proj_name, wage_val, prev_snapshot):
+        """Valores de auditoría (project_checador, emp_snapshot, obra_audit_log) comparando los datos actuales
+        del empleado contra el snapshot de su checada anterior."""
+        self.ensure_one()
+        snap = {
+            'Nombre': employee.name or '',
+            'Obra': proj_name or '',
+            'Salario': ('%.2f' % wage_val) if wage_val is not None else '',
+            'Departamento': employee.department_id.name if employee.department_id else '',
+            'Puesto': employee.job_id.name if employee.job_id else '',
+            'Contrato': employee.contract_id.name if employee.contract_id else '',
+        }
+        cambios = []
+        if prev_snapshot:
+            try:
+                prev_snap = json.loads(prev_snapshot)
+            except Exception:
+                prev_snap = {}
+            for k, v in snap.items():
+                old = prev_snap.get(k, '')
+                if old != v:
+                    cambios.append('%s: %s -> %s' % (k, old or '(vacio)', v or '(vacio)'))
+        log_vals = {'project_checador': proj_name, 'emp_snapshot': json.dumps(snap)}
+        if cambios:
+            ts = fields.Datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            usr = self.env.user.name
+            lineas = ['[%s] %s: %s' % (ts, usr, c) for c in cambios]
+            prev_log = self.obra_audit_log or ''
+            log_vals['obra_audit_log'] = chr(10).join(lineas) + chr(10) + prev_log
+        return log_vals
+    
     def _map_to_attendance(self):
         """Mapea el registro a hr.attendance usando zona horaria local del checador.
 
@@ -347,39 +520,7 @@ class CtrolAsistencias(models.Model):
                 attendance = AttendanceModel.create({'employee_id':employee.id, 'check_in':check_date_utc, 'in_latitude':self.latitude or 0.0,
                     'in_longitude':self.longitude or 0.0, 'project_id':rows[0][0], 'hourly_wage':rows[0][1],})
                 proj_name = self.env['project.project'].browse(rows[0][0]).name
-                wage_val = rows[0][1]
-                snap = {
-                    'Nombre': employee.name or '',
-                    'Obra': proj_name or '',
-                    'Salario': ('%.2f' % wage_val) if wage_val is not None else '',
-                    'Departamento': employee.department_id.name if employee.department_id else '',
-                    'Puesto': employee.job_id.name if employee.job_id else '',
-                    'Contrato': employee.contract_id.name if employee.contract_id else '',
-                }
-                import json as _json
-                prev_rec = self.sudo().search([
-                    ('registration_number', '=', self.registration_number),
-                    ('id', '!=', self.id),
-                    ('emp_snapshot', '!=', False),
-                ], order='check_date desc', limit=1)
-                cambios = []
-                if prev_rec and prev_rec.emp_snapshot:
-                    try:
-                        prev_snap = _json.loads(prev_rec.emp_snapshot)
-                    except Exception:
-                        prev_snap = {}
-                    for k, v in snap.items():
-                        old = prev_snap.get(k, '')
-                        if old != v:
-                            cambios.append('%s: %s -> %s' % (k, old or '(vacio)', v or '(vacio)'))
-                log_vals = {'project_checador': proj_name, 'emp_snapshot': _json.dumps(snap)}
-                if cambios:
-                    ts = fields.Datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    usr = self.env.user.name
-                    lineas = ['[%s] %s: %s' % (ts, usr, c) for c in cambios]
-                    prev_log = self.obra_audit_log or ''
-                    log_vals['obra_audit_log'] = chr(10).join(lineas) + chr(10) + prev_log
-                self.sudo().write(log_vals)
+                self.sudo().write(self._get_snapshot_log_vals(employee, proj_name, rows[0][1], self._get_prev_snapshot()))
                 auto_msg = f' (se cerraron {auto_closed} entrada(s) previa(s) sin salida)' if auto_closed else ''
                 return (attendance, f'Entrada registrada | Attendance ID: {attendance.id} | Check-in local: {local_dt}{auto_msg}')
             except Exception as e:
@@ -408,39 +549,7 @@ class CtrolAsistencias(models.Model):
                 open_attendance.write({'check_out': check_date_utc, 'out_latitude': self.latitude or 0.0, 'out_longitude': self.longitude or 0.0,})
                 worked_hours = open_attendance.worked_hours
                 proj_name = open_attendance.project_id.name if open_attendance.project_id else ''
-                wage_val = open_attendance.hourly_wage
-                snap = {
-                    'Nombre': employee.name or '',
-                    'Obra': proj_name or '',
-                    'Salario': ('%.2f' % wage_val) if wage_val is not None else '',
-                    'Departamento': employee.department_id.name if employee.department_id else '',
-                    'Puesto': employee.job_id.name if employee.job_id else '',
-                    'Contrato': employee.contract_id.name if employee.contract_id else '',
-                }
-                import json as _json
-                prev_rec = self.sudo().search([
-                    ('registration_number', '=', self.registration_number),
-                    ('id', '!=', self.id),
-                    ('emp_snapshot', '!=', False),
-                ], order='check_date desc', limit=1)
-                cambios = []
-                if prev_rec and prev_rec.emp_snapshot:
-                    try:
-                        prev_snap = _json.loads(prev_rec.emp_snapshot)
-                    except Exception:
-                        prev_snap = {}
-                    for k, v in snap.items():
-                        old_v = prev_snap.get(k, '')
-                        if old_v != v:
-                            cambios.append('%s: %s -> %s' % (k, old_v or '(vacio)', v or '(vacio)'))
-                log_vals = {'project_checador': proj_name, 'emp_snapshot': _json.dumps(snap)}
-                if cambios:
-                    ts = fields.Datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    usr = self.env.user.name
-                    lineas = ['[%s] %s: %s' % (ts, usr, c) for c in cambios]
-                    prev_log = self.obra_audit_log or ''
-                    log_vals['obra_audit_log'] = chr(10).join(lineas) + chr(10) + prev_log
-                self.sudo().write(log_vals)
+                self.sudo().write(self._get_snapshot_log_vals(employee, proj_name, open_attendance.hourly_wage, self._get_prev_snapshot()))
                 return (open_attendance, f'Salida registrada | Attendance ID: {open_attendance.id} | Horas trabajadas: {worked_hours:.2f}')
             except Exception as e:
                 return (False, f'Error al registrar salida | Error: {str(e)}')
@@ -489,60 +598,391 @@ class CtrolAsistencias(models.Model):
         return (False, 'Sin horas extra ni salida anticipada que registrar')
 
     
+    @staticmethod
+    def _local_day_utc_range(tz, current_date):
+        # Rango UTC (naive) del día laboral LOCAL; sin zona horaria válida se usa el día naive.
+        day_start = datetime.combine(current_date, datetime.min.time())
+        day_end = datetime.combine(current_date, datetime.max.time().replace(microsecond=0))
+        if tz:
+            try:
+                return (tz.localize(day_start).astimezone(pytz.utc).replace(tzinfo=None),
+                    tz.localize(day_end).astimezone(pytz.utc).replace(tzinfo=None))
+            except Exception:
+                pass
+        return day_start, day_end
+
+    def _get_local_check_datetime(self, tz):
+        # Hora local del checador: check_date_local si existe, si no check_date (UTC) convertido a la zona del checador.
+        self.ensure_one()
+        if self.check_date_local:
+            try:
+                return datetime.strptime(self.check_date_local, '%Y-%m-%d %H:%M:%S')
+            except (ValueError, TypeError):
+                return self.check_date
+        try:
+            return pytz.utc.localize(self.check_date).astimezone(tz).replace(tzinfo=None)
+        except Exception:
+            return self.check_date
+
+    def _process_single_log(self):
+        """Procesa un registro pendiente con las reglas de _validate_for_import / _map_to_attendance.
+        Se usa como respaldo del motor por lotes cuando el alta masiva de un empleado no puede aplicarse.
+        Returns: (True, mensaje) o (False, mensaje de error); el registro queda marcado como importada o error."""
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                is_valid, validation_message = self._validate_for_import()
+                if not is_valid:
+                    self.write({'log_status': 'error', 'log_message': validation_message})
+                    return (False, validation_message)
+
+                attendance, attendance_message = self._map_to_attendance()
+                if not attendance:
+                    self.write({'log_status': 'error', 'log_message': attendance_message})
+                    return (False, attendance_message)
+
+                self.write({'log_status': 'importada', 'log_message': attendance_message, 'attendance_id': attendance.id})
+                return (True, attendance_message)
+        except Exception as e:
+            error_msg = f'Error inesperado durante procesamiento | Error: {str(e)}'
+            self.write({'log_status': 'error', 'log_message': error_msg})
+            _logger.error(f"Error inesperado en registro {self.id}: {str(e)}", exc_info=True)
+            return (False, error_msg)
+
+    def _prepare_import_batch(self, tz):
+        """Precarga en pocas consultas todo lo necesario para importar el lote:
+        empleados, contratos abiertos, asistencias abiertas o del rango de días, obras vigentes y snapshots previos.
+        Returns: (punches por empleado, errores de validación {record: mensaje}, contexto precargado)"""
+        Employee = self.env['hr.employee'].sudo()
+        errors = {}
+        numbers = list({r.registration_number for r in self if r.registration_number})
+        employees = {}
+        if numbers:
+            for emp in Employee.search([('registration_number', 'in', numbers)]):
+                employees.setdefault(emp.registration_number, emp)
+        emp_ids = [emp.id for emp in employees.values()]
+        with_contract = set()
+        if emp_ids:
+            with_contract = set(self.env['hr.contract'].sudo().search([('employee_id', 'in', emp_ids), ('state', '=', 'open')]).mapped('employee_id').ids)
+
+        # Validación (mismas reglas que _validate_for_import) y agrupación por empleado y día local
+        punches = {}
+        for record in self:
+            employee = employees.get(record.registration_number) if record.registration_number else False
+            if not employee:
+                errors[record] = f'Empleado no encontrado | Registration: {record.registration_number}'
+                continue
+            if employee.id not in with_contract:
+                errors[record] = f'Sin contrato activo | Empleado: {employee.name} | Registration: {record.registration_number}'
+                continue
+            if not record.check_date:
+                errors[record] = 'Formato de fecha inválido | check_date es nulo'
+                continue
+            if record.check_type not in ['entrada', 'salida']:
+                errors[record] = f'check_type inválido | Valor recibido: "{record.check_type}" | Valores permitidos: entrada, salida'
+                continue
+            local_dt = record._get_local_check_datetime(tz)
+            day_start_utc, day_end_utc = self._local_day_utc_range(tz, local_dt.date())
+            punches.setdefault(employee, []).append((record, local_dt, day_start_utc, day_end_utc))
+
+        context = {'attendances': {}, 'obras': {}, 'projects': {}, 'snapshots': {}}
+        if not punches:
+            return punches, errors, context
+
+        ids = tuple(emp.id for emp in punches)
+        range_start = min(p[2] for items in punches.values() for p in items)
+        range_end = max(p[3] for items in punches.values() for p in items)
+
+        # Asistencias que pueden intervenir en las reglas: abiertas (cualquier fecha) o con entrada dentro del rango del lote
+        for att in self.env['hr.attendance'].sudo().search_read([('employee_id', 'in', list(ids)), '|', ('check_out', '=', False),
+                '&', ('check_in', '>=', range_start), ('check_in', '<=', range_end)], ['employee_id', 'check_in', 'check_out', 'project_id', 'hourly_wage']):
+            context['attendances'].setdefault(att['employee_id'][0], []).append({'id': att['id'], 'check_in': att['check_in'],
+                'check_out': att['check_out'], 'project_id': att['project_id'][0] if att['project_id'] else False, 'hourly_wage': att['hourly_wage'],
+                'create_vals': None, 'write_vals': {}})
+
+        self.env.cr.execute('''SELECT employee_id, project_id, hourly_wage, fecha_inicio, fecha_fin FROM hr_employee_obra
+            WHERE employee_id IN %s AND fecha_inicio IS NOT NULL ORDER BY fecha_inicio DESC, id DESC''', (ids,))
+        for employee_id, project_id, hourly_wage, fecha_inicio, fecha_fin in self.env.cr.fetchall():
+            context['obras'].setdefault(employee_id, []).append((project_id, hourly_wage, fecha_inicio, fecha_fin))
+
+        project_ids = {o[0] for obras in context['obras'].values() for o in obras if o[0]}
+        project_ids |= {a['project_id'] for atts in context['attendances'].values() for a in atts if a['project_id']}
+        if project_ids:
+            context['projects'] = {p.id: p.name for p in self.env['project.project'].sudo().with_context(active_test=False).browse(list(project_ids))}
+
+        self.env.cr.execute('''SELECT DISTINCT ON (registration_number) registration_number, emp_snapshot FROM ctrol_asistencias
+            WHERE registration_number IN %s AND emp_snapshot IS NOT NULL AND log_status != 'pendiente'
+            ORDER BY registration_number, check_date DESC, id DESC''', (tuple(emp.registration_number for emp in punches),))
+        context['snapshots'] = dict(self.env.cr.fetchall())
+        return punches, errors, context
+
+    def _flush_attendance_slots(self, slots):
+        # Aplica en bloque los cambios en memoria: primero cierres/salidas (write agrupado por valores), después altas (un solo create).
+        AttendanceModel = self.env['hr.attendance'].sudo()
+        by_vals = {}
+        for slot in slots:
+            if slot['id'] and slot['write_vals']:
+                key = tuple(sorted(slot['write_vals'].items()))
+                by_vals.setdefault(key, []).append(slot['id'])
+        for key, att_ids in by_vals.items():
+            AttendanceModel.browse(att_ids).write(dict(key))
+
+        new_slots = [slot for slot in slots if not slot['id']]
+        if new_slots:
+            created = AttendanceModel.create([slot['create_vals'] for slot in new_slots])
+            for slot, attendance in zip(new_slots, created):
+                slot['id'] = attendance.id
+
+    def _import_employee_punches(self, employee, items, context):
+        """Empareja en memoria entradas/salidas de un empleado (mismas reglas que _map_to_attendance).
+        Returns: (slots de hr.attendance tocados, resultados [(record, ok, mensaje o callable, slot, log_vals)])"""
+        flexible = bool(employee.resource_calendar_id and getattr(employee.resource_calendar_id, 'flexible_hours', False))
+        slots = context['attendances'].get(employee.id, [])
+        obras = context['obras'].get(employee.id, [])
+        prev_snapshot = context['snapshots'].get(employee.registration_number)
+        results = []
+        for record, local_dt, day_start_utc, day_end_utc in items:
+            current_date = local_dt.date()
+            check_date_utc = record.check_date
+            if record.check_type == 'entrada':
+                if flexible:
+                    dup = [s for s in slots if not s['check_out'] and day_start_utc <= s['check_in'] <= day_end_utc]
+                    if dup:
+                        slot = max(dup, key=lambda s: s['check_in'])
+                        results.append((record, False, lambda s=slot, d=current_date: f"Ya existe una entrada abierta sin salida del día {d} | Attendance ID: {s['id']} | Check-in: {s['check_in']}", None, None))
+                        continue
+                else:
+                    dup = [s for s in slots if day_start_utc <= s['check_in'] <= day_end_utc]
+                    if dup:
+                        slot = max(dup, key=lambda s: s['check_in'])
+                        results.append((record, False, lambda s=slot, d=current_date: f"Ya existe entrada del día {d} | Attendance ID: {s['id']} | Check-in: {s['check_in']}", None, None))
+                        continue
+
+                # Cierre automático de entradas abiertas de días anteriores
+                auto_closed = 0
+                for prev in [s for s in slots if not s['check_out'] and s['check_in'] < day_start_utc]:
+                    prev['check_out'] = check_date_utc - timedelta(seconds=1)
+                    close_vals = {'check_out': prev['check_out'],
+                        'checkout_notes': f'Cierre automático - sin salida registrada en checador (entrada siguiente: {local_dt})'}
+                    (prev['create_vals'] if prev['create_vals'] is not None else prev['write_vals']).update(close_vals)
+                    auto_closed += 1
+
+                obra = next((o for o in obras if o[2] <= current_date and (not o[3] or current_date <= o[3])), None)
+                if not obra or not obra[0]:
+                    results.append((record, False, f'No existe registro de salario | Registration: {record.registration_number}', None, None))
+                    continue
+
+                slot = {'id': False, 'check_in': check_date_utc, 'check_out': False, 'project_id': obra[0], 'hourly_wage': obra[1], 'write_vals': {},
+                    'create_vals': {'employee_id': employee.id, 'check_in': check_date_utc, 'in_latitude': record.latitude or 0.0,
+                        'in_longitude': record.longitude or 0.0, 'project_id': obra[0], 'hourly_wage': obra[1]}}
+                slots.append(slot)
+                log_vals = record._get_snapshot_log_vals(employee, context['projects'].get(obra[0]), obra[1], prev_snapshot)
+                prev_snapshot = log_vals['emp_snapshot']
+                auto_msg = f' (se cerraron {auto_closed} entrada(s) previa(s) sin salida)' if auto_closed else ''
+                results.append((record, True, lambda s=slot, l=local_dt, m=auto_msg: f"Entrada registrada | Attendance ID: {s['id']} | Check-in local: {l}{m}", slot, log_vals))
+            else:
+                if not flexible:
+                    dup = [s for s in slots if s['check_out'] and day_start_utc <= s['check_out'] <= day_end_utc and s['check_in'] >= day_start_utc]
+                    if dup:
+                        slot = max(dup, key=lambda s: s['check_in'])
+                        results.append((record, False, lambda s=slot, d=current_date: f"Ya existe salida del día {d} | Attendance ID: {s['id']} | Check-out: {s['check_out']}", None, None))
+                        continue
+
+                candidates = [s for s in slots if not s['check_out'] and s['check_in'] <= check_date_utc]
+                if not candidates:
+                    results.append((record, False, f'Salida sin entrada previa | Employee: {employee.name} | Fecha local: {local_dt}', None, None))
+                    continue
+                slot = max(candidates, key=lambda s: s['check_in'])
+                if check_date_utc <= slot['check_in']:
+                    results.append((record, False, f"Salida debe ser posterior a entrada | Check-in: {slot['check_in']} | Check-out intentado: {check_date_utc}", None, None))
+                    continue
+
+                slot['check_out'] = check_date_utc
+                (slot['create_vals'] if slot['create_vals'] is not None else slot['write_vals']).update({'check_out': check_date_utc,
+                    'out_latitude': record.latitude or 0.0, 'out_longitude': record.longitude or 0.0})
+                log_vals = record._get_snapshot_log_vals(employee, context['projects'].get(slot['project_id'], ''), slot['hourly_wage'], prev_snapshot)
+                prev_snapshot = log_vals['emp_snapshot']
+                results.append((record, True, lambda s=slot: f"Salida registrada | Attendance ID: {s['id']} | Horas trabajadas: {s['worked_hours']:.2f}", slot, log_vals))
+        return slots, results
+
+    def _import_batch(self):
+        """Motor de importación por lotes de registros pendientes.
+        Agrupa las checadas por empleado y día local, precarga empleados, contratos, asistencias abiertas y obras vigentes
+        en pocas consultas, empareja entradas/salidas en memoria y aplica las altas/cambios de hr.attendance en bloque.
+        Si el alta en bloque de un empleado falla, sus registros se procesan uno a uno con _process_single_log
+        para conservar el detalle de error por registro.
+        Returns: lista de (record, ok, mensaje)"""
+        tz_name = self._get_checador_tz()
+        try:
+            tz = pytz.timezone(tz_name)
+        except Exception:
+            tz = None
+        punches, errors, context = self._prepare_import_batch(tz)
+        outcome = [(record, False, message) for record, message in errors.items()]
+
+        planned = {employee: self._import_employee_punches(employee, items, context) for employee, items in punches.items()}
+        fallback = []
+        try:
+            with self.env.cr.savepoint():
+                self._flush_attendance_slots([slot for slots, _results in planned.values() for slot in slots])
+        except Exception as e:
+            _logger.warning(f'Importación por lotes: alta masiva fallida ({str(e)}), reintentando por empleado')
+            for slots, _results in planned.values():
+                for slot in slots:
+                    if slot['create_vals'] is not None:
+                        slot['id'] = False
+            for employee, (slots, _results) in list(planned.items()):
+                try:
+                    with self.env.cr.savepoint():
+                        self._flush_attendance_slots(slots)
+                except Exception as e:
+                    _logger.warning(f'Importación por lotes: empleado {employee.registration_number} se procesa registro por registro ({str(e)})')
+                    fallback.extend(p[0] for p in punches[employee])
+                    del planned[employee]
+
+        touched = [slot['id'] for slots, _results in planned.values() for slot in slots if slot['id']]
+        worked = {att.id: att.worked_hours for att in self.env['hr.attendance'].sudo().browse(touched)}
+        for slots, results in planned.values():
+            for slot in slots:
+                slot['worked_hours'] = worked.get(slot['id'], 0.0)
+            for record, ok, message, slot, log_vals in results:
+                message = message() if callable(message) else message
+                outcome.append((record, ok, message))
+                if ok:
+                    record.write(dict(log_vals, log_status='importada', log_message=message, attendance_id=slot['id']))
+
+        # Errores agrupados por mensaje: un solo write por mensaje distinto
+        by_message = {}
+        for record, ok, message in outcome:
+            if not ok:
+                by_message.setdefault(message, []).append(record.id)
+        for message, record_ids in by_message.items():
+            self.browse(record_ids).write({'log_status': 'error', 'log_message': message})
+
+        for record in self.browse([r.id for r in fallback]):
+            ok, message = record._process_single_log()
+            outcome.append((record, ok, message))
+        return outcome
+
     @api.model
-    def process_pending_logs(self):
+    def _claim_pending_chunk(self, chunk_size, deferred_numbers=()):
+        """Reserva un bloque de registros pendientes con bloqueo de fila (FOR UPDATE SKIP LOCKED).
+        El bloque se particiona por empleado: se toman ~chunk_size filas ordenadas por registration_number y se completan
+        con el resto de pendientes de esos mismos empleados, para que cada empleado se procese completo en un solo worker.
+        Si otro worker ya tiene filas de un empleado, las filas tomadas de ese empleado se liberan de inmediato (rollback al
+        savepoint previo a la reserva) y el empleado se devuelve como diferido para reintentarlo en una reserva posterior.
+        Returns: (registros ordenados por check_date, números de empleado diferidos por estar parcialmente bloqueados)"""
+        # La reserva lee log_status por SQL: primero se vuelcan los cambios pendientes del ORM (p. ej. bloques
+        # marcados en error sin commit) para no volver a tomar filas que ya no están pendientes
+        self.flush_model(['log_status', 'registration_number', 'check_date'])
+        cr = self.env.cr
+        deferred = set()
+        with cr.savepoint(flush=False) as savepoint:
+            cr.execute('''SELECT id, registration_number FROM ctrol_asistencias
+                WHERE log_status = 'pendiente' AND (registration_number IS NULL OR registration_number != ALL(%s::varchar[]))
+                ORDER BY registration_number, check_date, id LIMIT %s FOR UPDATE SKIP LOCKED''', (list(set(deferred_numbers)), chunk_size))
+            rows = cr.fetchall()
+            ids = {row[0] for row in rows if not row[1]}
+            numbers = {row[1] for row in rows if row[1]}
+            while numbers:
+                cr.execute('''SELECT id, registration_number FROM ctrol_asistencias
+                    WHERE log_status = 'pendiente' AND registration_number IN %s FOR UPDATE SKIP LOCKED''', (tuple(numbers),))
+                locked = cr.fetchall()
+                locked_count = {}
+                for _id, number in locked:
+                    locked_count[number] = locked_count.get(number, 0) + 1
+                cr.execute('''SELECT registration_number, COUNT(*) FROM ctrol_asistencias
+                    WHERE log_status = 'pendiente' AND registration_number IN %s GROUP BY 1''', (tuple(numbers),))
+                incomplete = {number for number, count in cr.fetchall() if locked_count.get(number, 0) < count}
+                if not incomplete:
+                    ids |= {row_id for row_id, _number in locked}
+                    break
+                # Libera todas las filas tomadas y vuelve a reservar solo los empleados completos (y los registros sin número)
+                deferred |= incomplete
+                numbers -= incomplete
+                savepoint.rollback()
+                if ids:
+                    cr.execute('''SELECT id FROM ctrol_asistencias WHERE id IN %s AND log_status = 'pendiente'
+                        FOR UPDATE SKIP LOCKED''', (tuple(ids),))
+                    ids = {row[0] for row in cr.fetchall()}
+        return self.search([('id', 'in', list(ids))], order='check_date asc, id asc'), deferred
+
+    @api.model
+    def process_pending_logs(self, chunk_size=CHUNK_SIZE):
+        """Procesa los registros pendientes en bloques reservados por empleado.
+        Cada bloque se confirma en su propia transacción, así una falla o reinicio conserva lo ya procesado
+        y varios workers de cron pueden vaciar la cola en paralelo (las filas bloqueadas por otro worker se omiten).
+        Un bloque que falla se revierte a su savepoint y sus registros quedan en error, sin detener el resto de la cola.
+        Los tiempos por bloque se registran en ctrol.asistencias.run."""
         start_time = datetime.now()
-        pending_records = self.search([('log_status', '=', 'pendiente')], order='check_date asc, id asc')
-        total_records = len(pending_records)
-        if total_records == 0:
-            return {'total_procesados': 0, 'exitosos': 0, 'errores': 0, 'detalles_errores': [], 'tiempo_ejecucion': '0 segundos'}
-        
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        run = self.env['ctrol.asistencias.run'].sudo().create({'date_start': start_time, 'chunk_size': chunk_size})
+        if auto_commit:
+            self.env.cr.commit()
+
+        total_records = 0
         exitosos = 0
         errores = 0
         detalles_errores = []
-        for record in pending_records:
-            try:
-                # 2.1 VALIDACIÓN
-                is_valid, validation_message = record._validate_for_import()
-                if not is_valid:
-                    record.write({'log_status': 'error', 'log_message': validation_message})
-                    errores += 1
-                    detalles_errores.append({'id': record.id, 'employee': record.registration_number, 'error': validation_message})
+        deferred = set()
+        retries = 0
+        sequence = 0
+        state = 'done'
+        notes = []
+        while True:
+            chunk_start = datetime.now()
+            records, incomplete = self._claim_pending_chunk(chunk_size, deferred)
+            deferred |= incomplete
+            if not records:
+                if incomplete:
                     continue
-                
-                # 2.2 MAPEO A hr.attendance
-                attendance, attendance_message = record._map_to_attendance()
-                if not attendance:
-                    record.write({'log_status': 'error', 'log_message': attendance_message })
-                    errores += 1
-                    detalles_errores.append({'id': record.id, 'employee': record.registration_number, 'error': attendance_message})
+                # Empleados que otro worker tenía parcialmente bloqueados: se reintentan cuando ya no quede otra cosa
+                if deferred and retries < CLAIM_RETRIES:
+                    retries += 1
+                    deferred = set()
+                    if auto_commit:
+                        time.sleep(CLAIM_RETRY_DELAY)
                     continue
-                
-                messages = [attendance_message]
-                # 2.5 ACTUALIZACIÓN DE ESTADO: Marcar como importada
-                final_message = ' | '.join(messages)
-                write_vals = {'log_status': 'importada', 'log_message': final_message}
-                # Guardar referencia al attendance generado para trazabilidad rápida
-                if attendance and hasattr(attendance, 'id'):
-                    write_vals['attendance_id'] = attendance.id
-                record.write(write_vals)
-                exitosos += 1
-                _logger.info(f"Registro procesado exitosamente: {final_message}")
-            
+                break
+
+            sequence += 1
+            try:
+                with self.env.cr.savepoint():
+                    outcome = records._import_batch()
             except Exception as e:
-                # Capturar cualquier error no controlado
-                error_msg = f'Error inesperado durante procesamiento | Error: {str(e)}'
-                record.write({'log_status': 'error', 'log_message': error_msg})
-                errores += 1
-                detalles_errores.append({'id': record.id, 'employee': record.registration_number, 'error': error_msg})
-                _logger.error(f"Error inesperado en registro {record.id}: {str(e)}", exc_info=True)
-        
+                # El bloque fallido se marca con error para que no bloquee la cola en las siguientes corridas
+                state = 'error'
+                message = f'Error en bloque {sequence}: {str(e)}'
+                notes.append(message)
+                _logger.error(f'Procesamiento de asistencias: {message}', exc_info=True)
+                records.write({'log_status': 'error', 'log_message': message})
+                outcome = [(record, False, message) for record in records]
+
+            chunk_ok = sum(1 for _record, ok, _message in outcome if ok)
+            chunk_errors = len(outcome) - chunk_ok
+            for record, ok, message in outcome:
+                if not ok:
+                    detalles_errores.append({'id': record.id, 'employee': record.registration_number, 'error': message})
+            total_records += len(outcome)
+            exitosos += chunk_ok
+            errores += chunk_errors
+            self.env['ctrol.asistencias.run.chunk'].sudo().create({'run_id': run.id, 'sequence': sequence, 'date_start': chunk_start,
+                'employees': len(set(records.mapped('registration_number'))), 'total_records': len(outcome), 'exitosos': chunk_ok,
+                'errores': chunk_errors, 'duration': (datetime.now() - chunk_start).total_seconds()})
+            if auto_commit:
+                self.env.cr.commit()
+
         # 3. ESTADÍSTICAS FINALES
         end_time = datetime.now()
         execution_time = (end_time - start_time).total_seconds()
-        result = {'total_procesados': total_records, 'exitosos': exitosos, 'errores': errores, 'detalles_errores': detalles_errores, 
-            'tiempo_ejecucion': f'{execution_time:.2f} segundos'}
-        return result
+        run.write({'date_end': end_time, 'state': state, 'total_records': total_records, 'exitosos': exitosos, 'errores': errores,
+            'duration': execution_time, 'notes': '\n'.join(notes)})
+        if auto_commit:
+            self.env.cr.commit()
+        _logger.info(f'Procesamiento de asistencias: {total_records} registros en {sequence} bloque(s) | Exitosos: {exitosos} | '
+            f'Errores: {errores} | {execution_time:.2f} s')
+        return {'total_procesados': total_records, 'exitosos': exitosos, 'errores': errores, 'detalles_errores': detalles_errores,
+            'tiempo_ejecucion': f'{execution_time:.2f} segundos', 'run_id': run.id, 'bloques': sequence}
 
     
     @api.model
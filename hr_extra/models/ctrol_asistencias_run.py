@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models
+
+
+class CtrolAsistenciasRun(models.Model):
+    _name = 'ctrol.asistencias.run'
+    _description = 'Ejecución de Procesamiento de Asistencias'
+    _order = 'date_start desc, id desc'
+    _rec_name = 'date_start'
+
+    date_start = fields.Datetime(string='Inicio', required=True, default=fields.Datetime.now, index=True)
+    date_end = fields.Datetime(string='Fin')
+    state = fields.Selection([('running', 'En Proceso'), ('done', 'Terminada'), ('error', 'Error')], string='Estado', default='running', required=True)
+    chunk_size = fields.Integer(string='Tamaño de Bloque')
+    total_records = fields.Integer(string='Procesados')
+    exitosos = fields.Integer(string='Exitosos')
+    errores = fields.Integer(string='Errores')
+    duration = fields.Float(string='Duración (seg)', digits=(16, 2))
+    notes = fields.Text(string='Observaciones')
+    chunk_ids = fields.One2many('ctrol.asistencias.run.chunk', 'run_id', string='Bloques')
+
+
+class CtrolAsistenciasRunChunk(models.Model):
+    _name = 'ctrol.asistencias.run.chunk'
+    _description = 'Bloque de Procesamiento de Asistencias'
+    _order = 'run_id, sequence'
+
+    run_id = fields.Many2one('ctrol.asistencias.run', string='Ejecución', required=True, ondelete='cascade', index=True)
+    sequence = fields.Integer(string='Bloque')
+    date_start = fields.Datetime(string='Inicio')
+    employees = fields.Integer(string='Empleados')
+    total_records = fields.Integer(string='Registros')
+    exitosos = fields.Integer(string='Exitosos')
+    errores = fields.Integer(string='Errores')
+    duration = fields.Float(string='Duración (seg)', digits=(16, 3))
@@ -89,3 +89,11 @@ class HrJob(models.Model):
 
     manager_id = fields.Many2one('hr.employee', string='Manager', tracking=True, 
         domain="[('finiquito', '=', False), '|', ('company_id', '=', False), ('company_id', 'in', allowed_company_ids)]")
+
+    def write(self, vals):
+        res = super(HrJob, self).write(vals)
+        if 'name' in vals:
+            # El nombre del departamento define la nómina de los empleados sin contrato (employee_payroll_scope)
+            self.env.cr.execute('SELECT id FROM hr_employee WHERE department_id = ANY(%s)', (self.ids,))
+            self.env['hr.employee.payroll.scope'].refresh([row[0] for row in self.env.cr.fetchall()])
+        return res
@@ -1,15 +1,46 @@
 # -*- coding: utf-8 -*-
 from datetime import timedelta
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import ValidationError
-from dateutil.relativedelta import relativedelta
 from datetime import date, datetime, time
 from odoo.osv import expression
 import logging
-from odoo.tools import (date_utils,)
+import threading
+from odoo.tools import (date_utils, SQL,)
+from odoo.tools.query import Query
 
 _logger = logging.getLogger(__name__)
 
+# Campos de hr.employee que cambian el resultado memorizado de _get_encargado_visibility
+VISIBILITY_FIELDS = {'encargado_nomina', 'user_id', 'resource_id', 'active'}
+# Campos de hr.contract que cambian la clasificación de employee_payroll_scope
+SCOPE_CONTRACT_FIELDS = {'employee_id', 'state', 'schedule_pay'}
+# Códigos de hr.work.entry.type que asigna _preprocess_work_hours_data
+WORK_HOURS_ENTRY_CODES = ('DESC', 'FESTTRAB', 'FESTNOT', 'LEAVE120P')
+# Llave en cr.cache de la precarga de agregados de horas del lote de recibos en cálculo
+WORK_HOURS_PREFETCH_KEY = 'hr_extra.work_hours_prefetch'
+# Antigüedad de temporales por empleado (employee_id, anios) para los contratos open/close no permanentes de
+# %(employee_ids)s: LEAD marca las brechas de más de 10 días entre el fin de un contrato (o %(today)s si no tiene)
+# y el inicio del siguiente; el bloque vigente son los contratos sin brecha posterior (suma acumulada desde el último = 0).
+# El fin del bloque es el date_end del último contrato si está cerrado, si no %(today)s.
+ANTIQUE_TEMPORAL_SQL = """
+    WITH c AS (
+        SELECT hc.employee_id, hc.id, hc.date_start, hc.date_end, hc.state,
+               CASE WHEN LEAD(hc.date_start) OVER w - COALESCE(hc.date_end, %(today)s::date) > 10 THEN 1 ELSE 0 END AS brecha
+          FROM hr_contract hc JOIN hr_contract_type hct ON hct.id = hc.contract_type_id
+         WHERE hc.employee_id = ANY(%(employee_ids)s) AND hc.state IN ('open', 'close') AND hct.code NOT IN ('Permanent')
+        WINDOW w AS (PARTITION BY hc.employee_id ORDER BY hc.date_start, hc.id)),
+    b AS (
+        SELECT c.employee_id, c.date_start,
+               SUM(c.brecha) OVER d AS brechas_posteriores,
+               FIRST_VALUE(CASE WHEN c.state = 'close' THEN COALESCE(c.date_end, %(today)s::date) ELSE %(today)s::date END) OVER d AS block_end
+          FROM c
+        WINDOW d AS (PARTITION BY c.employee_id ORDER BY c.date_start DESC, c.id DESC))
+    SELECT employee_id, FLOOR((MAX(block_end) - MIN(date_start)) / 365.0)::integer AS anios
+      FROM b WHERE brechas_posteriores = 0 GROUP BY employee_id"""
+# Recibos por bloque del cálculo en segundo plano (hr.payslip._cron_compute_sheet_queue)
+PAYSLIP_CHUNK_SIZE = 50
+
 
 def _get_user_schedule_pay(env):
     """Retorna 'semanal', 'quincenal', o None (sin restricción).
@@ -36,6 +67,17 @@ def _get_user_schedule_pay(env):
     return None if enc == 'ambas' else enc
 
 
+def _get_visible_employees_query(env, enc, own_id):
+    """Subconsulta (Query) con los empleados visibles para enc más el propio empleado del usuario.
+    Se usa como valor de ('id', 'in', query): PostgreSQL la resuelve dentro de la búsqueda, sin lista de IDs en Python.
+    La clasificación semanal/quincenal se lee de employee_payroll_scope (hr.employee.payroll.scope)."""
+    query = Query(env, 'he', SQL.identifier('hr_employee'))
+    query.add_join('LEFT JOIN', 'ps', 'employee_payroll_scope', SQL('ps.employee_id = he.id'))
+    bucket = SQL.identifier('ps', 'semanal' if enc == 'semanal' else 'quincenal')
+    query.add_where(SQL('(%s OR he.id = %s)', bucket, own_id) if own_id else SQL('%s', bucket))
+    return query
+
+
 def _get_employee_ids_by_schedule(env, enc):
     """IDs de empleados visibles para el encargado de nómina según enc.
     Incluye:
@@ -44,22 +86,10 @@ def _get_employee_ids_by_schedule(env, enc):
         semanal   → PERSONAL DE OPERACIÓN (nómina semanal/obra)
         quincenal → cualquier otro departamento
     - semanal   → schedule_pay = 'weekly'
-    - quincenal → schedule_pay IN ('bi-weekly','monthly','bi_monthly','10_days','14_days','daily') """
-    if enc == 'semanal':
-        schedule_values = ('weekly',)
-        placeholders = '%s'
-        # Sin contrato: solo personal de operación
-        dept_filter = "AND (hd.name->>'en_US' = 'PERSONAL DE OPERACIÓN' OR hd.name->>'es_MX' = 'PERSONAL DE OPERACIÓN')"
-    else:
-        schedule_values = ('bi-weekly', 'monthly', 'bi_monthly', '10_days', '14_days', 'daily')
-        placeholders = ','.join(['%s'] * len(schedule_values))
-        # Sin contrato: cualquier departamento excepto operación
-        dept_filter = "AND (hd.name IS NULL OR (hd.name->>'en_US' != 'PERSONAL DE OPERACIÓN' AND hd.name->>'es_MX' != 'PERSONAL DE OPERACIÓN'))"
-
-    env.cr.execute(f'''SELECT DISTINCT(he.id) FROM hr_employee he LEFT JOIN hr_department hd ON hd.id = he.department_id WHERE he.active = true
-          AND (
-              EXISTS (SELECT 1 FROM hr_contract hc WHERE hc.employee_id = he.id AND hc.state IN ('open', 'draft', 'close') AND hc.schedule_pay IN ({placeholders}))
-              OR NOT EXISTS (SELECT 1 FROM hr_contract hc WHERE hc.employee_id = he.id AND hc.state != 'cancel') {dept_filter})''', schedule_values)
+    - quincenal → schedule_pay IN ('bi-weekly','monthly','bi_monthly','10_days','14_days','daily')
+    La clasificación se mantiene en employee_payroll_scope (ver hr.employee.payroll.scope.refresh). """
+    bucket = 'semanal' if enc == 'semanal' else 'quincenal'
+    env.cr.execute(SQL('SELECT employee_id FROM employee_payroll_scope WHERE %s', SQL.identifier(bucket)))
     return [row[0] for row in env.cr.fetchall()]
 
 
@@ -83,27 +113,21 @@ def _encargado_nomina_extra_domain(env, employee_field='employee_id'):
     Retorna [] si no aplica restricción.
     REGLA: el propio empleado del usuario SIEMPRE es visible, sin importar el enc.
     Esto evita errores de acceso cuando Odoo lee internamente el registro del usuario."""
-    enc = _get_user_schedule_pay(env)
+    # enc y empleado propio memorizados por usuario (ormcache); se invalidan al cambiar encargado_nomina,
+    # el usuario vinculado o los grupos del usuario
+    enc, own_id = env['hr.employee']._get_encargado_visibility(env.uid)
     if not enc:
         return []
 
-    # Siempre obtener el propio empleado para incluirlo en cualquier caso
-    own_id = _get_own_employee_id(env)
     if enc == 'none_assigned':
         # Sin encargado_nomina asignado → solo ve su propio empleado
         if own_id:
             return [('id', '=', own_id)] if employee_field == 'self' else [(employee_field, '=', own_id)]
         return []
 
-    employee_ids = _get_employee_ids_by_schedule(env, enc)
-    # Incluir siempre el propio empleado para evitar errores de acceso internos
-    if own_id and own_id not in employee_ids:
-        employee_ids = list(employee_ids) + [own_id]
-
-    if not employee_ids:
-        return []
-
-    return [('id', 'in', employee_ids)] if employee_field == 'self' else [(employee_field, 'in', employee_ids)]
+    # Subconsulta en lugar de la lista materializada; incluye siempre el propio empleado para evitar errores de acceso internos
+    query = _get_visible_employees_query(env, enc, own_id)
+    return [('id', 'in', query)] if employee_field == 'self' else [(employee_field, 'in', query)]
 
 
 class HrEmployeeObra(models.Model):
@@ -153,6 +177,8 @@ class hrEmployeeInherit(models.Model):
     empresa_empleadora = fields.Many2one('res.company', string='Empresa empleadora')
     antique = fields.Integer(string='Antigüedad', default=0)
     ultimo_aviso_vacaciones = fields.Integer(string='Último año avisado vacaciones', default=0, copy=False)
+    # Mes-día (MM-DD) de first_contract_date, almacenado e indexado para que cron_aviso_vacaciones solo lea los aniversarios del día
+    anniversary_key = fields.Char(string='Aniversario (MM-DD)', size=5, compute='_compute_anniversary_key', store=True, index=True)
     encargado_nomina = fields.Selection(selection=[('quincenal', 'Quincenal'), ('semanal', 'Semanal'), ('ambas', 'Ambas')],
         string='Encargado de Nómina')
     can_number = fields.Boolean(compute='_compute_can_number')
@@ -233,31 +259,15 @@ class hrEmployeeInherit(models.Model):
           - Se encadenan ordenados por date_start.
           - Si la brecha entre date_end de un contrato y date_start del siguiente supera 10 días, se reinicia la antigüedad desde ese contrato.
         Retorna años completos (entero). """
-        today = date.today()
-
-        self.env.cr.execute('''SELECT hc.date_start, hc.date_end, hc.state
-            FROM hr_contract hc JOIN hr_contract_type hct ON hct.id = hc.contract_type_id
-            WHERE hc.employee_id = %s AND hc.state IN ('open', 'close') AND hct.code NOT IN ('Permanent')
-            ORDER BY hc.date_start ASC ''', (employee_id,))
-        rows = self.env.cr.fetchall()
-        if not rows:
-            return 0
-
-        block_start = rows[-1][0]
-        prev_start  = rows[-1][0]
-        for date_start, date_end, state in reversed(rows[:-1]):
-            c_end = date_end or today
-            if (prev_start - c_end).days > 10:
-                break
-            block_start = date_start
-            prev_start  = date_start
-
-        last_date_end, last_state = rows[-1][1], rows[-1][2]
-        block_end = last_date_end if last_state == 'close' else today
-        return (block_end - block_start).days // 365
+        self.env['hr.contract'].flush_model(['employee_id', 'contract_type_id', 'state', 'date_start', 'date_end'])
+        self.env.cr.execute(ANTIQUE_TEMPORAL_SQL, {'employee_ids': [employee_id], 'today': date.today()})
+        row = self.env.cr.fetchone()
+        return row[1] if row else 0
 
 
     def cron_antique(self):
+        self.env['hr.contract'].flush_model(['employee_id', 'contract_type_id', 'state', 'date_start', 'date_end'])
+        self.flush_model(['antique', 'state'])
         # Paso 1: actualizar todos con MAX(id) del contrato más reciente — excluye bajas.
         self.env.cr.execute('''UPDATE hr_employee he SET antique = t2.anios
             FROM (SELECT t1.employee_id, hc.id, (CASE WHEN (now()::date - hc.date_start) > 365 
@@ -265,9 +275,11 @@ class hrEmployeeInherit(models.Model):
                         ELSE '0' END)::integer anios
                 FROM (SELECT hc.employee_id, MAX(hc.id) id FROM hr_contract hc JOIN hr_contract_type hct ON hc.contract_type_id = hct.id
                         WHERE hc.state != 'cancel' GROUP BY 1) AS t1 JOIN hr_contract hc ON t1.id = hc.id) AS t2
-            WHERE he.id = t2.employee_id AND he.state != 'baja' ''')
+            WHERE he.id = t2.employee_id AND he.state != 'baja' AND he.antique IS DISTINCT FROM t2.anios ''')
+        paso1 = self.env.cr.rowcount
 
-        # Paso 2: recalcular temporales aplicando regla de brecha de 10 días.
+        # Paso 2: recalcular temporales (último contrato no permanente) aplicando la regla de brecha de 10 días,
+        # en un solo UPDATE sobre el resultado de ANTIQUE_TEMPORAL_SQL para todos los empleados
         self.env.cr.execute("""SELECT DISTINCT hc.employee_id 
             FROM hr_contract hc JOIN hr_contract_type hct ON hct.id = hc.contract_type_id
                                 JOIN hr_employee he ON he.id = hc.employee_id
@@ -275,30 +287,49 @@ class hrEmployeeInherit(models.Model):
             AND hct.code NOT IN ('Permanent')
             AND he.state != 'baja'""")
         temporal_ids = [r[0] for r in self.env.cr.fetchall()]
-        for emp_id in temporal_ids:
-            years = self._calc_antique_temporal(emp_id)
-            self.env.cr.execute('UPDATE hr_employee SET antique = %s WHERE id = %s AND antique != %s',(years, emp_id, years))
-
+        paso2 = 0
+        if temporal_ids:
+            self.env.cr.execute(f"""UPDATE hr_employee he SET antique = COALESCE(t.anios, 0)
+                FROM unnest(%(employee_ids)s::int[]) AS e(id) LEFT JOIN ({ANTIQUE_TEMPORAL_SQL}) AS t ON t.employee_id = e.id
+                WHERE he.id = e.id AND he.antique IS DISTINCT FROM COALESCE(t.anios, 0)""",
+                {'employee_ids': temporal_ids, 'today': date.today()})
+            paso2 = self.env.cr.rowcount
+        self.invalidate_model(['antique'])
+        _logger.info(f'Antigüedad: {paso1} empleado(s) actualizados por contrato vigente, {paso2} temporal(es) recalculados de {len(temporal_ids)}')
+        return {'actualizados': paso1, 'temporales': len(temporal_ids), 'temporales_actualizados': paso2}
+
+
+    @api.depends('contract_ids.state', 'contract_ids.date_start')
+    def _compute_anniversary_key(self):
+        # Mismas dependencias que first_contract_date (hr_contract): se recalcula al crear, cancelar o mover contratos
+        for emp in self:
+            ingreso = emp.first_contract_date
+            emp.anniversary_key = ingreso.strftime('%m-%d') if ingreso else False
 
     def cron_aviso_vacaciones(self):
         hoy = date.today()
         todo = self.env.ref('mail.mail_activity_data_todo', raise_if_not_found=False)
         if not todo:
             return
-        empleados = self.search([('state', '=', 'activo'), ('first_contract_date', '!=', False)])
-        for emp in empleados:
-            ingreso = emp.first_contract_date
-            if ingreso.month == hoy.month and ingreso.day == hoy.day and ingreso.year < hoy.year \
-                    and emp.ultimo_aviso_vacaciones != hoy.year:
-                anios = hoy.year - ingreso.year
-                emp.activity_schedule(
-                    'mail.mail_activity_data_todo',
-                    date_deadline=hoy,
-                    summary=_('Aniversario laboral: gestionar vacaciones'),
-                    note=_('%(name)s cumple %(anios)s año(s) de antigüedad hoy. Gestionar el periodo de vacaciones y el pago correspondiente.',
-                           name=emp.name, anios=anios),
-                    user_id=self.env.ref('base.user_admin').id)
-                emp.ultimo_aviso_vacaciones = hoy.year
+        empleados = self.search([('state', '=', 'activo'), ('anniversary_key', '=', hoy.strftime('%m-%d')),
+            ('ultimo_aviso_vacaciones', '!=', hoy.year)])
+        empleados = empleados.filtered(lambda emp: emp.first_contract_date and emp.first_contract_date.year < hoy.year)
+        if not empleados:
+            return
+        model_id = self.env['ir.model']._get_id('hr.employee')
+        admin_id = self.env.ref('base.user_admin').id
+        self.env['mail.activity'].create([{
+            'res_model_id': model_id,
+            'res_id': emp.id,
+            'activity_type_id': todo.id,
+            'date_deadline': hoy,
+            'summary': _('Aniversario laboral: gestionar vacaciones'),
+            'note': _('%(name)s cumple %(anios)s año(s) de antigüedad hoy. Gestionar el periodo de vacaciones y el pago correspondiente.',
+                      name=emp.name, anios=hoy.year - emp.first_contract_date.year),
+            'user_id': admin_id,
+        } for emp in empleados])
+        empleados.write({'ultimo_aviso_vacaciones': hoy.year})
+        _logger.info(f'Aviso de vacaciones: {len(empleados)} aniversario(s) el {hoy}')
 
     @api.depends('obra_ids', 'obra_ids.project_id', 'obra_ids.project_id.active', 'obra_ids.fecha_inicio', 'obra_ids.fecha_fin', 'work_location_id')
     def _compute_current_project(self):
@@ -317,6 +348,13 @@ class hrEmployeeInherit(models.Model):
                 emp.current_project_name = emp.work_location_id.name if emp.work_location_id else 'OFICINA'
 
 
+    @api.model
+    @tools.ormcache('uid')
+    def _get_encargado_visibility(self, uid):
+        # (enc, empleado propio) del usuario para _encargado_nomina_extra_domain
+        env = self.env(user=uid)
+        return _get_user_schedule_pay(env), _get_own_employee_id(env)
+
     def get_current_project(self):
         self.ensure_one()
         return self.current_project_name or 'OFICINA'
@@ -326,11 +364,7 @@ class hrEmployeeInherit(models.Model):
         minutes = int((decimal_hour - hours) * 60)
         return f"{hours:02d}:{minutes:02d}:00"
 
-    def get_schedules_for_api(self):
-        self.ensure_one()
-        if not self.resource_calendar_id:
-            return []
-        calendar = self.resource_calendar_id
+    def _get_schedules_for_calendar(self, calendar):
         tolerance = getattr(calendar, 'tolerance_minutes', 15) or 15
         day_mapping = {'0': 'Lunes', '1': 'Martes', '2': 'Miércoles', '3': 'Jueves', '4': 'Viernes', '5': 'Sábado', '6': 'Domingo'}
         return [{
@@ -342,17 +376,66 @@ class hrEmployeeInherit(models.Model):
             'name': att.name or '',
         } for att in calendar.attendance_ids]
 
-    def get_employee_data_for_api(self):
+    def get_schedules_for_api(self):
         self.ensure_one()
-        contract = self.contract_id or self.env['hr.contract'].search([('employee_id', '=', self.id), ('state', '=', 'open')], limit=1)
-        work_entry_type = (contract.work_entry_source or '') if contract and hasattr(contract, 'work_entry_source') else ''
+        if not self.resource_calendar_id:
+            return []
+        return self._get_schedules_for_calendar(self.resource_calendar_id)
+
+    def _get_open_contracts_for_api(self):
+        # Contrato por empleado: contract_id o, si no tiene, el primer contrato abierto (una sola búsqueda para todo el lote)
+        contracts = {emp.id: emp.contract_id for emp in self if emp.contract_id}
+        missing = self.filtered(lambda e: not e.contract_id)
+        if missing:
+            for contract in self.env['hr.contract'].search([('employee_id', 'in', missing.ids), ('state', '=', 'open')]):
+                contracts.setdefault(contract.employee_id.id, contract)
+        return contracts
+
+    def _get_photo_checksums_for_api(self):
+        # Hash de la foto (checksum sha1 del adjunto image_1920) sin leer el binario; solo empleados con foto publicable
+        eligible = self.filtered(lambda e: e.state not in ('baja', 'pensionado'))
+        if not eligible:
+            return {}
+        attachments = self.env['ir.attachment'].sudo().search_read([('res_model', '=', 'hr.employee'), ('res_field', '=', 'image_1920'),
+            ('res_id', 'in', eligible.ids)], ['res_id', 'checksum'])
+        return {att['res_id']: att['checksum'] for att in attachments if att['checksum']}
+
+    def get_employees_data_for_api(self, skip_errors=False, photo_mode='inline', photo_size=None):
+        # Serializador por lote de get_employee_data_for_api: contratos resueltos en una búsqueda y un bloque de horarios
+        # por calendario compartido entre los empleados que lo usan. Con skip_errors se omite (y registra) el empleado que falle.
+        # photo_mode: 'inline' (base64 en 'photo'), 'url' (photo_hash + photo_url, sin binario) o 'none' (sin foto).
+        photos = self._get_photo_checksums_for_api() if photo_mode == 'url' else {}
+        size_query = f'?size={photo_size}' if photo_size else ''
+        contracts = self._get_open_contracts_for_api()
+        has_source = 'work_entry_source' in self.env['hr.contract']._fields
+        # Las relaciones (contacto, departamento, puesto, jefe, calendario y sus líneas) se leen en bloque por el prefetch
+        # del recordset; cada calendario distinto se serializa una sola vez.
+        schedule_blocks = {cal.id: self._get_schedules_for_calendar(cal) for cal in self.resource_calendar_id}
+        result = []
+        for emp in self:
+            try:
+                data = emp._get_employee_api_dict(contracts.get(emp.id), schedule_blocks, has_source, inline_photo=photo_mode == 'inline')
+                if photo_mode == 'url':
+                    data['photo_hash'] = photos.get(emp.id)
+                    data['photo_url'] = f'/api/v1/employees/{emp.id}/photo{size_query}' if emp.id in photos else None
+                result.append(data)
+            except Exception as e:
+                if not skip_errors:
+                    raise
+                _logger.error(f"Error obteniendo datos del empleado {emp.id}: {e}")
+        return result
+
+    def _get_employee_api_dict(self, contract, schedule_blocks, has_source, inline_photo=True):
+        contract = contract or self.env['hr.contract']
+        work_entry_type = (contract.work_entry_source or '') if contract and has_source else ''
         photo_base64 = None
-        if self.state not in ('baja', 'pensionado') and self.image_1920:
+        if inline_photo and self.state not in ('baja', 'pensionado') and self.image_1920:
             photo_base64 = self.image_1920.decode('utf-8') if isinstance(self.image_1920, bytes) else str(self.image_1920)
         company = self.empresa_empleadora or self.company_id
         company_name = company.name if company else ''
         company_id = company.id if company else None
         project_name = self.current_project_name or 'OFICINA'
+        calendar = self.resource_calendar_id
         return {
             'id': self.id,
             'registration_number': self.registration_number or '',
@@ -370,15 +453,19 @@ class hrEmployeeInherit(models.Model):
             'company': company_name,
             'company_id': company_id,
             'work_entry_type': work_entry_type,
-            'schedule_id': self.resource_calendar_id.id if self.resource_calendar_id else None,
-            'schedule_name': self.resource_calendar_id.name if self.resource_calendar_id else '',
-            'schedules': self.get_schedules_for_api(),
+            'schedule_id': calendar.id if calendar else None,
+            'schedule_name': calendar.name if calendar else '',
+            'schedules': list(schedule_blocks[calendar.id]) if calendar else [],
             'active': self.active and self.state not in ('baja', 'pensionado'),
             'work_email': self.work_email or '',
             'work_phone': self.work_phone or '',
             'mobile_phone': self.mobile_phone or '',
             'photo': photo_base64,}
 
+    def get_employee_data_for_api(self):
+        self.ensure_one()
+        return self.get_employees_data_for_api()[0]
+
     @api.model
     def get_employees_for_api(self, filters=None):
         filters = filters or {}
@@ -399,12 +486,8 @@ class hrEmployeeInherit(models.Model):
         offset = max(int(filters.get('offset', 0)), 0)
         employees = self.search(domain, limit=limit, offset=offset, order='id asc')
         total_count = self.search_count(domain)
-        result = []
-        for emp in employees:
-            try:
-                result.append(emp.get_employee_data_for_api())
-            except Exception as e:
-                _logger.error(f"Error obteniendo datos del empleado {emp.id}: {e}")
+        result = employees.get_employees_data_for_api(skip_errors=True, photo_mode=filters.get('photo_mode', 'inline'),
+            photo_size=filters.get('photo_size'))
         return {'employees': result, 'total_count': total_count,
                 'limit': limit, 'offset': offset, 'returned_count': len(result)}
 
@@ -432,6 +515,9 @@ class hrEmployeeInherit(models.Model):
         contact = self.env['res.partner'].search([('id', '=', work_contact)])
         contact.update({'curp': curp, 'vat': rfc, 'is_employee': True})
         res = super(hrEmployeeInherit, self).create(vals_list)
+        if any(vals.get('user_id') or vals.get('resource_id') for vals in vals_list):
+            self.env.registry.clear_cache()
+        self.env['hr.employee.payroll.scope'].refresh(res.ids)
         return res
 
 
@@ -464,10 +550,22 @@ class hrEmployeeInherit(models.Model):
                 contact.with_context(syncing_info=True).update({'curp': curp, 'vat': rfc, 'is_employee': True})
 
         res = super(hrEmployeeInherit, self).write(vals)
+        if VISIBILITY_FIELDS.intersection(vals):
+            # Cambia la visibilidad memorizada en _get_encargado_visibility
+            self.env.registry.clear_cache()
+        if 'active' in vals or 'department_id' in vals:
+            self.env['hr.employee.payroll.scope'].refresh(self.ids)
         """if self.hourly_cost == 0.00:
             raise ValidationError('Es necesario capturar el salario diario en obras') """
         return res
 
+    def unlink(self):
+        # Baja explícita para la sincronización incremental de checadores
+        self.env['checador.sync.tombstone'].sudo().register_deleted(self)
+        res = super(hrEmployeeInherit, self).unlink()
+        self.env.registry.clear_cache()
+        return res
+
 
 class hrContractInherit(models.Model):
     _inherit = 'hr.contract'
@@ -555,38 +653,143 @@ class hrContractInherit(models.Model):
         return salary
 
 
+    @api.model
+    def _get_work_hours_entry_types(self):
+        """ Tipos de entrada de trabajo de las reglas de _preprocess_work_hours_data, por código (una sola búsqueda). """
+        types = self.env['hr.work.entry.type'].search([('code', 'in', WORK_HOURS_ENTRY_CODES)])
+        return {code: types.filtered(lambda t, code=code: t.code == code)[:1].id for code in WORK_HOURS_ENTRY_CODES}
+
+    def _get_work_hours_batch_data(self, date_from, date_to_calc):
+        """ Agregados de asistencia de _preprocess_work_hours_data para todos los contratos de self.
+        Cada consulta se ejecuta una sola vez para el lote (parámetros ligados, agrupada por empleado);
+        retorna {contract_id: dict} con los valores que la regla aplica sobre work_data. """
+        cr = self.env.cr
+        data = {contract.id: {'descanso': 0, 'eligible': False, 'overtime': 0.0, 'unapproved': 0.0, 'sab_exc': 0.0, 'dom_exc': 0.0,
+            'dom_h': 0.0, 'dom_dias': 0.0, 'ot_finde': 0.0, 'inh_trab': 0.0, 'inhabiles': 0, 'prima': None} for contract in self}
+        if not self:
+            return data
+        params = {'contract_ids': self.ids, 'date_from': date_from, 'date_to': date_to_calc}
+        # Días de descanso: días del periodo sin asistencia en el horario de cada contrato
+        cr.execute("""SELECT hc.id, COUNT(*) num FROM hr_contract hc
+            CROSS JOIN generate_series(%(date_from)s::date, %(date_to)s::date, '1 day') AS d
+            WHERE hc.id = ANY(%(contract_ids)s) AND NOT EXISTS(SELECT 1 FROM resource_calendar_attendance rca
+                WHERE rca.calendar_id = hc.resource_calendar_id AND rca.dayofweek::integer+1 = EXTRACT(dow from d))
+            GROUP BY hc.id""", params)
+        for contract_id, num in cr.fetchall():
+            data[contract_id]['descanso'] = num
+
+        overtime_work_entry_type = self.env.ref('hr_work_entry.overtime_work_entry_type', False)
+        if not overtime_work_entry_type:
+            return data
+        eligible = self.filtered(lambda c: c.work_entry_source == 'attendance' and c.wage_type == 'hourly'
+            and len(c.structure_type_id.default_work_entry_type_id) == 1)
+        if not eligible:
+            return data
+        contracts_by_employee = {}
+        for contract in eligible:
+            data[contract.id]['eligible'] = True
+            contracts_by_employee.setdefault(contract.employee_id.id, []).append(data[contract.id])
+        employee_ids = list(contracts_by_employee)
+        params['employee_ids'] = employee_ids
+
+        def _assign(key, rows):
+            for employee_id, value in rows:
+                for values in contracts_by_employee.get(employee_id, []):
+                    values[key] = value
+
+        _assign('overtime', ((employee.id, duration or 0.0) for employee, duration in self.env['hr.attendance.overtime']._read_group(
+            [('employee_id', 'in', employee_ids), ('date', '>=', date_from), ('date', '<=', date_to_calc)], ['employee_id'], ['duration:sum'])))
+        _assign('unapproved', ((employee.id, round(hours or 0.0, 2)) for employee, hours in self.env['hr.attendance'].sudo()._read_group(
+            [('employee_id', 'in', employee_ids), ('check_in', '>=', date_from), ('check_out', '<=', date_to_calc), ('overtime_hours', '>', 0),
+             ('overtime_status', '!=', 'approved')], ['employee_id'], ['overtime_hours:sum'])))
+
+        # T0105: horas de sábado/domingo por día trabajado (solo se usan para personal de OBRA)
+        cr.execute("""SELECT employee_id, EXTRACT(dow FROM check_in) dow, SUM(worked_hours) h FROM hr_attendance
+            WHERE employee_id = ANY(%(employee_ids)s) AND check_in::date BETWEEN %(date_from)s::date AND %(date_to)s::date
+            AND EXTRACT(dow FROM check_in) IN (0,6) GROUP BY 1, 2, check_in::date""", params)
+        for employee_id, dow, hours in cr.fetchall():
+            hours = float(hours or 0)
+            for values in contracts_by_employee.get(employee_id, []):
+                if int(dow) == 6:
+                    values['sab_exc'] += max(0.0, hours - 5)
+                else:
+                    values['dom_h'] += hours
+                    values['dom_exc'] += max(0.0, hours - 5)
+                    values['dom_dias'] += 1.0 if hours >= 5 else hours / 10.0
+        cr.execute("""SELECT employee_id, COALESCE(SUM(duration), 0) FROM hr_attendance_overtime
+            WHERE employee_id = ANY(%(employee_ids)s) AND date BETWEEN %(date_from)s::date AND %(date_to)s::date
+            AND EXTRACT(dow FROM date) IN (0,6) GROUP BY 1""", params)
+        _assign('ot_finde', ((employee_id, float(duration or 0)) for employee_id, duration in cr.fetchall()))
+
+        # Festivos trabajados (overtime en día inhábil de la compañía)
+        cr.execute("""SELECT hao.employee_id, COALESCE(SUM(hao.duration), 0.0) FROM hr_attendance_overtime hao
+            JOIN resource_calendar_leaves rcl ON hao.date = rcl.date_from::date AND rcl.resource_id IS NULL AND rcl.holiday_id IS NULL
+            WHERE hao.employee_id = ANY(%(employee_ids)s) AND hao.date BETWEEN %(date_from)s::date AND %(date_to)s::date
+            GROUP BY 1""", params)
+        _assign('inh_trab', cr.fetchall())
+
+        # Festivos no trabajados: días inhábiles del periodo sin overtime del empleado
+        cr.execute("""SELECT e.id, COUNT(*) FROM unnest(%(employee_ids)s::int[]) AS e(id)
+            CROSS JOIN generate_series(%(date_from)s::date, %(date_to)s::date, '1 day') AS d
+            WHERE EXISTS(SELECT 1 FROM resource_calendar_leaves rca WHERE rca.date_from::date = d::date AND rca.holiday_id IS NULL
+                AND rca.resource_id IS NULL)
+            AND NOT EXISTS(SELECT 1 FROM hr_attendance_overtime hao WHERE hao.date = d::date AND hao.employee_id = e.id)
+            GROUP BY 1""", params)
+        _assign('inhabiles', cr.fetchall())
+
+        # Prima vacacional: primera solicitud de vacaciones aprobada del periodo por empleado
+        cr.execute("""SELECT DISTINCT ON (hl.employee_id) hl.employee_id, hl.number_of_hours FROM hr_leave hl
+            JOIN hr_leave_type hlt ON hl.holiday_status_id = hlt.id AND hlt.name->>'es_MX' = 'Vacaciones'
+            WHERE hl.state = 'validate' AND hl.employee_id = ANY(%(employee_ids)s)
+            AND hl.request_date_from BETWEEN %(date_from)s::date AND %(date_to)s::date
+            ORDER BY hl.employee_id, hl.request_date_from, hl.id""", params)
+        _assign('prima', cr.fetchall())
+        return data
+
+    def _get_work_hours_prefetched_data(self, date_from, date_to_calc):
+        """ Agregados de self desde la precarga del lote de recibos (ver HrPayslipInherit._compute_worked_days_line_ids);
+        sin precarga activa se calculan solo para self. Al primer contrato de cada zona horaria se calcula el lote
+        completo de contratos hermanos, ya que get_work_hours les entrega las mismas fechas. """
+        prefetch = self.env.cr.cache.get(WORK_HOURS_PREFETCH_KEY)
+        if prefetch is None or not set(self.ids) <= prefetch['contract_ids']:
+            return self._get_work_hours_batch_data(date_from, date_to_calc)
+        cached = prefetch['data'].setdefault((date_from, date_to_calc), {})
+        missing = self.filtered(lambda c: c.id not in cached)
+        if missing:
+            def _tz(contract):
+                return (contract.resource_calendar_id or contract.employee_id.resource_calendar_id).tz
+            tzs = {_tz(contract) for contract in missing}
+            siblings = self.browse(prefetch['contract_ids']).filtered(lambda c: c.id not in cached and _tz(c) in tzs)
+            cached.update((siblings | missing)._get_work_hours_batch_data(date_from, date_to_calc))
+        return {contract.id: cached[contract.id] for contract in self}
+
     def _preprocess_work_hours_data(self, work_data, date_from, date_to):
         # El dia 31 nunca se computa: si el periodo termina en 31, el tope de calculo es 30.
         _dt_to = date_to.date() if hasattr(date_to, 'date') and not isinstance(date_to, date) else date_to
         date_to_calc = date_to
         if _dt_to.strftime('%d') == '31':
             date_to_calc = date_to - timedelta(days=1)
-        self.env.cr.execute("SELECT COUNT(*) num FROM (SELECT * FROM generate_series('" + str(date_from) + "'::date, '" + str(date_to_calc) + 
-            "'::date, '1 day') as d ORDER BY 1) as t1 WHERE NOT EXISTS(SELECT * FROM resource_calendar_attendance rca WHERE rca.calendar_id = " + 
-            str(self.resource_calendar_id.id) + " AND rca.dayofweek::integer+1 = EXTRACT(dow from t1.d))")
-        descanso = self.env.cr.dictfetchall()
-        if descanso[0]['num'] > 0:
-            descanso_type = self.env['hr.work.entry.type'].search([('code', '=', 'DESC')])
-            work_data[descanso_type.id] = descanso[0]['num'] * 10
-
-        attendance_contracts = self.filtered(lambda c: c.work_entry_source == 'attendance' and c.wage_type == 'hourly')
+        batch = self._get_work_hours_prefetched_data(date_from, date_to_calc)
+        entry_types = self._get_work_hours_entry_types()
         overtime_work_entry_type = self.env.ref('hr_work_entry.overtime_work_entry_type', False)
+        for contract in self:
+            values = batch[contract.id]
+            if values['descanso'] > 0:
+                work_data[entry_types['DESC']] = values['descanso'] * 10
+            if values['eligible']:
+                contract._apply_work_hours_data(work_data, values, entry_types, overtime_work_entry_type, _dt_to)
+
+    def _apply_work_hours_data(self, work_data, values, entry_types, overtime_work_entry_type, _dt_to):
+        """ Reglas de horas extra, fin de semana, festivos y prima vacacional sobre work_data con los agregados del contrato. """
+        self.ensure_one()
         default_work_entry_type = self.structure_type_id.default_work_entry_type_id
-        if not attendance_contracts or not overtime_work_entry_type or len(default_work_entry_type) != 1:
-            return
-
-        overtime_hours = self.env['hr.attendance.overtime']._read_group([('employee_id', 'in', self.employee_id.ids), ('date', '>=', date_from), 
-            ('date', '<=', date_to_calc)], [], ['duration:sum'],)[0][0]
-        unapproved_overtime_hours = round(self.env['hr.attendance'].sudo()._read_group([('employee_id', 'in', self.employee_id.ids), 
-            ('check_in', '>=', date_from), ('check_out', '<=', date_to_calc), ('overtime_hours', '>', 0), ('overtime_status', '!=', 'approved')], [], 
-            ['overtime_hours:sum'],)[0][0], 2)
+        overtime_hours = values['overtime']
+        unapproved_overtime_hours = values['unapproved']
 
         if overtime_hours or overtime_hours > 0:
             work_data[default_work_entry_type.id] -= overtime_hours
             overtime_hours -= unapproved_overtime_hours
 
-        empleados = str(self.employee_id.ids)
-
         # --- T0105: regla sabado/domingo para personal de OBRA ---
         # Domingo trabajado = DESC (ya calculado) + DOMTRAB (dia extra) + excedente>5h a OVERTIME.
         # Sabado trabajado = dia normal (ya en WORK100) + excedente>5h a OVERTIME.
@@ -595,36 +798,18 @@ class hrContractInherit(models.Model):
         if self.employee_id.current_project_name != 'OFICINA':
             domtrab_type = self.env.ref('hr_extra.work_entry_type_domtrab', False)
             if domtrab_type:
-                self.env.cr.execute("SELECT EXTRACT(dow FROM check_in) dow, SUM(worked_hours) h "
-                    "FROM hr_attendance WHERE employee_id IN (" + empleados[1:-1] + ") "
-                    "AND check_in::date BETWEEN '" + str(date_from) + "' AND '" + str(date_to_calc) + "' "
-                    "AND EXTRACT(dow FROM check_in) IN (0,6) GROUP BY 1, check_in::date")
-                sab_exc = dom_exc = dom_h = 0.0
-                dom_dias = 0.0
-                for _r in self.env.cr.dictfetchall():
-                    _h = float(_r['h'] or 0)
-                    if int(_r['dow']) == 6:
-                        sab_exc += max(0.0, _h - 5)
-                    else:
-                        dom_h += _h
-                        dom_exc += max(0.0, _h - 5)
-                        dom_dias += 1.0 if _h >= 5 else _h / 10.0
                 # Overtime de fin de semana que el flujo previo ya resto de WORK100: se devuelve
-                self.env.cr.execute("SELECT COALESCE(SUM(duration),0) d FROM hr_attendance_overtime "
-                    "WHERE employee_id IN (" + empleados[1:-1] + ") "
-                    "AND date BETWEEN '" + str(date_from) + "' AND '" + str(date_to_calc) + "' "
-                    "AND EXTRACT(dow FROM date) IN (0,6)")
-                _ot_finde = float(self.env.cr.dictfetchall()[0]['d'] or 0)
+                _ot_finde = values['ot_finde']
                 work_data[default_work_entry_type.id] += _ot_finde
                 overtime_hours -= _ot_finde
                 # Sacar domingo entero + excedente sabado de WORK100 (dias normales solo L-V + sab hasta 5h)
-                work_data[default_work_entry_type.id] -= dom_h
-                work_data[default_work_entry_type.id] -= sab_exc
+                work_data[default_work_entry_type.id] -= values['dom_h']
+                work_data[default_work_entry_type.id] -= values['sab_exc']
                 # DOMTRAB (dia extra del domingo). En horas: dias*10 para que el motor lo convierta.
-                if dom_dias > 0:
-                    work_data[domtrab_type.id] = dom_dias * 10
+                if values['dom_dias'] > 0:
+                    work_data[domtrab_type.id] = values['dom_dias'] * 10
                 # Excedentes reales (sab+dom) a OVERTIME (horas exactas)
-                overtime_hours += sab_exc + dom_exc
+                overtime_hours += values['sab_exc'] + values['dom_exc']
         # --- fin T0105 ---
         if self.schedule_pay != 'weekly':
             if _dt_to.strftime('%d') == '28':
@@ -633,34 +818,18 @@ class hrContractInherit(models.Model):
             if _dt_to.strftime('%d') == '29':
                 work_data[default_work_entry_type.id] += 10
 
-        self.env.cr.execute("""SELECT coalesce(sum(hao.duration), 0.0) duration 
-            FROM hr_attendance_overtime hao JOIN resource_calendar_leaves rcl ON hao.date = rcl.date_from::date AND rcl.resource_id IS NULL AND rcl.holiday_id IS NULL 
-            WHERE hao.employee_id IN (""" + empleados[1:-1] + ") AND hao.DATE BETWEEN '" + str(date_from) + "' AND '" + str(date_to_calc) + "'")
-        inh_trab = self.env.cr.dictfetchall()
-        if inh_trab[0]['duration'] != 0.0:
-            overtime_hours -= inh_trab[0]['duration']
-            inhabilestrab_type = self.env['hr.work.entry.type'].search([('code', '=', 'FESTTRAB')])
-            work_data[inhabilestrab_type.id] = inh_trab[0]['duration']
-
-        self.env.cr.execute("SELECT COUNT(*) num FROM (SELECT * FROM generate_series('" + str(date_from) + "'::date, '" + str(date_to_calc) + 
-                """'::date, '1 day') as d ORDER BY 1) as t1 
-            WHERE EXISTS(SELECT * FROM resource_calendar_leaves rca WHERE rca.date_from::date = t1.d::date AND rca.holiday_id is null AND rca.resource_id IS NULL)
-            AND NOT EXISTS(SELECT * FROM hr_attendance_overtime hao WHERE hao.DATE = t1.d::date AND hao.employee_id IN (""" + empleados[1:-1] + '))')
-        inhabiles = self.env.cr.dictfetchall()
-        if inhabiles[0]['num'] > 0:
-            inhabil_type = self.env['hr.work.entry.type'].search([('code', '=', 'FESTNOT')])
-            work_data[inhabil_type.id] = inhabiles[0]['num'] * 10
+        if values['inh_trab'] != 0.0:
+            overtime_hours -= values['inh_trab']
+            work_data[entry_types['FESTTRAB']] = values['inh_trab']
+
+        if values['inhabiles'] > 0:
+            work_data[entry_types['FESTNOT']] = values['inhabiles'] * 10
 
         if overtime_hours != 0 and self.employee_id.current_project_name != 'OFICINA':
             work_data[overtime_work_entry_type.id] = overtime_hours
 
-        self.env.cr.execute('''SELECT * FROM hr_leave hl JOIN hr_leave_type hlt ON hl.holiday_status_id = hlt.id AND hlt.name->>'es_MX' = 'Vacaciones' 
-            WHERE hl.state = 'validate' AND hl.employee_id IN (''' + empleados[1:-1] + ") AND hl.request_date_from BETWEEN '" + str(date_from) + "' AND '" 
-            + str(date_to_calc) + "'")
-        prima = self.env.cr.dictfetchall()
-        if prima:
-            prima_type = self.env['hr.work.entry.type'].search([('code', '=', 'LEAVE120P')])
-            work_data[prima_type.id] = prima[0]['number_of_hours']
+        if values['prima'] is not None:
+            work_data[entry_types['LEAVE120P']] = values['prima']
 
 
     @api.model_create_multi
@@ -670,7 +839,9 @@ class hrContractInherit(models.Model):
             if salario and not vals.get('hourly_wage'):
                 vals['hourly_wage'] = salario.salario_hora
                 vals['daily_wage'] = salario.salario_hora * 8
-        return super(hrContractInherit, self).create(vals_list)
+        res = super(hrContractInherit, self).create(vals_list)
+        self.env['hr.employee.payroll.scope'].refresh(res.employee_id.ids)
+        return res
 
     @api.onchange('contract_type_id', 'employee_id')
     def _onchange_set_salario_minimo(self):
@@ -687,7 +858,10 @@ class hrContractInherit(models.Model):
         if 'state' in vals or 'project_id' in vals:
             c = 1
 
+        scope_employees = self.employee_id if SCOPE_CONTRACT_FIELDS.intersection(vals) else self.env['hr.employee']
         res = super(hrContractInherit, self).write(vals)
+        if scope_employees:
+            self.env['hr.employee.payroll.scope'].refresh((scope_employees | self.employee_id).ids)
         if c == 1 and self.contract_type_name in ('Obra determinada', 'Tiempo de prueba'):
             if self.project_id:
                 obra = self.env['hr.employee.obra'].search([('employee_id', '=', self.employee_id.id), ('project_id', '=', self.project_id.id)])
@@ -704,6 +878,12 @@ class hrContractInherit(models.Model):
         return res
 
 
+    def unlink(self):
+        employees = self.employee_id
+        res = super(hrContractInherit, self).unlink()
+        self.env['hr.employee.payroll.scope'].refresh(employees.ids)
+        return res
+
     def _get_more_vals_attendance_interval(self, interval):
         result = super()._get_more_vals_attendance_interval(interval)
         result.append(('project_id', interval[2].project_id.id))
@@ -721,6 +901,8 @@ class HrPayslipInherit(models.Model):
     _inherit = 'hr.payslip'
 
     active = fields.Boolean(string='Activo', default=True)
+    compute_queued = fields.Boolean(string='En cola de cálculo', index=True, copy=False)
+    compute_error = fields.Text(string='Error de cálculo', copy=False)
     employee_id = fields.Many2one('hr.employee', string='Employee', required=True,
         domain="[('finiquito', '=', False), '|', ('company_id', '=', False), ('company_id', '=', company_id), '|', ('active', '=', True), ('active', '=', False)]")
     amount = fields.Float(string='Total a pagar', compute='_compute_amount', store=True)
@@ -739,6 +921,18 @@ class HrPayslipInherit(models.Model):
                 cost = payslip.employee_id.hourly_cost
                 payslip.l10n_mx_daily_salary = cost * 8
 
+    def _compute_worked_days_line_ids(self):
+        # Precarga por lote: los agregados de _preprocess_work_hours_data se consultan una vez para todos los
+        # contratos de los recibos (p. ej. un hr.payslip.run) en lugar de por contrato
+        cache = self.env.cr.cache
+        if len(self) < 2 or WORK_HOURS_PREFETCH_KEY in cache:
+            return super()._compute_worked_days_line_ids()
+        cache[WORK_HOURS_PREFETCH_KEY] = {'contract_ids': frozenset(self.contract_id.ids), 'data': {}}
+        try:
+            return super()._compute_worked_days_line_ids()
+        finally:
+            cache.pop(WORK_HOURS_PREFETCH_KEY, None)
+
     def _get_worked_day_lines_values(self, domain=None):
         self.ensure_one()
         hours_per_day = self._get_worked_day_lines_hours_per_day()
@@ -761,6 +955,7 @@ class HrPayslipInherit(models.Model):
 
     @api.depends('date_from', 'date_to', 'struct_id')
     def _compute_warning_message(self):
+        inconsistent_ids = self._get_inconsistent_payslip_ids()
         for slip in self:
             slip.warning_message = False
             if not slip.date_from or not slip.date_to:
@@ -780,9 +975,10 @@ class HrPayslipInherit(models.Model):
                     and slip.date_from + slip._get_schedule_timedelta() != slip.date_to:
                 warnings.append(_('La duración de un recibo de nómina no es exacta según el tipo de estructura.'))
 
-            inconsistencia = self.env['hr.attendance'].search([('employee_id', '=', slip.employee_id.id), ('check_in', '>=', slip.date_from), 
-                ('check_in', '<=', slip.date_to), ('worked_hours', '>', 16)])
-            if len(inconsistencia) > 0:
+            # Recibos sin guardar (formulario): no están en la consulta agrupada, se buscan individualmente
+            if slip.id in inconsistent_ids or (not slip.id and self.env['hr.attendance'].search_count([
+                    ('employee_id', '=', slip.employee_id.id), ('check_in', '>=', slip.date_from), ('check_in', '<=', slip.date_to),
+                    ('worked_hours', '>', 16)], limit=1)):
                 warnings.append(_('Existen asistencias inconsistentes en el periodo'))
 
             if warnings:
@@ -790,39 +986,72 @@ class HrPayslipInherit(models.Model):
                 slip.warning_message = "\n  ・ ".join(warnings)
 
 
+    def _get_inconsistent_payslip_ids(self):
+        """ Ids de los recibos con asistencias de más de 16 horas en su periodo, en una sola consulta agrupada. """
+        slip_ids = [slip_id for slip_id in self.ids if slip_id]
+        if not slip_ids:
+            return set()
+        self.flush_model(['employee_id', 'date_from', 'date_to'])
+        self.env['hr.attendance'].flush_model(['employee_id', 'check_in', 'worked_hours'])
+        self.env.cr.execute('''SELECT hp.id FROM hr_payslip hp WHERE hp.id = ANY(%s) AND EXISTS(SELECT 1 FROM hr_attendance ha
+            WHERE ha.employee_id = hp.employee_id AND ha.check_in >= hp.date_from::timestamp AND ha.check_in <= hp.date_to::timestamp
+            AND ha.worked_hours > 16)''', (slip_ids,))
+        return {row[0] for row in self.env.cr.fetchall()}
+
+    def _check_sheet_warnings(self):
+        """ Impide calcular recibos MX_REGULAR con advertencias; el mensaje lista todos los empleados afectados. """
+        blocked = self.filtered(lambda slip: slip.structure_code == 'MX_REGULAR' and slip.warning_message)
+        if blocked:
+            raise ValidationError('Existen inconsistencias en el recibo, favor de resolver antes de continuar con el proceso:\n%s'
+                % '\n'.join(blocked.mapped('employee_id.name')))
+
     def compute_sheet(self):
         payslips = self.filtered(lambda slip: slip.state in ['draft', 'verify'])
-        for payslip in payslips:
-            if payslip.structure_code == 'MX_REGULAR' and payslip.warning_message:
-                raise ValidationError('Existen inconsistencias en el recibo, favor de resolver antes de continuar con el proceso')
-        
-        for payslip in payslips:
-            if payslip.structure_code == 'MX_REGULAR':
-                payslip.calculate_project()
+        payslips._check_sheet_warnings()
+        # Generación desde el asistente: los lotes grandes se calculan por bloques en segundo plano
+        if self.env.context.get('payslip_compute_async') and len(payslips) > PAYSLIP_CHUNK_SIZE and payslips.payslip_run_id:
+            payslips.payslip_run_id._enqueue_compute_sheet(payslips)
+            return True
+
+        payslips.filtered(lambda slip: slip.structure_code == 'MX_REGULAR').calculate_project()
         return super().compute_sheet()
 
 
     def calculate_project(self):
-        attendance = self._get_attendance_by_payslip()[self]
-        if not attendance:
+        """ Reparte el salario de cada recibo entre las obras de sus asistencias. Las horas por obra y tarifa de todos
+        los recibos se agregan en una consulta y hr.payslip.project se actualiza en bloque (una lectura, un create).
+        Cada obra salvo la última cobra sus días (horas/10 * 8h) y extras a su tarifa; la última recibe el remanente. """
+        if not self:
             return
-        salary = sum(x.amount for x in self.worked_days_line_ids)
-        self.env.cr.execute('''SELECT project_id, hourly_wage, SUM(worked_hours - overtime_hours) horas, SUM(overtime_hours) extra, MIN(check_in::DATE) fecha
-            FROM hr_attendance ha WHERE id in (''' + str(attendance.ids).replace('[', '').replace(']', '') + ") GROUP BY 1, 2 ORDER BY 3 DESC, 5 DESC")
-        project = self.env.cr.dictfetchall()
-        num = len(project)
-        if num == 1:
-            existe = self.env['hr.payslip.project'].search([('payslip_id', '=', self.id), ('project_id', '=', project[0]['project_id'])])
-            if existe:
-                if salary != existe.importe:
-                    existe.write({'importe': salary})
-            else:
-                self.env['hr.payslip.project'].create({'payslip_id':self.id, 'project_id':project[0]['project_id'], 'importe':salary})
-        else:
-            c = 1
+        attendance_by_slip = self._get_attendance_by_payslip()
+        slip_ids, attendance_ids = [], []
+        for slip in self:
+            for attendance_id in attendance_by_slip[slip].ids:
+                slip_ids.append(slip.id)
+                attendance_ids.append(attendance_id)
+        if not attendance_ids:
+            return
+        self.env['hr.attendance'].flush_model(['project_id', 'hourly_wage', 'worked_hours', 'overtime_hours', 'check_in'])
+        self.env.cr.execute('''SELECT a.slip_id, ha.project_id, ha.hourly_wage, SUM(ha.worked_hours - ha.overtime_hours) horas,
+                SUM(ha.overtime_hours) extra, MIN(ha.check_in::DATE) fecha
+            FROM unnest(%s::int[], %s::int[]) AS a(slip_id, attendance_id) JOIN hr_attendance ha ON ha.id = a.attendance_id
+            GROUP BY 1, 2, 3 ORDER BY 1, 4 DESC, 6 DESC''', (slip_ids, attendance_ids))
+        projects_by_slip = {}
+        for row in self.env.cr.dictfetchall():
+            projects_by_slip.setdefault(row['slip_id'], []).append(row)
+
+        importes = {}
+        for slip in self:
+            project = projects_by_slip.get(slip.id)
+            if not project:
+                continue
+            salary = sum(x.amount for x in slip.worked_days_line_ids)
+            num = len(project)
             total = 0
-            for x in project:
-                if c == num:
+            for c, x in enumerate(project, start=1):
+                if num == 1:
+                    sal = salary
+                elif c == num:
                     sal = salary - total
                 else:
                     sal = 0.0
@@ -832,14 +1061,25 @@ class HrPayslipInherit(models.Model):
                     if dias > 0:
                         sal += dias * x['hourly_wage'] * 8
                     total += sal
-                
-                c += 1
-                existe = self.env['hr.payslip.project'].search([('payslip_id', '=', self.id), ('project_id', '=', x['project_id'])])
-                if existe:
-                    if sal != existe.importe:
-                        existe.write({'importe': sal})
-                else:
-                    self.env['hr.payslip.project'].create({'payslip_id':self.id, 'project_id':x['project_id'], 'importe':sal})
+                # Una obra con varias tarifas conserva el importe de su última fila
+                importes[(slip.id, x['project_id'])] = sal
+
+        PayslipProject = self.env['hr.payslip.project']
+        existentes = {}
+        for record in PayslipProject.search([('payslip_id', 'in', list(projects_by_slip))]):
+            existentes.setdefault((record.payslip_id.id, record.project_id.id), record)
+        to_write = {}
+        vals_list = []
+        for (slip_id, project_id), sal in importes.items():
+            existe = existentes.get((slip_id, project_id))
+            if not existe:
+                vals_list.append({'payslip_id': slip_id, 'project_id': project_id, 'importe': sal})
+            elif sal != existe.importe:
+                to_write[sal] = to_write.get(sal, PayslipProject) | existe
+        for sal, records in to_write.items():
+            records.write({'importe': sal})
+        if vals_list:
+            PayslipProject.create(vals_list)
 
 
     @api.model
@@ -850,6 +1090,103 @@ class HrPayslipInherit(models.Model):
         return super()._search(list(domain) + extra if extra else domain, offset=offset, limit=limit, order=order)
 
 
+    def _compute_sheet_chunk(self):
+        """ Calcula un bloque de recibos. Si el bloque falla se reintenta recibo por recibo (cada uno es un empleado),
+        así un empleado con error no detiene al resto. Returns: {payslip_id: mensaje de error} """
+        try:
+            with self.env.cr.savepoint():
+                self.compute_sheet()
+            return {}
+        except Exception:
+            _logger.info('Cálculo de recibos: falla en bloque de %s recibos, se reintenta por empleado', len(self), exc_info=True)
+        errors = {}
+        for slip in self:
+            try:
+                with self.env.cr.savepoint():
+                    slip.compute_sheet()
+            except Exception as e:
+                errors[slip.id] = str(e)
+        return errors
+
+    def _claim_compute_chunk(self, chunk_size):
+        """ Reserva un bloque de recibos en cola con bloqueo de fila (FOR UPDATE SKIP LOCKED) para que varios workers
+        de cron calculen bloques distintos del mismo lote. """
+        self.env.cr.execute('''SELECT id FROM hr_payslip WHERE compute_queued = true
+            ORDER BY payslip_run_id, employee_id, id LIMIT %s FOR UPDATE SKIP LOCKED''', (chunk_size,))
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def _cron_compute_sheet_queue(self, chunk_size=PAYSLIP_CHUNK_SIZE):
+        """ Calcula los recibos en cola por bloques. Cada bloque se confirma en su propia transacción; el avance
+        se refleja en el lote (hr.payslip.run) a partir del estado de sus recibos. """
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        chunks = 0
+        while True:
+            slips = self._claim_compute_chunk(chunk_size)
+            if not slips:
+                break
+            errors = slips._compute_sheet_chunk()
+            for slip in slips:
+                slip.write({'compute_queued': False, 'compute_error': errors.get(slip.id, False)})
+            chunks += 1
+            if auto_commit:
+                self.env.cr.commit()
+        if chunks:
+            _logger.info(f'Cálculo de recibos en segundo plano: {chunks} bloque(s) de hasta {chunk_size} recibos')
+        return chunks
+
+
+class HrPayslipRunInherit(models.Model):
+    _inherit = 'hr.payslip.run'
+
+    compute_total = fields.Integer(string='Recibos a calcular', copy=False)
+    compute_date_start = fields.Datetime(string='Inicio del cálculo', copy=False)
+    compute_done = fields.Integer(string='Recibos calculados', compute='_compute_compute_progress')
+    compute_errors = fields.Integer(string='Recibos con error', compute='_compute_compute_progress')
+    compute_progress = fields.Float(string='Avance del cálculo', compute='_compute_compute_progress')
+    compute_state = fields.Selection([('none', 'Sin cálculo en segundo plano'), ('running', 'En proceso'), ('done', 'Terminado'),
+        ('error', 'Con errores')], string='Cálculo en segundo plano', compute='_compute_compute_progress')
+
+    def _compute_compute_progress(self):
+        # Derivado de los recibos: los workers solo escriben hr.payslip, nunca la fila del lote
+        queued = {run.id: count for run, count in self.env['hr.payslip']._read_group(
+            [('payslip_run_id', 'in', self.ids), ('compute_queued', '=', True)], ['payslip_run_id'], ['__count'])}
+        errors = {run.id: count for run, count in self.env['hr.payslip']._read_group(
+            [('payslip_run_id', 'in', self.ids), ('compute_error', '!=', False)], ['payslip_run_id'], ['__count'])}
+        for run in self:
+            pending = queued.get(run.id, 0)
+            run.compute_errors = errors.get(run.id, 0)
+            run.compute_done = max(run.compute_total - pending, 0)
+            run.compute_progress = run.compute_done * 100.0 / run.compute_total if run.compute_total else 0.0
+            if not run.compute_total:
+                run.compute_state = 'none'
+            elif pending:
+                run.compute_state = 'running'
+            else:
+                run.compute_state = 'error' if run.compute_errors else 'done'
+
+    def _enqueue_compute_sheet(self, payslips):
+        """ Marca los recibos para el cálculo por bloques y despierta a los workers de cron. """
+        payslips.write({'compute_queued': True, 'compute_error': False})
+        now = fields.Datetime.now()
+        for run in self:
+            run.write({'compute_total': len(payslips.filtered(lambda slip: slip.payslip_run_id == run)), 'compute_date_start': now})
+        for xmlid in ('hr_extra.ir_cron_payslip_compute_queue', 'hr_extra.ir_cron_payslip_compute_queue_2'):
+            cron = self.env.ref(xmlid, False)
+            if cron:
+                cron.sudo()._trigger()
+
+    def action_compute_sheet_async(self):
+        """ Valida las inconsistencias de todos los recibos del lote (una consulta) y encola su cálculo. """
+        payslips = self.slip_ids.filtered(lambda slip: slip.state in ['draft', 'verify'])
+        if not payslips:
+            raise ValidationError('No hay recibos en borrador o en verificación para calcular.')
+        payslips._check_sheet_warnings()
+        for run in self:
+            run._enqueue_compute_sheet(payslips.filtered(lambda slip: slip.payslip_run_id == run))
+        return True
+
+
 class HrPayslipEmployeesFiniquitoFilter(models.TransientModel):
     _inherit = 'hr.payslip.employees'
 
@@ -872,6 +1209,10 @@ class HrPayslipEmployeesFiniquitoFilter(models.TransientModel):
         return domain
     # --- fin T0105-P2 ---
 
+    def compute_sheet(self):
+        # Los recibos generados se calculan por bloques en segundo plano cuando el lote es grande
+        return super(HrPayslipEmployeesFiniquitoFilter, self.with_context(payslip_compute_async=True)).compute_sheet()
+
     def _get_available_contracts_domain(self):
         employee = self.env['hr.employee'].search([('user_id','=',self.env.user.id)])
         if employee:
@@ -907,43 +1248,86 @@ class HrPayslipWorkedDaysInherit(models.Model):
 
     amount = fields.Float(string='Amount', digits=(16, 6), compute='_compute_amount', store=True, readonly=True, copy=True)
 
-    def _get_costo_hora_por_fecha(self, employee, date_from, date_to):
-        if not employee or not date_from or not date_to:
-            return None
-
-        obras = employee.obra_ids.filtered(lambda o: o.hourly_wage and o.fecha_inicio)
-        if not obras:
-            return None
+    @api.model
+    def _get_obra_wage_index(self, employees):
+        """Índice de tarifas por obra: {employee_id: [(fecha_inicio, hourly_wage), ...]} ordenado por fecha.
+        Cada tramo inicia en una fecha_inicio y vale la tarifa de la obra vigente en ese día (la de mayor id entre
+        las obras con fecha_inicio <= día), hasta el inicio del siguiente tramo. Una sola lectura para todo el lote."""
+        if not employees:
+            return {}
+        obras = self.env['hr.employee.obra'].search_read([('employee_id', 'in', employees.ids), ('hourly_wage', '!=', 0),
+            ('fecha_inicio', '!=', False)], ['employee_id', 'fecha_inicio', 'hourly_wage'], order='employee_id, fecha_inicio, id')
+        index = {}
+        best = {}
+        for obra in obras:
+            emp_id = obra['employee_id'][0]
+            if emp_id not in best or obra['id'] > best[emp_id]['id']:
+                best[emp_id] = obra
+            segments = index.setdefault(emp_id, [])
+            if segments and segments[-1][0] == obra['fecha_inicio']:
+                segments[-1] = (obra['fecha_inicio'], best[emp_id]['hourly_wage'])
+            else:
+                segments.append((obra['fecha_inicio'], best[emp_id]['hourly_wage']))
+        return index
 
+    @staticmethod
+    def _get_costo_hora_from_index(segments, date_from, date_to):
+        # Promedio de la tarifa por día del periodo: cada tramo aporta tarifa * días de traslape con [date_from, date_to]
         total_dias = 0
         total_costo = 0.0
-        current = date_from
-        while current <= date_to:
-            obra_dia = obras.filtered(lambda o: o.fecha_inicio <= current)
-            if obra_dia:
-                obra = obra_dia.sorted(key=lambda o: o.id, reverse=True)[0]
-                total_costo += obra.hourly_wage
-                total_dias += 1
-            current += relativedelta(days=1)
+        for i, (start, wage) in enumerate(segments or []):
+            end = segments[i + 1][0] - timedelta(days=1) if i + 1 < len(segments) else date_to
+            lo, hi = max(start, date_from), min(end, date_to)
+            if lo <= hi:
+                dias = (hi - lo).days + 1
+                total_dias += dias
+                total_costo += wage * dias
         return (total_costo / total_dias) if total_dias else None
 
+    def _get_costo_hora_por_fecha(self, employee, date_from, date_to):
+        if not employee or not date_from or not date_to:
+            return None
+        segments = self._get_obra_wage_index(employee).get(employee.id)
+        return self._get_costo_hora_from_index(segments, date_from, date_to)
+
+    @api.model
+    def _get_disease_index(self, worked_days):
+        # Incapacidades (hr.leave.disease) del lote en una sola lectura: {employee_id: [(disease_date, percentage), ...]}
+        payslips = worked_days.payslip_id
+        if not payslips:
+            return {}
+        diseases = self.env['hr.leave.disease'].search_read([('employee_id', 'in', payslips.employee_id.ids),
+            ('disease_date', '>=', min(payslips.mapped('date_from'))), ('disease_date', '<=', max(payslips.mapped('date_to')))],
+            ['employee_id', 'disease_date', 'percentage'])
+        index = {}
+        for disease in diseases:
+            index.setdefault(disease['employee_id'][0], []).append((disease['disease_date'], disease['percentage']))
+        return index
+
 
     @api.depends('is_paid', 'is_credit_time', 'number_of_hours', 'payslip_id', 'contract_id.wage', 'payslip_id.sum_worked_hours')
     def _compute_amount(self):
-        for worked_days in self:
-            if worked_days.payslip_id.edited or worked_days.payslip_id.state not in ['draft', 'verify']:
-                continue
+        # Lote: tarifas por obra e incapacidades se leen una vez para todas las líneas y la tarifa se calcula una vez por recibo
+        pending = self.filtered(lambda wd: not wd.payslip_id.edited and wd.payslip_id.state in ['draft', 'verify'])
+        hourly = pending.filtered(lambda wd: wd.contract_id and wd.code != 'OUT' and not wd.is_credit_time and wd.payslip_id.wage_type == 'hourly')
+        wage_index = self._get_obra_wage_index(hourly.payslip_id.employee_id)
+        disease_index = self._get_disease_index(hourly.filtered(lambda wd: wd.work_entry_type_id.code == 'LEAVE1200'))
+        costo_por_recibo = {}
+        for worked_days in pending:
             if not worked_days.contract_id or worked_days.code == 'OUT' or worked_days.is_credit_time:
                 worked_days.amount = 0
                 continue
-            if worked_days.payslip_id.wage_type == 'hourly':
-                costo_hora_obra = self._get_costo_hora_por_fecha(worked_days.payslip_id.employee_id, worked_days.payslip_id.date_from, 
-                    worked_days.payslip_id.date_to)
-                hourly_rate = costo_hora_obra if costo_hora_obra else worked_days.payslip_id.contract_id.hourly_wage
+            payslip = worked_days.payslip_id
+            if payslip.wage_type == 'hourly':
+                if payslip.id not in costo_por_recibo:
+                    costo_por_recibo[payslip.id] = self._get_costo_hora_from_index(wage_index.get(payslip.employee_id.id),
+                        payslip.date_from, payslip.date_to) if payslip.date_from and payslip.date_to else None
+                costo_hora_obra = costo_por_recibo[payslip.id]
+                hourly_rate = costo_hora_obra if costo_hora_obra else payslip.contract_id.hourly_wage
                 if costo_hora_obra:
                     daily_rate = hourly_rate * 8
                 else:
-                    daily_rate = worked_days.payslip_id.contract_id.daily_wage
+                    daily_rate = payslip.contract_id.daily_wage
 
                 #Horas extras
                 if worked_days.work_entry_type_id.code == 'OVERTIME':
@@ -961,14 +1345,14 @@ class HrPayslipWorkedDaysInherit(models.Model):
                 elif worked_days.work_entry_type_id.code in ('LEAVE90'):
                     worked_days.amount = 0
                 elif worked_days.work_entry_type_id.code in ('LEAVE1200'):
-                    percentage = self.env['hr.leave.disease'].search([('disease_date','>=',worked_days.payslip_id.date_from), 
-                        ('disease_date','<=',worked_days.payslip_id.date_to), ('employee_id','=',worked_days.payslip_id.employee_id.id)])
                     comp = 0
                     parcial = 0
                     amount = 0.0
-                    es_oficina = worked_days.payslip_id.employee_id.current_project_name == 'OFICINA'
-                    for x in percentage:
-                        if x.percentage == 100 or es_oficina:
+                    es_oficina = payslip.employee_id.current_project_name == 'OFICINA'
+                    for disease_date, percentage in disease_index.get(payslip.employee_id.id, []):
+                        if not (payslip.date_from <= disease_date <= payslip.date_to):
+                            continue
+                        if percentage == 100 or es_oficina:
                             comp += 1
                         else:
                             parcial += 1
@@ -982,7 +1366,7 @@ class HrPayslipWorkedDaysInherit(models.Model):
                 else:
                     worked_days.amount = daily_rate * worked_days.number_of_days if worked_days.is_paid else 0
             else:
-                worked_days.amount = worked_days.payslip_id.contract_id.contract_wage * worked_days.number_of_hours / (worked_days.payslip_id._get_regular_worked_hours() or 1) if worked_days.is_paid else 0
+                worked_days.amount = payslip.contract_id.contract_wage * worked_days.number_of_hours / (payslip._get_regular_worked_hours() or 1) if worked_days.is_paid else 0
 
 
 class HrPayslipProject(models.Model):
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from odoo import api, fields, models
+from odoo.tools import create_unique_index
+
+# Departamento de la nómina semanal para empleados sin contrato vigente
+DEPARTAMENTO_OPERACION = 'PERSONAL DE OPERACIÓN'
+SCHEDULES_SEMANAL = ['weekly']
+SCHEDULES_QUINCENAL = ['bi-weekly', 'monthly', 'bi_monthly', '10_days', '14_days', 'daily']
+
+
+class HrEmployeePayrollScope(models.Model):
+    _name = 'hr.employee.payroll.scope'
+    _description = 'Clasificación de Empleados por Nómina (semanal/quincenal)'
+    _table = 'employee_payroll_scope'
+    _log_access = False
+
+    # Tabla mantenida por los hooks de hr.employee, hr.contract y hr.department (refresh). Las restricciones por
+    # encargado_nomina (_encargado_nomina_extra_domain) hacen JOIN con ella en lugar de recalcular la clasificación.
+    employee_id = fields.Many2one('hr.employee', string='Empleado', required=True, ondelete='cascade')
+    semanal = fields.Boolean(string='Nómina Semanal', index=True)
+    quincenal = fields.Boolean(string='Nómina Quincenal', index=True)
+
+    def init(self):
+        # Índice único requerido por el ON CONFLICT de refresh; carga inicial y resincronización en cada actualización
+        create_unique_index(self.env.cr, 'employee_payroll_scope_employee_uniq', self._table, ['employee_id'])
+        self.refresh()
+
+    @api.model
+    def refresh(self, employee_ids=None):
+        """ Recalcula la clasificación de los empleados indicados (todos si employee_ids es None).
+        Solo empleados activos:
+        - semanal: contrato open/draft/close con schedule_pay semanal, o sin contratos (salvo cancelados) y del departamento de operación
+        - quincenal: contrato open/draft/close con schedule_pay quincenal, o sin contratos y de cualquier otro departamento (o sin departamento) """
+        if employee_ids is not None:
+            employee_ids = list(employee_ids)
+            if not employee_ids:
+                return
+        self.env['hr.employee'].flush_model(['active', 'department_id'])
+        self.env['hr.contract'].flush_model(['employee_id', 'state', 'schedule_pay'])
+        self.env['hr.department'].flush_model(['name'])
+        cr = self.env.cr
+        ids_filter = '' if employee_ids is None else 'AND he.id = ANY(%(ids)s)'
+        params = {'ids': employee_ids, 'semanal': SCHEDULES_SEMANAL, 'quincenal': SCHEDULES_QUINCENAL, 'oper': DEPARTAMENTO_OPERACION}
+        cr.execute(f"""
+            DELETE FROM employee_payroll_scope ps WHERE {'' if employee_ids is None else 'ps.employee_id = ANY(%(ids)s) AND'}
+                NOT EXISTS (SELECT 1 FROM hr_employee he WHERE he.id = ps.employee_id AND he.active = true)""", params)
+        cr.execute(f"""
+            INSERT INTO employee_payroll_scope (employee_id, semanal, quincenal)
+            SELECT he.id,
+                   EXISTS (SELECT 1 FROM hr_contract hc WHERE hc.employee_id = he.id AND hc.state IN ('open', 'draft', 'close')
+                           AND hc.schedule_pay = ANY(%(semanal)s))
+                   OR (sin_contrato AND COALESCE(hd.name->>'en_US' = %(oper)s OR hd.name->>'es_MX' = %(oper)s, false)),
+                   EXISTS (SELECT 1 FROM hr_contract hc WHERE hc.employee_id = he.id AND hc.state IN ('open', 'draft', 'close')
+                           AND hc.schedule_pay = ANY(%(quincenal)s))
+                   OR (sin_contrato AND COALESCE(hd.name IS NULL OR (hd.name->>'en_US' != %(oper)s AND hd.name->>'es_MX' != %(oper)s), false))
+              FROM hr_employee he
+              LEFT JOIN hr_department hd ON hd.id = he.department_id
+             CROSS JOIN LATERAL (SELECT NOT EXISTS (SELECT 1 FROM hr_contract hc WHERE hc.employee_id = he.id AND hc.state != 'cancel')
+                                 AS sin_contrato) sc
+             WHERE he.active = true {ids_filter}
+            ON CONFLICT (employee_id) DO UPDATE SET semanal = EXCLUDED.semanal, quincenal = EXCLUDED.quincenal""", params)
+        self.invalidate_model()
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models
+from odoo.tools import SQL
+from .hr_employee import (_encargado_nomina_extra_domain, _get_encargado_nomina_usuario, _get_employee_ids_by_schedule,)
+from datetime import datetime, time
+import hashlib
+import json
+import pytz
+import xlsxwriter
+
+REPORT_TZ = 'America/Mexico_City'
+REPORT_FETCH_SIZE = 2000   # Filas leídas del cursor por vuelta al escribir el reporte
+
+
+class ReporteAsistenciasMixin(models.AbstractModel):
+    _name = 'reporte.asistencias.mixin'
+    _description = 'Filtros y generación del Reporte de Asistencia'
+
+    employee_ids = fields.Many2many('hr.employee', string='Empleados')
+    department_ids = fields.Many2many('hr.department', string='Departamentos')
+    job_ids = fields.Many2many('hr.job', string='Puestos')
+    project_ids = fields.Many2many('project.project', string='Obras')
+    fecha_inicio = fields.Date(string='Fecha inicial', required=True, default=lambda self: fields.Date.today().replace(day=1))
+    fecha_fin = fields.Date(string='Fecha final', required=True, default=fields.Date.today)
+    tipo_pago = fields.Selection([('semanal', 'Semanal'), ('quincenal', 'Quincenal')],
+        string='Tipo de pago', help='Seleccione el tipo de nómina a reportar.')
+
+    def _get_report_filter_values(self):
+        self.ensure_one()
+        return {'employee_ids': [(6, 0, self.employee_ids.ids)], 'department_ids': [(6, 0, self.department_ids.ids)],
+            'job_ids': [(6, 0, self.job_ids.ids)], 'project_ids': [(6, 0, self.project_ids.ids)],
+            'fecha_inicio': self.fecha_inicio, 'fecha_fin': self.fecha_fin, 'tipo_pago': self.tipo_pago}
+
+    def _get_report_cache_key(self):
+        """ Hash de los filtros, la visibilidad por encargado_nomina del usuario, el idioma y el estado de los datos
+        (número de asistencias y última write_date de cada tabla cuyas columnas aparecen en el reporte: asistencias,
+        empleados, departamentos, puestos, contratos, tiempo extra y obras). """
+        self.ensure_one()
+        query = self.env['hr.attendance'].sudo()._search(self._get_report_domain())
+        for model in ('hr.attendance', 'hr.attendance.overtime', 'hr.contract', 'hr.employee', 'hr.department', 'hr.job',
+                      'project.project'):
+            self.env[model].flush_model()
+        self.env.cr.execute(SQL("""
+            WITH att AS (SELECT id, employee_id, project_id, check_in, write_date FROM hr_attendance WHERE id IN %(ids)s)
+            SELECT COUNT(*), MAX(write_date),
+                   (SELECT MAX(write_date) FROM hr_employee WHERE id IN (SELECT employee_id FROM att)),
+                   (SELECT MAX(hd.write_date) FROM hr_department hd JOIN hr_employee he ON he.department_id = hd.id
+                     WHERE he.id IN (SELECT employee_id FROM att)),
+                   (SELECT MAX(hj.write_date) FROM hr_job hj JOIN hr_employee he ON he.job_id = hj.id
+                     WHERE he.id IN (SELECT employee_id FROM att)),
+                   (SELECT MAX(write_date) FROM hr_contract WHERE employee_id IN (SELECT employee_id FROM att)),
+                   (SELECT MAX(write_date) FROM hr_attendance_overtime WHERE employee_id IN (SELECT employee_id FROM att)
+                       AND date BETWEEN (SELECT MIN(check_in::date) FROM att) AND (SELECT MAX(check_in::date) FROM att)),
+                   (SELECT MAX(write_date) FROM project_project WHERE id IN (SELECT project_id FROM att))
+              FROM att""", ids=query.subselect()))
+        data = [str(value) for value in self.env.cr.fetchone()]
+        enc, own_id = self.env['hr.employee']._get_encargado_visibility(self.env.uid)
+        payload = {
+            'employee_ids': sorted(self.employee_ids.ids), 'department_ids': sorted(self.department_ids.ids),
+            'job_ids': sorted(self.job_ids.ids), 'project_ids': sorted(self.project_ids.ids),
+            'fecha_inicio': str(self.fecha_inicio), 'fecha_fin': str(self.fecha_fin), 'tipo_pago': self.tipo_pago or '',
+            'visibilidad': [enc or '', own_id or 0, _get_encargado_nomina_usuario(self.env) or ''],
+            'lang': self.env.lang or '', 'data': data,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _get_report_domain(self):
+        """ Dominio de hr.attendance del reporte: periodo (en hora local), filtros del asistente y
+        restricción por encargado_nomina del usuario del entorno. """
+        self.ensure_one()
+        tz = pytz.timezone(REPORT_TZ)
+        dt_inicio = tz.localize(datetime.combine(self.fecha_inicio, time.min)).astimezone(pytz.utc).replace(tzinfo=None)
+        dt_fin    = tz.localize(datetime.combine(self.fecha_fin,    time.max)).astimezone(pytz.utc).replace(tzinfo=None)
+        domain = [('check_in', '>=', dt_inicio), ('check_in', '<=', dt_fin)]
+        if self.employee_ids:
+            domain.append(('employee_id', 'in', self.employee_ids.ids))
+        if self.department_ids:
+            domain.append(('employee_id.department_id', 'in', self.department_ids.ids))
+        if self.job_ids:
+            domain.append(('employee_id.job_id', 'in', self.job_ids.ids))
+        if self.project_ids:
+            emp_ids_obra = self.env['hr.employee.obra'].sudo().search([
+                ('project_id', 'in', self.project_ids.ids)
+            ]).mapped('employee_id').ids
+            domain.append(('employee_id', 'in', emp_ids_obra if emp_ids_obra else [-1]))
+
+        # Restricción por encargado_nomina:
+        # - semanal/quincenal: filtro automático por schedule_pay
+        # - ambas + tipo_pago elegido: filtrar por el tipo_pago seleccionado en el wizard
+        # - admin/HR manager sin enc: sin restricción adicional
+        enc = _get_encargado_nomina_usuario(self.env)
+        if enc == 'ambas' and self.tipo_pago:
+            emp_ids = _get_employee_ids_by_schedule(self.env, self.tipo_pago)
+            if emp_ids:
+                domain.append(('employee_id', 'in', emp_ids))
+            else:
+                domain.append(('employee_id', 'in', [-1]))
+        else:
+            extra = _encargado_nomina_extra_domain(self.env)
+            if extra:
+                domain += extra
+        return domain
+
+    def _get_report_filename(self):
+        self.ensure_one()
+        return 'Reporte_Asistencias_%s_%s.xlsx' % (self.fecha_inicio.strftime('%Y%m%d'), self.fecha_fin.strftime('%Y%m%d'))
+
+    def _execute_report_query(self):
+        """ Ejecuta en self.env.cr la consulta del reporte: asistencias con empleado, departamento, puesto, obra,
+        tiempo extra del día y tipo de pago del contrato abierto, ya ordenadas por obra, empleado y entrada.
+        El orden usa COLLATE "C" para coincidir con el orden de cadenas de Python del reporte original. """
+        self.ensure_one()
+        Attendance = self.env['hr.attendance'].sudo()
+        query = Attendance._search(self._get_report_domain())
+        for model, fnames in (('hr.attendance', ['employee_id', 'check_in', 'check_out', 'project_id']),
+                              ('hr.attendance.overtime', ['employee_id', 'date', 'duration']),
+                              ('hr.contract', ['employee_id', 'state', 'schedule_pay']),
+                              ('hr.employee', ['name', 'department_id', 'job_id', 'current_project_name'])):
+            self.env[model].flush_model(fnames)
+        lang = self.env.lang or 'en_US'
+        self.env.cr.execute(SQL("""
+            SELECT he.name, COALESCE(hd.name->>%(lang)s, hd.name->>'en_US'), COALESCE(hj.name->>%(lang)s, hj.name->>'en_US'),
+                   COALESCE(pp.name->>%(lang)s, pp.name->>'en_US', he.current_project_name, ''),
+                   ha.check_in, ha.check_out, ot.duration, hc.schedule_pay
+              FROM hr_attendance ha
+              JOIN hr_employee he ON he.id = ha.employee_id
+              LEFT JOIN hr_department hd ON hd.id = he.department_id
+              LEFT JOIN hr_job hj ON hj.id = he.job_id
+              LEFT JOIN project_project pp ON pp.id = ha.project_id
+              LEFT JOIN LATERAL (SELECT hao.duration FROM hr_attendance_overtime hao
+                                  WHERE hao.employee_id = ha.employee_id AND hao.date = ha.check_in::date
+                                  ORDER BY hao.id LIMIT 1) ot ON true
+              LEFT JOIN LATERAL (SELECT c.schedule_pay FROM hr_contract c WHERE c.employee_id = ha.employee_id AND c.state = 'open'
+                                  ORDER BY c.date_start DESC, c.id DESC LIMIT 1) hc ON true
+             WHERE ha.id IN %(ids)s
+             ORDER BY COALESCE(pp.name->>%(lang)s, pp.name->>'en_US', he.current_project_name, '') COLLATE "C",
+                      COALESCE(he.name, '') COLLATE "C", ha.check_in, ha.id""",
+            lang=lang, ids=query.subselect()))
+
+    def _write_report_xlsx(self, path):
+        """ Escribe el reporte en el archivo path con xlsxwriter en modo constant_memory: las filas se leen del cursor
+        por bloques y se vuelcan a disco conforme se escriben, la memoria no crece con el tamaño del periodo. """
+        self.ensure_one()
+        tz = pytz.timezone(REPORT_TZ)
+        fecha_inicio = self.fecha_inicio
+        fecha_fin    = self.fecha_fin
+        enc = _get_encargado_nomina_usuario(self.env)
+        wb = xlsxwriter.Workbook(path, {'constant_memory': True})
+        ws = wb.add_worksheet('Asistencias')
+
+        fmt_titulo = wb.add_format({'font_name': 'Arial', 'font_size': 14, 'bold': 1, 'valign': 'vcenter', 'align': 'center',})
+        fmt_periodo = wb.add_format({'font_name': 'Arial', 'font_size': 11, 'bold': 1, 'valign': 'vcenter', 'align': 'center',})
+        fmt_encabezado = wb.add_format({'font_name': 'Arial', 'font_size': 11, 'bold': 1, 'valign': 'vcenter', 'align': 'center', 
+            'top': 1, 'bottom': 1, 'left': 1, 'right': 1, 'bg_color': '#D9D9D9',})
+        fmt_normal = wb.add_format({'font_name': 'Arial', 'font_size': 10, 'valign': 'vcenter', 'align': 'left', 'top': 1, 'bottom': 1, 'left': 1, 'right': 1})
+        fmt_centro = wb.add_format({'font_name': 'Arial', 'font_size': 10, 'valign': 'vcenter', 'align': 'center', 'top': 1, 'bottom': 1, 'left': 1, 'right': 1})
+
+        # Anchos columnas — se agrega col I para Tipo de Pago
+        for col, ancho in enumerate([35, 25, 25, 30, 15, 18, 15, 18, 15, 15]):
+            ws.set_column(col, col, ancho)
+
+        ws.set_row(0, 22)
+        ws.set_row(1, 18)
+        ws.set_row(2, 18)
+
+        # Etiqueta de tipo de pago para título
+        tipo_label = ''
+        if enc == 'ambas' and self.tipo_pago:
+            tipo_label = ' — ' + dict([('semanal', 'Semanal'), ('quincenal', 'Quincenal')]).get(self.tipo_pago, '')
+
+        # Fila 1: Título
+        ws.merge_range(0, 0, 0, 9, 'Reporte de asistencia de personal' + tipo_label, fmt_titulo)
+        # Fila 2: Periodo
+        ws.merge_range(1, 0, 1, 9,
+            'Periodo %s - %s' % (fecha_inicio.strftime('%d/%m/%Y'), fecha_fin.strftime('%d/%m/%Y')),
+            fmt_periodo)
+
+        # Fila 3: Encabezados
+        for col, nombre in enumerate(['Nombre', 'Departamento', 'Puesto', 'Obra', 'Fecha', 'Hora de Entrada', 'Fecha de Salida', 'Hora de Salida', 'Tiempo Extra', 'Tipo de Pago']):
+            ws.write(2, col, nombre, fmt_encabezado)
+
+        # Datos (en constant_memory cada fila se escribe completa y en orden)
+        self._execute_report_query()
+        fila = 3
+        while True:
+            rows = self.env.cr.fetchmany(REPORT_FETCH_SIZE)
+            if not rows:
+                break
+            for emp_name, departamento, puesto, obra, check_in, check_out, duration, schedule_pay in rows:
+                check_in_local  = pytz.utc.localize(check_in ).astimezone(tz) if check_in  else None
+                check_out_local = pytz.utc.localize(check_out).astimezone(tz) if check_out else None
+                tiempo_extra = ''
+                if duration and duration > 0:
+                    horas   = int(duration)
+                    minutos = int((duration - horas) * 60)
+                    tiempo_extra = '%02d:%02d' % (horas, minutos)
+
+                # Tipo de pago del empleado desde su contrato activo
+                tipo_pago_emp = ''
+                if schedule_pay:
+                    tipo_pago_emp = 'Semanal' if schedule_pay == 'weekly' else 'Quincenal'
+
+                ws.set_row(fila, 15)
+                ws.write(fila, 0, emp_name or '', fmt_normal)
+                ws.write(fila, 1, departamento or '', fmt_centro)
+                ws.write(fila, 2, puesto or '', fmt_centro)
+                ws.write(fila, 3, obra or '', fmt_centro)
+                ws.write(fila, 4, check_in_local.strftime('%d/%m/%Y') if check_in_local else '', fmt_centro)
+                ws.write(fila, 5, check_in_local.strftime('%H:%M') if check_in_local else '', fmt_centro)
+                ws.write(fila, 6, check_out_local.strftime('%d/%m/%Y') if check_out_local else '', fmt_centro)
+                ws.write(fila, 7, check_out_local.strftime('%H:%M') if check_out_local else '', fmt_centro)
+                ws.write(fila, 8, tiempo_extra, fmt_centro)
+                ws.write(fila, 9, tipo_pago_emp, fmt_centro)
+                fila += 1
+
+        wb.close()
+        return fila - 3
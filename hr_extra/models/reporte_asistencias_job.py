@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+from odoo import api, fields, models
+from odoo.exceptions import UserError
+from datetime import datetime, timedelta
+import logging
+import os
+import tempfile
+import threading
+
+_logger = logging.getLogger(__name__)
+
+JOB_RETENTION_DAYS = 7   # Días que se conservan los reportes generados (y sus adjuntos) como caché
+JOB_TIMEOUT_HOURS = 2    # Tiempo máximo en 'running'; después se asume que el worker murió y el trabajo pasa a error
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class ReporteAsistenciasJob(models.Model):
+    _name = 'reporte.asistencias.job'
+    _inherit = ['reporte.asistencias.mixin']
+    _description = 'Reporte de Asistencia en Segundo Plano'
+    _order = 'create_date desc, id desc'
+
+    user_id = fields.Many2one('res.users', string='Solicitado por', required=True, default=lambda self: self.env.user, index=True)
+    lang = fields.Char(string='Idioma')
+    state = fields.Selection([('pending', 'En cola'), ('running', 'En proceso'), ('done', 'Terminado'), ('error', 'Error')],
+        string='Estado', default='pending', required=True, index=True)
+    cache_key = fields.Char(string='Llave de caché', index=True, readonly=True,
+        help='Hash de los filtros, la visibilidad del usuario y la última modificación de los datos del reporte')
+    cached = fields.Boolean(string='Desde caché', readonly=True)
+    attachment_id = fields.Many2one('ir.attachment', string='Archivo', ondelete='set null', readonly=True)
+    date_start = fields.Datetime(string='Inicio')
+    date_end = fields.Datetime(string='Fin')
+    duration = fields.Float(string='Duración (seg)', digits=(16, 2))
+    total_rows = fields.Integer(string='Registros')
+    error = fields.Text(string='Error')
+
+    @api.depends('fecha_inicio', 'fecha_fin')
+    def _compute_display_name(self):
+        for job in self:
+            job.display_name = 'Asistencias %s - %s' % (job.fecha_inicio and job.fecha_inicio.strftime('%d/%m/%Y') or '',
+                job.fecha_fin and job.fecha_fin.strftime('%d/%m/%Y') or '')
+
+    @api.model
+    def _request_report(self, wizard):
+        """ Atiende la solicitud del asistente: si existe un reporte terminado con la misma llave (mismos filtros,
+        visibilidad y datos sin cambios) se entrega de inmediato; si ya hay uno igual en proceso se reutiliza;
+        en otro caso se encola un trabajo y se despierta al cron. """
+        vals = wizard._get_report_filter_values()
+        cache_key = wizard._get_report_cache_key()
+        previous = self.sudo().search([('cache_key', '=', cache_key), ('state', 'in', ('pending', 'running', 'done'))],
+            order='create_date desc, id desc', limit=1)
+        if previous.state == 'done' and previous.attachment_id:
+            job = self.create({**vals, 'lang': self.env.lang, 'state': 'done', 'cache_key': cache_key, 'cached': True,
+                'attachment_id': previous.attachment_id.id, 'total_rows': previous.total_rows,
+                'date_start': fields.Datetime.now(), 'date_end': fields.Datetime.now()})
+            return job.action_download()
+        if previous and previous.user_id == self.env.user:
+            return previous._get_form_action()
+        job = self.create({**vals, 'lang': self.env.lang, 'cache_key': cache_key})
+        cron = self.env.ref('hr_extra.ir_cron_reporte_asistencias_job', False)
+        if cron:
+            cron.sudo()._trigger()
+        return job._get_form_action()
+
+    def _get_form_action(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
+
+    def action_download(self):
+        self.ensure_one()
+        if self.state != 'done' or not self.attachment_id:
+            raise UserError('El reporte aún no está disponible.')
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/web/binary/hr_reporte_asistencias_job/%s' % self.id,
+            'target': 'new',
+        }
+
+    def _claim_pending(self):
+        """ Reserva el siguiente trabajo en cola (FOR UPDATE SKIP LOCKED) para que varios workers no tomen el mismo. """
+        self.env.cr.execute('''SELECT id FROM reporte_asistencias_job WHERE state = 'pending'
+            ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED''')
+        row = self.env.cr.fetchone()
+        return self.browse(row[0]) if row else self.browse()
+
+    def _generate(self):
+        """ Genera el XLSX con el usuario e idioma del solicitante (misma visibilidad que el reporte directo)
+        y lo guarda como ir.attachment del trabajo. """
+        self.ensure_one()
+        job = self.with_user(self.user_id).with_context(lang=self.lang or self.user_id.lang)
+        fd, path = tempfile.mkstemp(prefix='reporte_asistencias_', suffix='.xlsx')
+        os.close(fd)
+        try:
+            total_rows = job._write_report_xlsx(path)
+            # El XLSX ya va comprimido; se guarda con la API normal de ir.attachment (almacenamiento, mimetype e índice)
+            with open(path, 'rb') as report_file:
+                content = report_file.read()
+        finally:
+            os.unlink(path)
+        attachment = self.env['ir.attachment'].sudo().create({'name': job._get_report_filename(), 'raw': content,
+            'mimetype': XLSX_MIMETYPE, 'res_model': self._name, 'res_id': self.id})
+        return attachment, total_rows
+
+    @api.model
+    def _fail_stale_jobs(self):
+        """ Pasa a error los trabajos que llevan más de JOB_TIMEOUT_HOURS en 'running' (el worker se reinició o
+        murió a media generación); de lo contrario quedarían en proceso para siempre y _request_report los reutilizaría. """
+        limit = fields.Datetime.now() - timedelta(hours=JOB_TIMEOUT_HOURS)
+        stale = self.sudo().search([('state', '=', 'running'), ('date_start', '<', limit)])
+        if stale:
+            _logger.warning(f'Reportes de asistencias sin terminar después de {JOB_TIMEOUT_HOURS} h: {stale.ids}')
+            stale.write({'state': 'error', 'date_end': fields.Datetime.now(),
+                'error': f'El reporte no terminó en {JOB_TIMEOUT_HOURS} horas; vuelva a solicitarlo.'})
+        return stale
+
+    @api.model
+    def _cron_process_jobs(self):
+        """ Procesa los trabajos en cola, cada uno en su propia transacción, y depura los vencidos. """
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        self._fail_stale_jobs()
+        if auto_commit:
+            self.env.cr.commit()
+        processed = 0
+        while True:
+            # sudo: el usuario del cron no necesariamente pertenece a los grupos de RRHH de la regla de registro
+            job = self.sudo()._claim_pending()
+            if not job:
+                break
+            start = datetime.now()
+            job.write({'state': 'running', 'date_start': start})
+            # El estado 'running' se confirma antes de generar: el usuario ve el avance y, si el worker muere,
+            # _fail_stale_jobs lo detecta en una ejecución posterior
+            if auto_commit:
+                self.env.cr.commit()
+            try:
+                with self.env.cr.savepoint():
+                    attachment, total_rows = job._generate()
+                job.write({'state': 'done', 'attachment_id': attachment.id, 'total_rows': total_rows, 'date_end': datetime.now(),
+                    'duration': (datetime.now() - start).total_seconds()})
+            except Exception as e:
+                _logger.error(f'Reporte de asistencias {job.id}: {str(e)}', exc_info=True)
+                job.write({'state': 'error', 'error': str(e), 'date_end': datetime.now()})
+            processed += 1
+            if auto_commit:
+                self.env.cr.commit()
+        self._gc_jobs()
+        return processed
+
+    @api.model
+    def _gc_jobs(self):
+        """ Elimina los trabajos vencidos y los adjuntos que ningún trabajo vigente referencia. """
+        limit = fields.Datetime.now() - timedelta(days=JOB_RETENTION_DAYS)
+        old_jobs = self.sudo().search([('create_date', '<', limit)])
+        if not old_jobs:
+            return
+        attachments = old_jobs.attachment_id
+        old_jobs.unlink()
+        in_use = self.sudo().search([('attachment_id', 'in', attachments.ids)]).attachment_id
+        (attachments - in_use).unlink()
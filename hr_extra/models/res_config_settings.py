@@ -3,6 +3,7 @@ from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError, UserError
 import secrets
 import logging
+from .checador_api_cache import checador_api_cache
 
 _logger = logging.getLogger(__name__)
 
@@ -53,6 +54,7 @@ class ResConfigSettings(models.TransientModel):
         IrConfigParam.set_param('api_checadores.username', self.api_checadores_username or '')
         if self.api_checadores_jwt_secret:
             IrConfigParam.set_param('api_checadores.jwt_secret', self.api_checadores_jwt_secret)
+        checador_api_cache.invalidate(self.env)
 
     def action_view_attendance_logs(self):
         self.ensure_one()
@@ -93,6 +95,7 @@ ESTADÍSTICAS DE PROCESAMIENTO
         new_secret = secrets.token_urlsafe(32)
         self.env['ir.config_parameter'].sudo().set_param('api_checadores.jwt_secret', new_secret)
         self.api_checadores_jwt_secret = new_secret
+        checador_api_cache.invalidate(self.env)
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
@@ -130,6 +133,9 @@ ESTADÍSTICAS DE PROCESAMIENTO
             
             self.env.cr.execute("SELECT value FROM ir_config_parameter WHERE key = 'api_checadores.password'")
             result = self.env.cr.fetchone()
+            # El UPDATE directo no pasa por set_param: se limpia el ormcache y los tokens verificados en memoria
+            self.env.registry.clear_cache()
+            checador_api_cache.invalidate(self.env)
             self.api_checadores_password = False
             
             return {
@@ -1 +1,2 @@
 from . import test_office_payroll
+from . import test_ctrol_asistencias_import
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Pruebas del motor de importación por lotes de ctrol.asistencias -> hr.attendance (process_pending_logs).
+# Verifica que el emparejamiento en memoria conserve las reglas de _map_to_attendance y el detalle de error por registro.
+
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+
+
+@tagged('post_install', '-at_install', 'ctrol_asistencias')
+class TestCtrolAsistenciasImport(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        env = cls.env
+        cls.env['ir.config_parameter'].sudo().set_param('api_checadores.username', '')
+        cls.env.company.resource_calendar_id.tz = 'America/Mexico_City'
+
+        cls.project = env['project.project'].create({'name': 'QA OBRA CHECADOR'})
+        cls.struct_type = env['hr.payroll.structure.type'].search([('name', '=', 'Mexico: Employee')], limit=1)
+        cls.type_obra = env['hr.contract.type'].search([('name', '=', 'Obra determinada')], limit=1)
+
+        cls.partner = env['res.partner'].create({'name': 'QA CHECADOR UNO', 'company_type': 'person', 'is_employee': True})
+        cls.employee = env['hr.employee'].create({'name': 'QA CHECADOR UNO', 'legal_name': 'QA CHECADOR UNO',
+            'work_contact_id': cls.partner.id})
+        cls.employee.registration_number = 'QA-90001'
+        env['hr.employee.obra'].create({'employee_id': cls.employee.id, 'project_id': cls.project.id,
+            'fecha_inicio': '2026-06-01', 'hourly_wage': 50.0})
+        env['hr.contract'].create({'name': 'QA Contrato Checador', 'employee_id': cls.employee.id, 'state': 'open',
+            'wage_type': 'hourly', 'wage': 0.0, 'date_start': '2026-01-01', 'structure_type_id': cls.struct_type.id,
+            'contract_type_id': cls.type_obra.id, 'resource_calendar_id': env.ref('resource.resource_calendar_std').id})
+
+    def _punch(self, check_type, local_dt, number='QA-90001'):
+        return self.env['ctrol.asistencias'].create_from_checador({'registration_number': number, 'check_type': check_type,
+            'check_date': local_dt, 'status': 'success'})
+
+    def test_entrada_salida_mismo_lote(self):
+        """Entrada y salida pendientes en el mismo lote generan un solo hr.attendance cerrado."""
+        entrada = self._punch('entrada', '2026-06-03T08:00:00')
+        salida = self._punch('salida', '2026-06-03T18:00:00')
+        result = self.env['ctrol.asistencias'].process_pending_logs()
+        self.assertEqual(result['exitosos'], 2)
+        self.assertEqual(entrada.log_status, 'importada')
+        self.assertEqual(salida.log_status, 'importada')
+        self.assertEqual(entrada.attendance_id, salida.attendance_id)
+        self.assertTrue(entrada.attendance_id.check_out)
+        self.assertEqual(entrada.attendance_id.project_id, self.project)
+
+    def test_errores_por_registro(self):
+        """Cada registro rechazado conserva su propio mensaje de error."""
+        desconocido = self._punch('entrada', '2026-06-04T08:00:00', number='QA-NOEXISTE')
+        salida_sola = self._punch('salida', '2026-06-04T18:00:00')
+        result = self.env['ctrol.asistencias'].process_pending_logs()
+        self.assertEqual(result['errores'], 2)
+        self.assertEqual(desconocido.log_status, 'error')
+        self.assertIn('Empleado no encontrado', desconocido.log_message)
+        self.assertEqual(salida_sola.log_status, 'error')
+        self.assertIn('Salida sin entrada previa', salida_sola.log_message)
+
+    def test_entrada_duplicada_del_dia(self):
+        """Una segunda entrada del mismo día se rechaza aunque la primera se cree en el mismo lote."""
+        primera = self._punch('entrada', '2026-06-05T08:00:00')
+        segunda = self._punch('entrada', '2026-06-05T09:00:00')
+        self.env['ctrol.asistencias'].process_pending_logs()
+        self.assertEqual(primera.log_status, 'importada')
+        self.assertEqual(segunda.log_status, 'error')
+        self.assertIn('Ya existe entrada del día', segunda.log_message)
+        self.assertIn(str(primera.attendance_id.id), segunda.log_message)
+
+    def test_conteo_checadas_por_dia_local(self):
+        """El conteo por día local usa la hora del checador y se ajusta al eliminar registros."""
+        Ctrol = self.env['ctrol.asistencias']
+        primera = self._punch('entrada', '2026-06-06T23:30:00')
+        self._punch('salida', '2026-06-06T23:50:00')
+        self.assertEqual(primera.check_day_local.isoformat(), '2026-06-06')
+        key = ('QA-90001', primera.check_day_local)
+        self.assertEqual(Ctrol.count_checks_by_local_day([key]).get(key), 2)
+        primera.unlink()
+        self.assertEqual(Ctrol.count_checks_by_local_day([key]).get(key), 1)
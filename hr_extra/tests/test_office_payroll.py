@@ -13,9 +13,13 @@
 #   - structure_type: 'Mexico: Employee'; calendario: ref resource.resource_calendar_std
 #   - sueldo de oficina vive en daily_wage/hourly_wage (no en wage mensual)
 
+from datetime import date, datetime, timedelta
+
 from odoo.tests.common import TransactionCase
 from odoo.tests import tagged
 
+from odoo.addons.hr_extra.models.hr_employee import WORK_HOURS_PREFETCH_KEY
+
 
 @tagged('post_install', '-at_install', 'office_payroll')
 class TestOfficePayroll(TransactionCase):
@@ -181,3 +185,133 @@ class TestOfficePayroll(TransactionCase):
         self.contract_ofi.write({'hourly_wage': 0.0, 'daily_wage': 0.0})
         with self.assertRaises(UserError):
             self._make_payslip(self.emp_ofi, self.contract_ofi)
+
+    def test_costo_hora_promedio_por_obra(self):
+        """La tarifa por hora del periodo pondera los días de cada obra vigente (índice por tramos)."""
+        obra = self.env['hr.employee.obra'].search([('employee_id', '=', self.emp_obr.id)])
+        obra.write({'fecha_fin': '2026-06-10'})
+        project2 = self.env['project.project'].create({'name': 'QA OBRA PROJECT DOS'})
+        self.env['hr.employee.obra'].create({'employee_id': self.emp_obr.id, 'project_id': project2.id,
+            'fecha_inicio': '2026-06-11', 'hourly_wage': 60.0})
+        WorkedDays = self.env['hr.payslip.worked_days']
+        costo = WorkedDays._get_costo_hora_por_fecha(self.emp_obr, date(2026, 6, 1), date(2026, 6, 15))
+        self.assertAlmostEqual(costo, (50.0 * 10 + 60.0 * 5) / 15, places=6)
+        # Periodo anterior a cualquier obra: sin tarifa por obra
+        self.assertIsNone(WorkedDays._get_costo_hora_por_fecha(self.emp_obr, date(2026, 5, 1), date(2026, 5, 15)))
+
+    def test_horas_lote_igual_a_individual(self):
+        """Las líneas de días trabajados del cálculo por lote (precarga en cr.cache) coinciden con el cálculo
+        individual de cada recibo sin precarga."""
+        self._att(self.emp_obr, '2026-06-06 13:00:00', '2026-06-07 00:00:00')  # sábado 11h
+        self._att(self.emp_obr, '2026-06-07 13:00:00', '2026-06-07 20:00:00')  # domingo 7h
+        self._att(self.emp_ofi, '2026-06-03 13:00:00', '2026-06-04 00:00:00')
+        slips = self.env['hr.payslip']
+        for emp, contract in ((self.emp_ofi, self.contract_ofi), (self.emp_obr, self.contract_obr)):
+            slips |= self.env['hr.payslip'].create({'name': 'QA Horas %s' % emp.name, 'employee_id': emp.id,
+                'contract_id': contract.id, 'date_from': '2026-06-01', 'date_to': '2026-06-15'})
+
+        def _lines(values):
+            return sorted((v['work_entry_type_id'], round(v['number_of_hours'], 4), round(v['number_of_days'], 4)) for v in values)
+
+        # Ruta individual: un recibo a la vez, sin precarga del lote
+        esperado = {}
+        for slip in slips:
+            self.assertNotIn(WORK_HOURS_PREFETCH_KEY, self.env.cr.cache)
+            esperado[slip.id] = _lines(slip._get_worked_day_lines())
+
+        # Ruta por lote: _compute_worked_days_line_ids precarga los agregados de todos los contratos
+        slips._compute_worked_days_line_ids()
+        self.assertNotIn(WORK_HOURS_PREFETCH_KEY, self.env.cr.cache)
+        for slip in slips:
+            obtenido = _lines({'work_entry_type_id': line.work_entry_type_id.id, 'number_of_hours': line.number_of_hours,
+                'number_of_days': line.number_of_days} for line in slip.worked_days_line_ids)
+            self.assertEqual(obtenido, esperado[slip.id], slip.employee_id.name)
+
+        dfrom, dto = datetime(2026, 6, 1, 6), datetime(2026, 6, 16, 5, 59, 59)
+        lote = (self.contract_ofi | self.contract_obr)._get_work_hours_batch_data(dfrom, dto)
+        self.assertGreater(lote[self.contract_obr.id]['sab_exc'], 0.0)
+        self.assertGreater(lote[self.contract_obr.id]['dom_h'], 0.0)
+
+    def test_calculo_lote_en_segundo_plano(self):
+        """El lote valida inconsistencias en una consulta y los workers calculan los recibos en cola por bloques."""
+        run = self.env['hr.payslip.run'].create({'name': 'QA Lote', 'date_start': '2026-06-01', 'date_end': '2026-06-15'})
+        slips = self.env['hr.payslip']
+        for emp, contract in ((self.emp_ofi, self.contract_ofi), (self.emp_obr, self.contract_obr)):
+            slips |= self.env['hr.payslip'].create({'name': 'QA Lote %s' % emp.name, 'employee_id': emp.id,
+                'contract_id': contract.id, 'payslip_run_id': run.id, 'date_from': '2026-06-01', 'date_to': '2026-06-15'})
+        self.assertFalse(slips._get_inconsistent_payslip_ids())
+        run.action_compute_sheet_async()
+        self.assertEqual(run.compute_state, 'running')
+        self.assertTrue(all(slips.mapped('compute_queued')))
+        self.env['hr.payslip']._cron_compute_sheet_queue(chunk_size=1)
+        run.invalidate_recordset()
+        self.assertEqual(run.compute_done, 2)
+        self.assertEqual(run.compute_progress, 100.0)
+        self.assertFalse(any(slips.mapped('compute_queued')))
+        self.assertTrue(all(slips.mapped('line_ids')))
+
+    def test_inconsistencia_agrupada(self):
+        """Una asistencia de más de 16h marca solo el recibo de ese empleado."""
+        self._att(self.emp_obr, '2026-06-03 06:00:00', '2026-06-04 00:00:00')  # 18h
+        slips = self.env['hr.payslip']
+        for emp, contract in ((self.emp_ofi, self.contract_ofi), (self.emp_obr, self.contract_obr)):
+            slips |= self.env['hr.payslip'].create({'name': 'QA Inc %s' % emp.name, 'employee_id': emp.id,
+                'contract_id': contract.id, 'date_from': '2026-06-01', 'date_to': '2026-06-15'})
+        self.assertEqual(slips._get_inconsistent_payslip_ids(), {slips[1].id})
+
+    def test_reparto_por_obra_remanente(self):
+        """Con dos obras, la primera cobra sus días a tarifa y la última el remanente del salario."""
+        project2 = self.env['project.project'].create({'name': 'QA OBRA PROJECT TRES'})
+        self._att(self.emp_obr, '2026-06-02 13:00:00', '2026-06-02 23:00:00')
+        self._att(self.emp_obr, '2026-06-03 13:00:00', '2026-06-03 23:00:00')
+        self.env['hr.attendance'].create({'employee_id': self.emp_obr.id, 'project_id': project2.id,
+            'check_in': '2026-06-04 13:00:00', 'check_out': '2026-06-04 20:00:00', 'hourly_wage': 60.0})
+        slip = self._make_payslip(self.emp_obr, self.contract_obr)
+        reparto = self.env['hr.payslip.project'].search([('payslip_id', '=', slip.id)])
+        self.assertEqual(set(reparto.mapped('project_id').ids), {self.project.id, project2.id})
+        salary = sum(slip.worked_days_line_ids.mapped('amount'))
+        self.assertAlmostEqual(sum(reparto.mapped('importe')), salary, places=2)
+        # Recalcular no duplica filas
+        slip.calculate_project()
+        self.assertEqual(self.env['hr.payslip.project'].search_count([('payslip_id', '=', slip.id)]), 2)
+
+    def test_llave_aniversario_por_contrato(self):
+        """La llave de aniversario sigue al primer contrato y se actualiza al cambiar sus fechas."""
+        self.assertEqual(self.emp_ofi.anniversary_key, '01-01')
+        self.contract_ofi.write({'date_start': '2025-03-15'})
+        self.assertEqual(self.emp_ofi.anniversary_key, '03-15')
+
+    def test_antiguedad_temporales(self):
+        """cron_antique y _calc_antique_temporal encadenan contratos temporales con brechas de hasta 10 días,
+        toman como fin el date_end del último contrato cerrado y no cuentan contratos permanentes."""
+        today = date.today()
+        Employee = self.env['hr.employee']
+
+        def _emp(name, contratos):
+            emp = Employee.create({'name': name, 'legal_name': name})
+            for i, (contract_type, inicio, fin, state) in enumerate(contratos):
+                self.env['hr.contract'].create({'name': '%s %s' % (name, i), 'employee_id': emp.id, 'wage': 0.0,
+                    'structure_type_id': self.struct_type.id, 'resource_calendar_id': self.calendar.id,
+                    'contract_type_id': contract_type.id, 'state': state,
+                    'date_start': today - timedelta(days=inicio), 'date_end': fin and today - timedelta(days=fin)})
+            return emp
+
+        # Brecha de 10 días: la antigüedad corre desde el primer contrato (1200 días)
+        brecha_10 = _emp('QA ANTIG BRECHA 10', [(self.type_obra, 1200, 400, 'close'), (self.type_obra, 390, None, 'open')])
+        # Brecha de 11 días: se reinicia desde el último contrato (389 días)
+        brecha_11 = _emp('QA ANTIG BRECHA 11', [(self.type_obra, 1200, 400, 'close'), (self.type_obra, 389, None, 'open')])
+        # Último contrato cerrado: el bloque termina en su date_end (1200 - 450 = 750 días), no hoy
+        cerrado = _emp('QA ANTIG CERRADO', [(self.type_obra, 1200, 700, 'close'), (self.type_obra, 695, 450, 'close')])
+        # Solo contratos permanentes: no hay antigüedad temporal; el cron aplica la regla del contrato vigente
+        permanente = _emp('QA ANTIG PERMANENTE', [(self.type_oficina, 1200, None, 'open')])
+
+        self.env['hr.employee'].cron_antique()
+        self.assertEqual(brecha_10.antique, 3)
+        self.assertEqual(brecha_11.antique, 1)
+        self.assertEqual(cerrado.antique, 2)
+        self.assertEqual(permanente.antique, 3)
+
+        self.assertEqual(Employee._calc_antique_temporal(brecha_10.id), 3)
+        self.assertEqual(Employee._calc_antique_temporal(brecha_11.id), 1)
+        self.assertEqual(Employee._calc_antique_temporal(cerrado.id), 2)
+        self.assertEqual(Employee._calc_antique_temporal(permanente.id), 0)
@@ -6,16 +6,9 @@ from odoo.addons.hr_extra.models.hr_employee import _get_encargado_nomina_usuari
 
 class WizardReporteAsistencias(models.TransientModel):
     _name = 'wizard.reporte.asistencias'
+    _inherit = ['reporte.asistencias.mixin']
     _description = 'Reporte de Asistencia de Checadores'
 
-    employee_ids = fields.Many2many('hr.employee', string='Empleados')
-    department_ids = fields.Many2many('hr.department', string='Departamentos')
-    job_ids = fields.Many2many('hr.job', string='Puestos')
-    project_ids = fields.Many2many('project.project', string='Obras')
-    fecha_inicio = fields.Date(string='Fecha inicial', required=True, default=lambda self: fields.Date.today().replace(day=1))
-    fecha_fin = fields.Date(string='Fecha final', required=True, default=fields.Date.today)
-    tipo_pago = fields.Selection([('semanal', 'Semanal'), ('quincenal', 'Quincenal')],
-        string='Tipo de pago', help='Seleccione el tipo de nómina a reportar.')
     mostrar_tipo_pago = fields.Boolean(compute='_compute_mostrar_tipo_pago')
 
     @api.depends()
@@ -49,8 +42,5 @@ class WizardReporteAsistencias(models.TransientModel):
                 'Debe seleccionar el Tipo de pago (Semanal o Quincenal) para generar el reporte.'
             )
 
-        return {
-            'type': 'ir.actions.act_url',
-            'url': '/web/binary/hr_reporte_asistencias?wizard_id=%s' % self.id,
-            'target': 'new',
-        }
+        # Generación en segundo plano; si el mismo reporte ya existe y los datos no cambiaron se descarga de inmediato
+        return self.env['reporte.asistencias.job']._request_report(self)
@@ -1,67 +1,131 @@
 # -*- coding: utf-8 -*-
 from odoo import _, http
-from odoo.http import request
+from odoo.http import request, Response
+from itertools import groupby
+from werkzeug.utils import send_file
+import base64
 import io
+import os
+import tempfile
 import xlsxwriter
-import base64
+
+FETCH_SIZE = 2000
+COLUMNAS_PROVEEDOR = 4   # Precio Unitario, Subtotal, IVA, Total
+
+# Precio por (producto, cotización) de todas las cotizaciones del cuadro; si una cotización repite el producto
+# se toma el menor precio unitario y se suman los importes
+PRECIOS_SQL = '''WITH precios AS (
+                SELECT pol.product_id, pol.order_id, MIN(pol.price_unit) price_unit, SUM(pol.price_subtotal) subtotal,
+                       SUM(pol.price_tax) tax, SUM(pol.price_total) total
+                  FROM purchase_order_line pol
+                 WHERE pol.order_id = ANY(%(orders)s) AND pol.product_id IS NOT NULL
+                 GROUP BY 1, 2)'''
+
+# Columnas comunes del renglón: producto, nombre y unidad (en el idioma del usuario), cantidad, llave del renglón y precios
+RENGLON_SQL = '''SELECT pp.id, COALESCE(pt.name->>%(lang)s, pt.name->>'en_US'), pp.default_code,
+                       COALESCE(uu.name->>%(lang)s, uu.name->>'en_US'), {qty}, {linea}, p.order_id,
+                       COALESCE(p.price_unit, 0), COALESCE(p.subtotal, 0), COALESCE(p.tax, 0), COALESCE(p.total, 0)'''
+
+# Con insumos cargados: un renglón por línea de insumo cuyo producto aparece en alguna cotización
+INSUMOS_SQL = PRECIOS_SQL + '\n' + RENGLON_SQL + '''
+                  FROM crm_input_line cil
+                  JOIN product_product pp ON cil.input_id = pp.product_tmpl_id
+                  JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                  LEFT JOIN uom_uom uu ON uu.id = pt.uom_id
+                  JOIN precios p ON p.product_id = pp.id
+                 WHERE cil.lead_id = %(lead)s
+                 ORDER BY pp.default_code, pp.id, cil.id, p.order_id'''
+
+# Sin insumos: un renglón por producto y cantidad cotizada
+COTIZADOS_SQL = PRECIOS_SQL + '\n' + RENGLON_SQL + '''
+                  FROM (SELECT DISTINCT pol.product_id, pol.product_qty FROM purchase_order_line pol
+                         WHERE pol.order_id = ANY(%(orders)s) AND pol.product_id IS NOT NULL) q
+                  JOIN product_product pp ON pp.id = q.product_id
+                  JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                  LEFT JOIN uom_uom uu ON uu.id = pt.uom_id
+                  JOIN precios p ON p.product_id = pp.id
+                 ORDER BY pp.default_code, pp.id, q.product_qty, p.order_id'''
+
+
+def _fetch_rows(cr):
+        while True:
+                rows = cr.fetchmany(FETCH_SIZE)
+                if not rows:
+                        break
+                yield from rows
+
 
 class controller_cuadro_comparativo(http.Controller):
 
         @http.route('/web/binary/purchase_cuadro_comparativo', type='http', auth='public')
         def purchase_cuadro_comparativo(self, lead, **kw):
-                output = io.BytesIO()
-                wb = xlsxwriter.Workbook(output)
-                ws = wb.add_worksheet('Comparativo')
-
-                encabezado_style = wb.add_format({'font_name': 'Arial', 'font_color': 'black', 'bold': 1, 'valign': 'center', 'align': 'center', 'top': 1, 'bottom': 1, 'left': 1, 'right': 1})
-                style = wb.add_format({'font_name': 'Arial', 'font_color': 'black', 'bold': 0, 'valign': 'center', 'align': 'left', 'top': 1, 'bottom': 1, 'left': 1, 'right': 1})
-                style_centrado = wb.add_format({'font_name': 'Arial', 'font_color': 'black', 'bold': 0, 'valign': 'center', 'align': 'center', 'top': 1, 'bottom': 1, 'left': 1, 'right': 1})
-                style_moneda = wb.add_format({'font_name': 'Arial', 'bold': 0, 'valign': 'center', 'align': 'right', 'top': 1, 'bottom': 1, 'left': 1, 'right': 1, 'num_format': '$#,##0.00'})
-                style_moneda_negrita = wb.add_format({'font_name': 'Arial', 'bold': 1, 'valign': 'center', 'align': 'right', 'top': 1, 'bottom': 1, 'left': 1, 'right': 1, 'num_format': '$#,##0.00'})
-                style_numero = wb.add_format({'font_name': 'Arial', 'bold': 0, 'valign': 'vcenter', 'align': 'right', 'top': 1, 'bottom': 1, 'left': 1, 'right': 1, 'num_format': '#,##0.000000'})
-
                 request.env.cr.execute('''SELECT cl.ID, cl.NAME, cl.NO_LICITACION, COUNT(*) FROM purchase_order po JOIN crm_lead cl ON po.LEAD_ID = cl.ID
-                        WHERE po.TYPE_PURCHASE = 'ins' AND po.STATE = 'sent' AND po.LEAD_ID = ''' + str(lead) +
-                        ' GROUP BY 1, 2, 3')
+                        WHERE po.TYPE_PURCHASE = 'ins' AND po.STATE = 'sent' AND po.LEAD_ID = %s
+                        GROUP BY 1, 2, 3''', [int(lead)])
                 num = request.env.cr.fetchall()
 
                 if not num:
-                        wb.close(); output.close()
                         return request.make_response(
                                 u'No hay cotizaciones de insumos en estado "Enviada" para esta licitación.'.encode('utf-8'),
                                 [('Content-Type', 'text/plain; charset=utf-8')])
 
-                lead_id = num[0][0]
+                # Cuadro en archivo temporal (xlsxwriter en constant_memory), enviado por werkzeug sin cargarlo en memoria
+                fd, path = tempfile.mkstemp(prefix='cuadro_comparativo_', suffix='.xlsx')
+                os.close(fd)
+                try:
+                        self._write_cuadro_comparativo(path, num[0])
+                except Exception:
+                        os.unlink(path)
+                        raise
+
+                # Se elimina del disco ya abierto: el descriptor lo conserva hasta que la respuesta termina y lo cierra
+                cuadro = open(path, 'rb')
+                os.unlink(path)
+                response = send_file(cuadro, request.httprequest.environ, mimetype='application/octet-stream', as_attachment=True,
+                        download_name='Cuadro_comparativo_%s.xlsx' % num[0][2], conditional=False, response_class=Response)
+                response.content_length = os.fstat(cuadro.fileno()).st_size
+                return response
+
+        def _write_cuadro_comparativo(self, path, licitacion):
+                """ Escribe el cuadro comparativo: encabezado, totales por cotización y la matriz producto × cotización,
+                obtenida en una sola consulta y escrita renglón por renglón (constant_memory: los renglones se escriben
+                en orden y las celdas combinadas solo abarcan el renglón actual). """
+                cr = request.env.cr
+                lead_id = licitacion[0]
 
-                request.env.cr.execute('''SELECT (case when UPPER(col5) = 'CANTIDAD' then 'col5' else 'col6' end)
-                        FROM crm_input_line WHERE id = (SELECT MIN(id) FROM crm_input_line WHERE lead_id = ''' + str(lead_id) + ')')
-                min_id = request.env.cr.fetchall()
+                supplier_ids = request.env['purchase.order'].search([
+                        ('state', '=', 'sent'), ('lead_id', '=', lead_id), ('type_purchase', '=', 'ins')
+                ]).sorted(key=lambda r: r.name)
+
+                cr.execute('''SELECT (case when UPPER(col5) = 'CANTIDAD' then 'col5' else 'col6' end)
+                        FROM crm_input_line WHERE id = (SELECT MIN(id) FROM crm_input_line WHERE lead_id = %s)''', [lead_id])
+                min_id = cr.fetchall()
+                tiene_input_lines = bool(min_id)
                 cantidad = min_id[0][0] if min_id else 'col6'
 
-                request.env.cr.execute('SELECT COUNT(*) FROM crm_input_line WHERE lead_id = ' + str(lead_id))
-                tiene_input_lines = request.env.cr.fetchall()[0][0] > 0
+                wb = xlsxwriter.Workbook(path, {'constant_memory': True})
+                ws = wb.add_worksheet('Comparativo')
+
+                encabezado_style = wb.add_format({'font_name': 'Arial', 'font_color': 'black', 'bold': 1, 'valign': 'center', 'align': 'center', 'top': 1, 'bottom': 1, 'left': 1, 'right': 1})
+                style = wb.add_format({'font_name': 'Arial', 'font_color': 'black', 'bold': 0, 'valign': 'center', 'align': 'left', 'top': 1, 'bottom': 1, 'left': 1, 'right': 1})
+                style_centrado = wb.add_format({'font_name': 'Arial', 'font_color': 'black', 'bold': 0, 'valign': 'center', 'align': 'center', 'top': 1, 'bottom': 1, 'left': 1, 'right': 1})
+                style_moneda = wb.add_format({'font_name': 'Arial', 'bold': 0, 'valign': 'center', 'align': 'right', 'top': 1, 'bottom': 1, 'left': 1, 'right': 1, 'num_format': '$#,##0.00'})
+                style_moneda_negrita = wb.add_format({'font_name': 'Arial', 'bold': 1, 'valign': 'center', 'align': 'right', 'top': 1, 'bottom': 1, 'left': 1, 'right': 1, 'num_format': '$#,##0.00'})
+                style_numero = wb.add_format({'font_name': 'Arial', 'bold': 0, 'valign': 'vcenter', 'align': 'right', 'top': 1, 'bottom': 1, 'left': 1, 'right': 1, 'num_format': '#,##0.000000'})
 
                 # 4 columnas por proveedor: Precio Unitario, Subtotal, IVA, Total
-                col = 3 + (num[0][3] * 4)
+                col = 3 + (licitacion[3] * COLUMNAS_PROVEEDOR)
                 ws.set_column(0, col, 15)
                 fila = 3
 
-                user = request.env['res.users'].sudo().browse(request.env.uid)
-                logo = user.company_id.logo
+                # El logo se inserta desde memoria (sin archivos en /tmp compartidos entre solicitudes)
+                logo = request.env.user.sudo().company_id.logo
                 if logo:
-                        logo_data = base64.b64decode(logo)
-                        logo_path = '/tmp/logo.png'
-                        with open(logo_path, 'wb') as f:
-                                f.write(logo_data)
-                        ws.insert_image('A1:B3', logo_path, {'x_scale': 0.7, 'y_scale': 0.7})
+                        ws.insert_image('A1', 'logo.png', {'image_data': io.BytesIO(base64.b64decode(logo)), 'x_scale': 0.7, 'y_scale': 0.7})
 
                 ws.merge_range(0, 1, 0, col, u'CUADRO COMPARATIVO', encabezado_style)
-                ws.merge_range(1, 1, 1, col, u'%s' % num[0][1], encabezado_style)
-                ws.merge_range(2, 1, 2, col, u'%s' % num[0][2], encabezado_style)
-
-                supplier_ids = request.env['purchase.order'].search([
-                        ('state', '=', 'sent'), ('lead_id', '=', lead_id), ('type_purchase', '=', 'ins')
-                ]).sorted(key=lambda r: r.name)
+                ws.merge_range(1, 1, 1, col, u'%s' % licitacion[1], encabezado_style)
+                ws.merge_range(2, 1, 2, col, u'%s' % licitacion[2], encabezado_style)
 
                 for record in supplier_ids:
                         ws.write(fila, 0, u'No. de Cotización', encabezado_style)
@@ -82,90 +146,53 @@ class controller_cuadro_comparativo(http.Controller):
                         fila += 1
 
                 fila += 1
-                ws.merge_range(fila, 0, fila+1, 1, u'Insumo', encabezado_style)
-                ws.merge_range(fila, 2, fila+1, 2, u'Unidad', encabezado_style)
-                ws.merge_range(fila, 3, fila+1, 3, u'Cantidad', encabezado_style)
+                ws.merge_range(fila, 0, fila, 1, u'Insumo', encabezado_style)
+                ws.write(fila, 2, u'Unidad', encabezado_style)
+                ws.write(fila, 3, u'Cantidad', encabezado_style)
                 colr = 4
                 for record in supplier_ids:
                         ws.merge_range(fila, colr, fila, colr + 3, record.name, encabezado_style)
-                        ws.write(fila+1, colr,     'Precio Unitario', encabezado_style)
-                        ws.write(fila+1, colr + 1, 'Subtotal',        encabezado_style)
-                        ws.write(fila+1, colr + 2, 'IVA',             encabezado_style)
-                        ws.write(fila+1, colr + 3, 'Total',           encabezado_style)
-                        colr += 4
-
-                fila += 2
+                        colr += COLUMNAS_PROVEEDOR
+                fila += 1
+                ws.merge_range(fila, 0, fila, 1, '', encabezado_style)
+                ws.write(fila, 2, '', encabezado_style)
+                ws.write(fila, 3, '', encabezado_style)
+                colr = 4
+                for record in supplier_ids:
+                        ws.write(fila, colr,     'Precio Unitario', encabezado_style)
+                        ws.write(fila, colr + 1, 'Subtotal',        encabezado_style)
+                        ws.write(fila, colr + 2, 'IVA',             encabezado_style)
+                        ws.write(fila, colr + 3, 'Total',           encabezado_style)
+                        colr += COLUMNAS_PROVEEDOR
+                fila += 1
 
+                params = {'lead': lead_id, 'orders': supplier_ids.ids, 'lang': request.env.lang or 'en_US'}
                 if tiene_input_lines:
-                        request.env.cr.execute('SELECT pp.id, pp.product_tmpl_id, round(cil.' + cantidad + '''::numeric, 6) qty, cil.id, MIN(pol.price_unit)
-                                FROM crm_lead cl JOIN crm_input_line cil ON cl.ID = cil.LEAD_ID
-                                JOIN product_product pp ON cil.input_id = pp.product_tmpl_id
-                                JOIN purchase_order po ON cl.id = po.lead_id AND po.state = 'sent'
-                                JOIN purchase_order_line pol ON po.id = pol.order_id AND pp.id = pol.product_id
-                                WHERE cl.id = ''' + str(lead_id) + ' GROUP BY 1, 2, 3, 4 ORDER BY pp.DEFAULT_CODE')
-                        product_ids = request.env.cr.fetchall()
-
-                        for record in product_ids:
-                                product = request.env['product.product'].browse(record[0])
-                                ws.merge_range(fila, 0, fila, 1, u'[%s] %s' % (product.default_code or '', product.name), style)
-                                ws.write(fila, 2, product.uom_id.name.upper() if product.uom_id else '', style_centrado)
-                                ws.write(fila, 3, record[2], style_numero)
-
-                                request.env.cr.execute('''SELECT COALESCE(pol.price_unit, 0), COALESCE(pol.price_subtotal, 0),
-                                                COALESCE(pol.price_tax, 0), COALESCE(pol.price_total, 0)
-                                        FROM crm_input_line cil JOIN purchase_order po ON cil.lead_id = po.lead_id
-                                        LEFT JOIN purchase_order_line pol ON po.id = pol.order_id AND pol.product_id = ''' + str(record[0]) +
-                                        ' WHERE cil.id = ' + str(record[3]) + " AND po.state = 'sent' ORDER BY po.name")
-                                price = request.env.cr.fetchall()
-                                min_price = record[4]
-                                colr = 4
-                                for x in price:
-                                        estilo = style_moneda_negrita if x[0] == min_price else style_moneda
-                                        ws.write(fila, colr,     x[0], estilo)
-                                        ws.write(fila, colr + 1, x[1], estilo)
-                                        ws.write(fila, colr + 2, x[2], estilo)
-                                        ws.write(fila, colr + 3, x[3], estilo)
-                                        colr += 4
-                                fila += 1
+                        cr.execute(INSUMOS_SQL.format(qty='round(cil.%s::numeric, 6)' % cantidad, linea='cil.id'), params)
                 else:
-                        request.env.cr.execute('''
-                                SELECT pp.id, pol.product_qty, MIN(pol.price_unit)
-                                FROM purchase_order po
-                                JOIN purchase_order_line pol ON po.id = pol.order_id
-                                JOIN product_product pp ON pol.product_id = pp.id
-                                WHERE po.lead_id = ''' + str(lead_id) + ''' AND po.state = 'sent' AND po.type_purchase = 'ins'
-                                GROUP BY pp.id, pol.product_qty ORDER BY pp.default_code''')
-                        product_ids = request.env.cr.fetchall()
-
-                        for record in product_ids:
-                                product = request.env['product.product'].browse(record[0])
-                                ws.merge_range(fila, 0, fila, 1, u'[%s] %s' % (product.default_code or '', product.name), style)
-                                ws.write(fila, 2, product.uom_id.name.upper() if product.uom_id else '', style_centrado)
-                                ws.write(fila, 3, record[1], style_numero)
-
-                                request.env.cr.execute('''
-                                        SELECT COALESCE(pol.price_unit, 0), COALESCE(pol.price_subtotal, 0),
-                                               COALESCE(pol.price_tax, 0), COALESCE(pol.price_total, 0)
-                                        FROM purchase_order po
-                                        JOIN purchase_order_line pol ON po.id = pol.order_id AND pol.product_id = ''' + str(record[0]) +
-                                        ' WHERE po.lead_id = ' + str(lead_id) + ''' AND po.state = 'sent' AND po.type_purchase = 'ins'
-                                        ORDER BY po.name''')
-                                price = request.env.cr.fetchall()
-                                min_price = record[2]
-                                colr = 4
-                                for x in price:
-                                        estilo = style_moneda_negrita if x[0] == min_price else style_moneda
-                                        ws.write(fila, colr,     x[0], estilo)
-                                        ws.write(fila, colr + 1, x[1], estilo)
-                                        ws.write(fila, colr + 2, x[2], estilo)
-                                        ws.write(fila, colr + 3, x[3], estilo)
-                                        colr += 4
-                                fila += 1
+                        cr.execute(COTIZADOS_SQL.format(qty='q.product_qty', linea='NULL'), params)
+
+                sin_precio = (0, 0, 0, 0)
+                for _key, group in groupby(_fetch_rows(cr), key=lambda row: (row[0], row[4], row[5])):
+                        group = list(group)
+                        product_id, name, code, uom, qty = group[0][:5]
+                        precios = {row[6]: row[7:11] for row in group}
+                        # El menor precio unitario entre las cotizaciones que incluyen el producto se resalta en negritas
+                        min_price = min(price[0] for price in precios.values())
+
+                        ws.merge_range(fila, 0, fila, 1, u'[%s] %s' % (code or '', name or ''), style)
+                        ws.write(fila, 2, uom.upper() if uom else '', style_centrado)
+                        ws.write(fila, 3, qty, style_numero)
+                        colr = 4
+                        for order_id in supplier_ids.ids:
+                                x = precios.get(order_id, sin_precio)
+                                # Solo se resaltan cotizaciones que incluyen el producto (el relleno en ceros nunca es el mejor precio)
+                                estilo = style_moneda_negrita if order_id in precios and x[0] == min_price else style_moneda
+                                ws.write(fila, colr,     x[0], estilo)
+                                ws.write(fila, colr + 1, x[1], estilo)
+                                ws.write(fila, colr + 2, x[2], estilo)
+                                ws.write(fila, colr + 3, x[3], estilo)
+                                colr += COLUMNAS_PROVEEDOR
+                        fila += 1
 
                 wb.close()
-                content = output.getvalue()
-                output.close()
-
-                return request.make_response(content,
-                        [('Content-Type', 'application/octet-stream'),
-                         ('Content-Disposition', 'attachment; filename=Cuadro_comparativo_%s.xlsx;' % num[0][2])])
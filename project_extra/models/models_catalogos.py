@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from odoo import api, fields, models
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import column_exists, create_column, table_exists
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -341,6 +342,39 @@ class ProductTemplateInsumo(models.Model):
     _inherit = 'product.template'
     
     tipo_insumo_id = fields.Many2one('product.tipo.insumo', string='Tipo de insumo', tracking=True, help='Clasificación del insumo para procesos de compra')
+    default_code_key = fields.Char(string='Código normalizado', compute='_compute_default_code_key', store=True, index=True,
+        help='Referencia interna sin espacios laterales y en mayúsculas; llave de búsqueda de los catálogos de licitaciones')
+
+    def _auto_init(self):
+        # La columna se crea y rellena por SQL antes del ORM para no recalcular todo el catálogo registro por registro
+        cr = self.env.cr
+        if table_exists(cr, self._table) and not column_exists(cr, self._table, 'default_code_key'):
+            create_column(cr, self._table, 'default_code_key', 'varchar')
+            cr.execute("""UPDATE product_template SET default_code_key = NULLIF(UPPER(TRIM(default_code)), '')
+                WHERE default_code IS NOT NULL""")
+        return super(ProductTemplateInsumo, self)._auto_init()
+
+    @api.depends('default_code')
+    def _compute_default_code_key(self):
+        for record in self:
+            record.default_code_key = self._normalize_default_code(record.default_code)
+
+    @api.model
+    def _normalize_default_code(self, code):
+        """ Misma normalización que default_code_key (en SQL: NULLIF(UPPER(TRIM(código)), '')). Acepta valores numéricos
+        leídos de las hojas de cálculo. """
+        if code is None or code is False:
+            return False
+        return str(code).strip().upper() or False
+
+    @api.model
+    def _resolve_default_codes(self, codes):
+        """ Resuelve en una sola consulta (índice de default_code_key) un conjunto de códigos a productos.
+        Devuelve {código normalizado: [ids de product.template]}; los códigos sin producto no aparecen. """
+        keys = {self._normalize_default_code(code) for code in codes} - {False}
+        if not keys:
+            return {}
+        return {key: sorted(ids) for key, ids in self._read_group([('default_code_key', 'in', list(keys))], ['default_code_key'], ['id:array_agg'])}
 
 
 class ResPartnerTipoInsumo(models.Model):
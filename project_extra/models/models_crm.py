@@ -1,19 +1,19 @@
 # -*- coding: utf-8 -*-
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError, ValidationError
-from odoo.tools import html_escape
+from odoo.tools import SQL, html_escape
 from markupsafe import Markup
 from dateutil.relativedelta import relativedelta
 import logging
 import os
-import tempfile
-import openpyxl
-import binascii
-import base64
-import io
+
+from .xlsx_stream import LOAD_BATCH_SIZE, get_column_map, iter_attachment_rows
 
 _logger = logging.getLogger(__name__)
 
+# Unidades de la hoja de insumos que se cargan como pieza
+UNIDADES_PIEZA = ['%MO', 'PIE TAB', '%']
+
 class CrmRevertLog(models.Model):
     _name = 'crm.revert.log'
     _description = 'Bitácora de reversiones de etapa'
@@ -940,107 +940,147 @@ class CrmLead(models.Model):
                 raise ValidationError('Seleccione un archivo tipo xlsx, xls, xlsm')
 
 
+    def _get_input_file_attachment(self):
+        """ Adjunto (filestore) que respalda el campo binario input_file. """
+        self.ensure_one()
+        return self.env['ir.attachment'].sudo().search([('res_model', '=', self._name), ('res_field', '=', 'input_file'),
+            ('res_id', '=', self.id)], limit=1)
+
+    def _load_lines(self, lines):
+        """ Inserta las líneas recibidas como (campo one2many, valores) en lotes de LOAD_BATCH_SIZE, de modo que el
+        archivo se procesa renglón por renglón sin acumular todos los registros en memoria. """
+        self.ensure_one()
+        batches = {}
+        pending = 0
+
+        def flush():
+            for field_name, vals_list in batches.items():
+                self._insert_lines(field_name, vals_list)
+            batches.clear()
+
+        for field_name, vals in lines:
+            batches.setdefault(field_name, []).append(vals)
+            pending += 1
+            if pending >= LOAD_BATCH_SIZE:
+                flush()
+                pending = 0
+        flush()
+
+    def _insert_lines(self, field_name, vals_list):
+        """ Alta masiva de líneas de carga (tablas de staging sin herencia de mail ni lógica en create) con un solo
+        INSERT multi-renglón por lote y el lead ya asignado. Los valores se convierten con el mismo criterio del ORM
+        (p. ej. números de la hoja a texto en los Char) y se completan con los defaults del modelo. """
+        self.ensure_one()
+        if not vals_list:
+            return []
+        field = self._fields[field_name]
+        Line = self.env[field.comodel_name]
+        Line.flush_model()
+        defaults = Line.default_get([name for name, f in Line._fields.items() if f.store and f.column_type and not f.automatic])
+        columns = sorted(set(defaults).union(*vals_list) - {field.inverse_name})
+        now = self.env.cr.now()
+        rows = []
+        for vals in vals_list:
+            vals = {**defaults, **vals}
+            rows.append(SQL('(%s)', SQL(', ').join(
+                [SQL('%s', self.id), SQL('%s', self.env.uid), SQL('%s', now), SQL('%s', self.env.uid), SQL('%s', now)]
+                + [SQL('%s', Line._fields[name].convert_to_column_insert(vals.get(name), Line)) for name in columns])))
+        self.env.cr.execute(SQL('INSERT INTO %s (%s) VALUES %s RETURNING id',
+            SQL.identifier(Line._table),
+            SQL(', ').join(SQL.identifier(name) for name in [field.inverse_name, 'create_uid', 'create_date', 'write_uid', 'write_date'] + columns),
+            SQL(', ').join(rows)))
+        ids = [row[0] for row in self.env.cr.fetchall()]
+        # Campos calculados almacenados del modelo de líneas (si los hay) en una sola pasada
+        records = Line.browse(ids)
+        for line_field in Line._fields.values():
+            if line_field.store and line_field.compute:
+                self.env.add_to_compute(line_field, records)
+        records.flush_recordset()
+        self.invalidate_recordset([field_name])
+        return ids
+
     def __leer_carga_insumos(self):
         for record in self:
-            file = tempfile.NamedTemporaryFile(suffix=".xlsx")
-            file.write(binascii.a2b_base64(record.input_file))
-            file.seek(0)
-            xlsx_file = file.name
-            
-            wb = openpyxl.load_workbook(filename=xlsx_file, data_only=True)
-            sheets = wb.sheetnames
-            sheet_name = sheets[0]
-            sheet = wb[sheet_name]
-            registros = []
-            cargar = False
-            max_idx = max(cod, desc, uni, prec, qty, imp)
-            for row in sheet.iter_rows(values_only=True):
-                col1 = str(row[0]).strip()
-                col2 = str(row[1]).strip()
-                col3 = str(row[2]).strip()
-                col4 = str(row[3]).strip()
-                col5 = str(row[4]).strip()
-                col6 = str(row[5]).strip()
-                col7 = str(row[6]).strip()
-                col8 = str(row[7]).strip()
-                if col1 == 'None':
-                    col1 = ''
-                if col2 == 'None':
-                    col2 = ''
-                if col3 == 'None':
-                    col3 = ''
-                if col4 == 'None':
-                    col4 = ''
-                if col5 == 'None':
-                    col5 = ''
-                if col6 == 'None':
-                    col6 = ''
-                if col7 == 'None':
-                    col7 = ''
-                if col8 == 'None':
-                    col8 = ''
-                if col1.upper() == 'CÓDIGO':
-                    cargar = True
-
-                if cargar:
-                    if col1 != '' and col8 != '' and col1.upper() != 'CÓDIGO':
-                        registro = {'col1': col1, 'col2': col2, 'col3': col3, 'col4': col4, 'col5': col5, 'col6': col6, 'col7': col7, 'col8': col8}
-                        registros.append((0, 0, registro))
-
-            record.write({'input_ids': registros})
+            attachment = record._get_input_file_attachment()
+            if not attachment:
+                raise ValidationError('Seleccione un archivo para cargar.')
+            record._load_lines(record.__iter_insumos(attachment))
+
+    def __iter_insumos(self, attachment):
+        # Formato fijo de 8 columnas; los datos inician después del renglón cuyo primer valor es "CÓDIGO"
+        cargar = False
+        for row in iter_attachment_rows(attachment, width=8, first_sheet=True):
+            cols = [str(value).strip() for value in row[:8]]
+            cols = ['' if value == 'None' else value for value in cols]
+            if cols[0].upper() == 'CÓDIGO':
+                cargar = True
+                continue
+            if cargar and cols[0] != '' and cols[7] != '':
+                yield 'input_ids', {'col%s' % (idx + 1): value for idx, value in enumerate(cols)}
 
 
     def action_genera_insumos(self):
-        self.env.cr.execute('SELECT col1, COUNT(*) num FROM crm_input_line WHERE lead_id = ' + str(self.id) + ' GROUP BY 1 HAVING COUNT(*) > 1')
-        duplicado = self.env.cr.dictfetchall()
+        self.ensure_one()
+        cr = self.env.cr
+        self.env['crm.input.line'].flush_model()
+        cr.execute('SELECT col1, COUNT(*) num FROM crm_input_line WHERE lead_id = %s GROUP BY 1 HAVING COUNT(*) > 1', [self.id])
+        duplicado = cr.dictfetchall()
         if duplicado:
             raise UserError('Existen conceptos repetidos favor de revisar el archivo.')
 
-        self.env.cr.execute('''SELECT ID min_id, (case when UPPER(col3) = 'UNIDAD' then 'col3' else 'col5' end) unidad, 
-                (case when UPPER(col5) = 'CANTIDAD' then 'col5' else 'col6' end) cantidad, 
+        # El primer renglón del lead es el encabezado: indica en qué columna vienen unidad y precio
+        cr.execute('''SELECT ID min_id, (case when UPPER(col3) = 'UNIDAD' then 'col3' else 'col5' end) unidad, 
                 (case when UPPER(col6) in ('PRECIO', 'COSTO UNITARIO') then 'col6' else 'col7' end) precio 
-            FROM crm_input_line ci WHERE ci.id = (select MIN(ID) min_id from crm_input_line ci WHERE ci.lead_id = ''' + str(self.id) + ')')
-        min_id = self.env.cr.dictfetchall()
-
-        unidad = min_id[0]['unidad']
-        cantidad = min_id[0]['cantidad']
-        precio = min_id[0]['precio']
+            FROM crm_input_line ci WHERE ci.id = (select MIN(ID) min_id from crm_input_line ci WHERE ci.lead_id = %s)''', [self.id])
+        min_id = cr.dictfetchall()
+        if not min_id:
+            return
 
-        self.env.cr.execute('''UPDATE crm_input_line cil SET input_ex = True, input_id = t1.IDCOD
+        min_id = min_id[0]
+        params = {'lead': self.id, 'min_id': min_id['min_id']}
+        # Cruce por el código normalizado e indexado del producto (default_code_key)
+        self.env['product.template'].flush_model()
+        cr.execute('''UPDATE crm_input_line cil SET input_ex = True, input_id = t1.IDCOD
             FROM (SELECT cil.id, TRIM(cil.col1) code, MIN(pt.ID) idcod, COUNT(pt.id) num 
-                    FROM crm_input_line cil LEFT JOIN product_template pt ON TRIM(cil.col1) = pt.default_code 
-                   WHERE cil.LEAD_ID = ''' + str(self.id) + ' and cil.id != ' + str(min_id[0]['min_id']) + ''' AND cil.input_ex = False GROUP BY 1, 2) as t1
+                    FROM crm_input_line cil LEFT JOIN product_template pt ON UPPER(TRIM(cil.col1)) = pt.default_code_key 
+                   WHERE cil.LEAD_ID = %(lead)s and cil.id != %(min_id)s AND cil.input_ex = False GROUP BY 1, 2) as t1
             WHERE cil.id = t1.id AND t1.num != 0;
             UPDATE crm_input_line cil SET account_ex = true
             FROM (SELECT cil.id, TRIM(cil.col1) code, COUNT(pt.property_account_expense_id) num 
-                    FROM crm_input_line cil JOIN product_template pt ON TRIM(cil.col1) = pt.default_code 
-                   WHERE cil.LEAD_ID = ''' + str(self.id) + ' AND cil.id != ' + str(min_id[0]['min_id']) + ''' AND pt.property_account_expense_id IS NOT NULL
+                    FROM crm_input_line cil JOIN product_template pt ON UPPER(TRIM(cil.col1)) = pt.default_code_key 
+                   WHERE cil.LEAD_ID = %(lead)s AND cil.id != %(min_id)s AND pt.property_account_expense_id IS NOT NULL
                    GROUP BY 1, 2) as t1
             WHERE cil.id = t1.id;
             UPDATE crm_input_line cil SET tipinsumo_ex = true
             FROM (SELECT cil.id, TRIM(cil.col1) code, COUNT(pt.tipo_insumo_id) num 
-                    FROM crm_input_line cil JOIN product_template pt ON TRIM(cil.col1) = pt.default_code 
-                   WHERE cil.LEAD_ID = ''' + str(self.id) + ' AND cil.id != ' + str(min_id[0]['min_id']) + ''' AND pt.tipo_insumo_id IS NOT NULL
+                    FROM crm_input_line cil JOIN product_template pt ON UPPER(TRIM(cil.col1)) = pt.default_code_key 
+                   WHERE cil.LEAD_ID = %(lead)s AND cil.id != %(min_id)s AND pt.tipo_insumo_id IS NOT NULL
                    GROUP BY 1, 2) as t1
-            WHERE cil.id = t1.id; ''')
+            WHERE cil.id = t1.id; ''', params)
+        self.env['crm.input.line'].invalidate_model(['input_ex', 'input_id', 'account_ex', 'tipinsumo_ex'])
+
+        # Insumos sin producto: unidad y categoría de todas las líneas en una sola consulta (la primera coincidencia por línea)
+        unidad = SQL.identifier('cil', min_id['unidad'])
+        cr.execute(SQL('''SELECT DISTINCT ON (cil.id) cil.id, cil.col1 code, cil.col2 name, uu.id uom, pc.id cat,
+                (CASE WHEN uc.NAME->>'en_US' = 'Service' THEN 'service' ELSE 'consu' END) type, %s::float importe
+              FROM crm_input_line cil
+              JOIN uom_uom uu ON (CASE WHEN %s = ANY(%s) THEN 'pza' ELSE lower(%s) END) = lower(uu.name->>'en_US')
+              JOIN uom_category uc ON uu.CATEGORY_ID = uc.ID
+              JOIN product_category pc ON pc.NAME = 'All'
+             WHERE cil.lead_id = %s AND cil.id != %s AND cil.input_ex IS NOT TRUE
+             ORDER BY cil.id, uu.id, pc.id''', SQL.identifier('cil', min_id['precio']), unidad, UNIDADES_PIEZA, unidad, self.id, min_id['min_id']))
+        info = cr.dictfetchall()
+        if not info:
+            return
 
         iva = self.env['account.tax'].search([('name','=','16%'),('type_tax_use','=','purchase')])
-        for rec in self.input_ids.filtered(lambda u: not u.input_ex):
-            if rec.id != min_id[0]['min_id']:
-                statement = ('''SELECT cil.col1 code, cil.col2 name, uu.id uom, pc.id cat,
-                        (CASE WHEN uc.NAME->>'en_US' = 'Service' THEN 'service' ELSE 'consu' END) type, ''' + cantidad + ' qty, ' + precio + 
-                        '::float importe FROM crm_input_line cil JOIN uom_uom uu ON (CASE WHEN cil.' + unidad + 
-                        " IN ('%MO', 'PIE TAB', '%') THEN 'pza' ELSE lower(cil." + unidad + ''') END) = lower(uu.name->>'en_US') 
-                                JOIN uom_category uc ON uu.CATEGORY_ID = uc.ID 
-                                JOIN product_category pc ON pc.NAME = 'All'
-                    WHERE cil.id = ''' + str(rec.id))
-                self.env.cr.execute(statement)
-                info = self.env.cr.dictfetchall()
-                if info:                
-                    insumo = self.env['product.template'].create({'categ_id': info[0]['cat'], 'uom_id': info[0]['uom'], 'uom_po_id': info[0]['uom'], 
-                        'type': info[0]['type'], 'default_code': info[0]['code'], 'name': info[0]['name'], 'purchase_ok': True, 'sale_ok': False, 
-                        'supplier_taxes_id': [(6, 0, iva.ids)], 'standard_price': info[0]['importe'], 'list_price': info[0]['importe'], 'active': True,})
-                    rec.write({'input_ex': True, 'input_id': insumo.id})
+        insumos = self.env['product.template'].create([{'categ_id': x['cat'], 'uom_id': x['uom'], 'uom_po_id': x['uom'], 'type': x['type'],
+            'default_code': x['code'], 'name': x['name'], 'purchase_ok': True, 'sale_ok': False, 'supplier_taxes_id': [(6, 0, iva.ids)],
+            'standard_price': x['importe'], 'list_price': x['importe'], 'active': True} for x in info])
+        self.env['product.template'].flush_model()
+        cr.execute('''UPDATE crm_input_line cil SET input_ex = True, input_id = v.product_id
+            FROM unnest(%s::int[], %s::int[]) AS v(line_id, product_id) WHERE cil.id = v.line_id''', [[x['id'] for x in info], insumos.ids])
+        self.env['crm.input.line'].invalidate_model(['input_ex', 'input_id'])
 
 
     def action_genera_cotizaciones(self):
@@ -1091,64 +1131,31 @@ class CrmLead(models.Model):
             if not record.doctoconcept_id:
                 raise ValidationError('Falta agregar el tipo de archivo.')
 
-            for x in record.doctoconcept_id:
-                inicio = x.inicio_datos
-                for y in x.configdoc_ids:
-                    if y.no_columna != '*':
-                        if y.columna == 'codigo':
-                            cod = int(y.no_columna) - 1
-                        if y.columna == 'descripcion':
-                            desc = int(y.no_columna) - 1
-                        if y.columna == 'unidad':
-                            uni = int(y.no_columna) - 1
-                        if y.columna == 'precio_unitario':
-                            prec = int(y.no_columna) - 1
-                        if y.columna == 'cantidad':
-                            qty = int(y.no_columna) - 1
-                        if y.columna == 'importe':
-                            imp = int(y.no_columna) - 1
-
-            attachment = docto.attachment_id.sudo()
-            decoded_data = base64.b64decode(attachment.datas)
-            workbook = openpyxl.load_workbook(filename=io.BytesIO(decoded_data), data_only=True)
-            sheet = workbook.active
-            column = sheet.max_column
-            registros = [(5, 0, 0)]
-            partidas = [(5, 0, 0)]
-            cargar = True
-            partida = False
-            contador = 1
-            max_idx = max(cod, desc, uni, prec, qty, imp)
-            for row in sheet.iter_rows(values_only=True):
-                if contador < inicio:
-                    contador += 1
-                    continue
-                if len(row) <= max_idx:
-                    row = row + (None,) * (max_idx + 1 - len(row))
-
-                if isinstance(row[desc], str):
-                    if row[desc].upper() == 'RESUMEN DE PARTIDAS':
-                        cargar = False
-                        partida = True
-
-                if isinstance(row[cod], str):
-                    if row[cod].upper() == 'RESUMEN DE PARTIDAS':
-                        cargar = False
-                        partida = True
-
-                if cargar:
-                    if row[cod] == row[desc] == row[uni] == row[prec] == row[qty] == row[imp] == None:
-                        _logger.warning('No se guarda la información')
-                    else:
-                        registro = {'col1': row[cod], 'col2': row[desc], 'col3': row[uni], 'col4': row[qty], 'col5': row[prec], 'col6': row[imp]}
-                        registros.append((0, 0, registro))
-
-                if partida:
-                    if row[cod] != None:
-                        registro = {'col1': row[cod], 'col2': row[desc] or row[cod]}
-                        partidas.append((0, 0, registro))
+            columns = get_column_map(record.doctoconcept_id, ('codigo', 'descripcion', 'unidad', 'precio_unitario', 'cantidad', 'importe'))
+            # Recarga: los conceptos y partidas previos se reemplazan
+            record.write({'concept_ids': [(5, 0, 0)], 'budget_ids': [(5, 0, 0)]})
+            record._load_lines(record.__iter_concept(docto.attachment_id, columns, record.doctoconcept_id.inicio_datos))
+
+    def __iter_concept(self, attachment, columns, inicio):
+        cod, desc, uni, prec, qty, imp = (columns[name] for name in ('codigo', 'descripcion', 'unidad', 'precio_unitario', 'cantidad', 'importe'))
+        cargar = True
+        partida = False
+        for row in iter_attachment_rows(attachment, width=max(cod, desc, uni, prec, qty, imp) + 1, start=inicio):
+            # A partir del renglón "RESUMEN DE PARTIDAS" se leen partidas en lugar de conceptos
+            for idx in (desc, cod):
+                if isinstance(row[idx], str) and row[idx].upper() == 'RESUMEN DE PARTIDAS':
+                    cargar = False
+                    partida = True
+
+            if cargar:
+                if row[cod] == row[desc] == row[uni] == row[prec] == row[qty] == row[imp] == None:
+                    _logger.warning('No se guarda la información')
+                else:
+                    yield 'concept_ids', {'col1': row[cod], 'col2': row[desc], 'col3': row[uni], 'col4': row[qty], 'col5': row[prec], 'col6': row[imp]}
 
-            record.write({'concept_ids': registros, 'budget_ids': partidas})
+            if partida:
+                if row[cod] != None:
+                    yield 'budget_ids', {'col1': row[cod], 'col2': row[desc] or row[cod]}
 
 
     def action_genera_partidas(self):
@@ -1160,74 +1167,53 @@ class CrmLead(models.Model):
             partidas = self.env.cr.dictfetchall()
 
     def action_genera_concept(self):
+        self.ensure_one()
         count = len(self.budget_ids.filtered(lambda u: not u.budget_id))
         if count != 0:
             raise UserError('Las partidas no han sido cargadas, favor de realizar la carga')
 
+        Product = self.env['product.template']
         iva = self.env['account.tax'].search([('amount','=',16), ('type_tax_use','=','sale')])
         # Cuando el archivo NO trae partidas presupuestales (no son necesarias en esta obra), los
         # conceptos se generan igual: se crea/enlaza el product.template con budget_id vacío. Con
         # partidas cargadas el comportamiento es idéntico al anterior (sin regresión).
         sin_partidas = not self.budget_ids
+        # Partidas del lead por código (la primera por código) en lugar de una búsqueda por concepto
+        partidas = {}
+        for budget_line in self.budget_ids:
+            partidas.setdefault(budget_line.col1, budget_line)
         partida = 0
         encabezados_sin_match = []
         conceptos_huerfanos = 0
+        # (línea, partida, código) de los conceptos que requieren producto
+        pendientes = []
         for rec in self.concept_ids.filtered(lambda u: not u.concept_ex):
-            if not rec.concept_ex:
-                partida_id = self.env['crm.budget.line'].search([('lead_id','=',rec.lead_id.id), ('col1','=',rec.col1)])
-                if partida_id:
-                    partida = partida_id.budget_id.id
-
-                if sin_partidas:
-                    budget_val = False
-                    procede = bool(rec.col1) and rec.col1 != ''
-                else:
-                    # Las filas de encabezado de partida (p.ej. "PDA-001 ...") llegan mezcladas en
-                    # concept_ids sin descripción propia; se distinguen de un concepto real por eso.
-                    # Si un encabezado no encuentra su partida (texto distinto al de "Resumen de
-                    # partidas", o la fila se perdió por "inicio_datos" mal configurado), "partida"
-                    # se quedaba con el valor de la ANTERIOR y los conceptos siguientes se
-                    # atribuían en silencio a la partida equivocada (o a ninguna, si era la primera).
-                    es_encabezado_partida = not rec.col2
-                    if es_encabezado_partida and not partida_id:
-                        encabezados_sin_match.append(rec.col1)
-                        continue
-                    if not es_encabezado_partida and partida == 0:
-                        conceptos_huerfanos += 1
-                        continue
-                    budget_val = partida
-                    procede = partida != 0 and rec.col1 != '' and rec.col1 != partida_id.budget_id.code
-
-                if procede:
-                    concept_id = self.env['product.template'].search([('budget_id','=',budget_val), ('default_code','=',rec.col1)])
-                    if concept_id:
-                        # El producto ya existía (p.ej. de una carga previa): normalizarlo como
-                        # servicio de obra para que al confirmar la OV genere su tarea. Sin esto,
-                        # un producto con service_tracking distinto deja el concepto fuera de la obra.
-                        norm = {}
-                        if concept_id.service_tracking != 'task_in_project':
-                            norm['service_tracking'] = 'task_in_project'
-                        if not concept_id.sale_ok:
-                            norm['sale_ok'] = True
-                        if norm:
-                            concept_id.write(norm)
-                        if concept_id.property_account_income_id:
-                            rec.write({'concept_ex': True, 'concept_id': concept_id.id, 'account_ex': True})
-                        else:
-                            rec.write({'concept_ex': True, 'concept_id': concept_id.id})
-                    else:
-                        statement = ('''SELECT cil.col1 code, cil.col2 name, uu.id uom, pc.id cat, REPLACE(cil.col4, ',', '') qty,
-                                (CASE WHEN cil.col5 = '' THEN '0.0' ELSE REPLACE(cil.col5, ',', '') END)::float importe
-                            FROM crm_concept_line cil JOIN uom_uom uu ON lower(cil.col3) = lower(uu.name->>'en_US') JOIN product_category pc ON pc.NAME = 'All'
-                            WHERE cil.id = ''' + str(rec.id))
-                        self.env.cr.execute(statement)
-                        info = self.env.cr.dictfetchall()
-                        if info:
-                            insumo = self.env['product.template'].create({'categ_id': info[0]['cat'], 'uom_id': info[0]['uom'], 'uom_po_id': info[0]['uom'],
-                                'type': 'service', 'default_code': info[0]['code'], 'name': info[0]['name'], 'purchase_ok': False, 'sale_ok': True,
-                                'taxes_id': [(6, 0, iva.ids)], 'standard_price': info[0]['importe'], 'list_price': info[0]['importe'],
-                                'service_tracking': 'task_in_project', 'active': True, 'budget_id': budget_val})
-                            rec.write({'concept_ex': True, 'concept_id': insumo.id})
+            partida_id = partidas.get(rec.col1, self.env['crm.budget.line'])
+            if partida_id:
+                partida = partida_id.budget_id.id
+
+            if sin_partidas:
+                budget_val = False
+                procede = bool(rec.col1) and rec.col1 != ''
+            else:
+                # Las filas de encabezado de partida (p.ej. "PDA-001 ...") llegan mezcladas en
+                # concept_ids sin descripción propia; se distinguen de un concepto real por eso.
+                # Si un encabezado no encuentra su partida (texto distinto al de "Resumen de
+                # partidas", o la fila se perdió por "inicio_datos" mal configurado), "partida"
+                # se quedaba con el valor de la ANTERIOR y los conceptos siguientes se
+                # atribuían en silencio a la partida equivocada (o a ninguna, si era la primera).
+                es_encabezado_partida = not rec.col2
+                if es_encabezado_partida and not partida_id:
+                    encabezados_sin_match.append(rec.col1)
+                    continue
+                if not es_encabezado_partida and partida == 0:
+                    conceptos_huerfanos += 1
+                    continue
+                budget_val = partida
+                procede = partida != 0 and rec.col1 != '' and rec.col1 != partida_id.budget_id.code
+
+            if procede:
+                pendientes.append((rec, budget_val, Product._normalize_default_code(rec.col1)))
 
         if encabezados_sin_match or conceptos_huerfanos:
             partes = []
@@ -1244,9 +1230,51 @@ class CrmLead(models.Model):
                 )
             raise UserError('No se pudo generar el catálogo de conceptos:\n\n' + '\n'.join(partes))
 
-        for rec in self.concept_ids.filtered(lambda u: u.concept_ex):
-            if rec.concept_id.property_account_income_id:
-                rec.write({'account_ex': True})
+        # Productos existentes por (partida, código normalizado) resueltos en una sola consulta
+        productos = {}
+        product_ids = Product._resolve_default_codes({code for _rec, _budget, code in pendientes})
+        for product in Product.browse(sorted({pid for ids in product_ids.values() for pid in ids})):
+            productos.setdefault((product.budget_id.id, product.default_code_key), product)
+
+        existentes = Product.browse({productos[(budget, code)].id for _rec, budget, code in pendientes if (budget, code) in productos})
+        # El producto ya existía (p.ej. de una carga previa): normalizarlo como servicio de obra para que al
+        # confirmar la OV genere su tarea. Sin esto, un producto con service_tracking distinto deja el concepto fuera de la obra.
+        existentes.filtered(lambda p: p.service_tracking != 'task_in_project').write({'service_tracking': 'task_in_project'})
+        existentes.filtered(lambda p: not p.sale_ok).write({'sale_ok': True})
+
+        # Conceptos sin producto: unidad, categoría e importe de todas las líneas en una sola consulta
+        faltantes = [rec.id for rec, budget, code in pendientes if (budget, code) not in productos]
+        info = {}
+        if faltantes:
+            self.env['crm.concept.line'].flush_model()
+            self.env.cr.execute('''SELECT DISTINCT ON (cil.id) cil.id, cil.col1 code, cil.col2 name, uu.id uom, pc.id cat,
+                    (CASE WHEN cil.col5 = '' THEN '0.0' ELSE REPLACE(cil.col5, ',', '') END)::float importe
+                  FROM crm_concept_line cil JOIN uom_uom uu ON lower(cil.col3) = lower(uu.name->>'en_US') JOIN product_category pc ON pc.NAME = 'All'
+                 WHERE cil.id = ANY(%s)
+                 ORDER BY cil.id, uu.id, pc.id''', [faltantes])
+            info = {x['id']: x for x in self.env.cr.dictfetchall()}
+
+        # Un producto por (partida, código), con los datos de la primera línea que resuelve su unidad
+        nuevos = {}
+        for rec, budget, code in pendientes:
+            if (budget, code) not in productos and (budget, code) not in nuevos and rec.id in info:
+                x = info[rec.id]
+                nuevos[(budget, code)] = {'categ_id': x['cat'], 'uom_id': x['uom'], 'uom_po_id': x['uom'], 'type': 'service',
+                    'default_code': x['code'], 'name': x['name'], 'purchase_ok': False, 'sale_ok': True, 'taxes_id': [(6, 0, iva.ids)],
+                    'standard_price': x['importe'], 'list_price': x['importe'], 'service_tracking': 'task_in_project', 'active': True,
+                    'budget_id': budget}
+        if nuevos:
+            productos.update(zip(nuevos, Product.create(list(nuevos.values()))))
+
+        enlaces = [(rec.id, productos[(budget, code)].id) for rec, budget, code in pendientes if (budget, code) in productos]
+        if enlaces:
+            Product.flush_model()
+            self.env.cr.execute('''UPDATE crm_concept_line cil SET concept_ex = True, concept_id = v.product_id
+                FROM unnest(%s::int[], %s::int[]) AS v(line_id, product_id) WHERE cil.id = v.line_id''',
+                [[line_id for line_id, _product in enlaces], [product_id for _line, product_id in enlaces]])
+            self.env['crm.concept.line'].invalidate_model(['concept_ex', 'concept_id'])
+
+        self.concept_ids.filtered(lambda u: u.concept_ex and not u.account_ex and u.concept_id.property_account_income_id).write({'account_ex': True})
 
     def action_autorizar_presupuesto(self):
         self.ensure_one()
@@ -1296,88 +1324,54 @@ class CrmLead(models.Model):
             if not record.doctobasicos_id:
                 raise ValidationError('Se debe de seleccionar el tipo de documento a cargar')
 
-            for x in record.doctobasicos_id:
-                inicio = x.inicio_datos
-                for y in x.configdoc_ids:
-                    if y.no_columna != '*':
-                        if y.columna == 'concepto':
-                            conc = int(y.no_columna) - 1
-                        if y.columna == 'codigo':
-                            cod = int(y.no_columna) - 1
-                        if y.columna == 'descripcion':
-                            desc = int(y.no_columna) - 1
-                        if y.columna == 'unidad':
-                            uni = int(y.no_columna) - 1
-                        if y.columna == 'precio_unitario':
-                            prec = int(y.no_columna) - 1
-                        if y.columna == 'cantidad':
-                            qty = int(y.no_columna) - 1
-                        if y.columna == 'importe':
-                            imp = int(y.no_columna) - 1
-                if x.docto_rel:
-                    iniciorel = x.docto_rel.inicio_datos
-                    for y in x.docto_rel.configdoc_ids:
-                        if y.no_columna != '*':
-                            if y.columna == 'codigo':
-                                codrel = int(y.no_columna) - 1
-                            if y.columna == 'descripcion':
-                                descrel = int(y.no_columna) - 1
-                            if y.columna == 'unidad':
-                                unirel = int(y.no_columna) - 1
-                            if y.columna == 'precio_unitario':
-                                precrel = int(y.no_columna) - 1
+            tipodoc = record.doctobasicos_id
+            columns = get_column_map(tipodoc, ('concepto', 'codigo', 'descripcion', 'unidad', 'precio_unitario', 'cantidad', 'importe'))
+            if not tipodoc.docto_rel:
+                raise ValidationError('El tipo de documento %s no tiene configurado el documento relacionado.' % tipodoc.display_name)
+            columns_rel = get_column_map(tipodoc.docto_rel, ('codigo',))
 
             doctos = self.env['documents.document'].search([('res_model','=','crm.lead'), ('res_id','=',record.id), 
                 ('file_extension','in',['xlsx', 'xls', 'xlsm']), ('name','ilike','10 Relac')])
-            attachment = doctos.attachment_id
-            decoded_data = base64.b64decode(attachment.datas)
-            workbook = openpyxl.load_workbook(filename=io.BytesIO(decoded_data), data_only=True)
-            sheet = workbook.active
-            registros = []
-            contador = 1
-            for row in sheet.iter_rows(values_only=True):
-                if contador < inicio:
-                    contador += 1
-                    continue
-
-                if row[codrel] == None:
-                    continue
-
-                registro = {'col1': row[cod], 'col2': row[desc], 'col3': row[uni], 'col4': row[prec]}
-                registros.append((0, 0, registro))
-            record.write({'relacion_ids': registros})
-
-            attachment = docto.attachment_id
-            decoded_data = base64.b64decode(attachment.datas)
-            workbook = openpyxl.load_workbook(filename=io.BytesIO(decoded_data), data_only=True)
-            sheet = workbook.active
-            registros = []
-            contador = 1
-            for row in sheet.iter_rows(values_only=True):
-                if contador < inicio:
-                    contador += 1
-                    continue
+            for attachment in doctos.attachment_id:
+                record._load_lines(record.__iter_basico_relacion(attachment, columns, columns_rel, tipodoc.inicio_datos))
+
+            # Relaciones del lead en memoria (la primera por código) en lugar de una búsqueda por renglón
+            relaciones = {}
+            for relacion in self.env['crm.basico.relacion'].search([('lead_id', '=', record.id)]):
+                relaciones.setdefault(relacion.col1, relacion)
+            record._load_lines(record.__iter_basico(docto.attachment_id, columns, relaciones, tipodoc.inicio_datos))
+
+    def __iter_basico_relacion(self, attachment, columns, columns_rel, inicio):
+        cod, desc, uni, prec = columns['codigo'], columns['descripcion'], columns['unidad'], columns['precio_unitario']
+        codrel = columns_rel['codigo']
+        for row in iter_attachment_rows(attachment, width=max(cod, desc, uni, prec, codrel) + 1, start=inicio):
+            if row[codrel] == None:
+                continue
+            yield 'relacion_ids', {'col1': row[cod], 'col2': row[desc], 'col3': row[uni], 'col4': row[prec]}
+
+    def __iter_basico(self, attachment, columns, relaciones, inicio):
+        conc, cod, desc, uni, prec, qty, imp = (columns[name] for name in ('concepto', 'codigo', 'descripcion', 'unidad', 'precio_unitario', 'cantidad', 'importe'))
+        relacion_id = self.env['crm.basico.relacion']
+        basico = False
+        for row in iter_attachment_rows(attachment, width=max(conc, cod, desc, uni, prec, qty, imp) + 1, start=inicio):
+            if row[conc] == None or str(row[conc]).replace(' ', '') == '':
+                continue
 
-                if row[conc] == None or row[conc].replace(' ', '') == '':
-                    continue
+            relacion = relaciones.get(str(row[conc]))
+            if relacion:
+                relacion_id = relacion
+                basico = row[conc]
+                continue
 
-                relacion = self.env['crm.basico.relacion'].search([('lead_id','=',record.id), ('col1','=',row[conc])])
-                if relacion:
-                    relacion_id = relacion
-                    basico = row[conc]
-                    continue
+            if row[qty] == None:
+                continue
+            if len(str(row[qty]).replace(' ', '')) == 0:
+                continue
+            if not isinstance(row[imp], (int, float)):
+                continue
 
-                if row[qty] == None:
-                    continue
-                if len(str(row[qty]).replace(' ', '')) == 0:
-                    continue
-                if not isinstance(row[imp], (int, float)):
-                    continue
-                
-                registro = {'relacion_id': relacion_id.id, 'col1': row[cod], 'col2': row[desc], 'col3': row[uni], 'col4': row[prec], 'col5': row[qty], 
-                    'col6': row[imp], 'basico': basico}
-                registros.append((0, 0, registro))
-            record.write({'basico_ids': registros})
+            yield 'basico_ids', {'relacion_id': relacion_id.id, 'col1': row[cod], 'col2': row[desc], 'col3': row[uni], 'col4': row[prec],
+                'col5': row[qty], 'col6': row[imp], 'basico': basico}
 
 
     def action_generar_basicos(self):
@@ -1385,9 +1379,10 @@ class CrmLead(models.Model):
         if count == 0:
             raise ValidationError('Los basicos fueron generados correctamente, favor de continuar con la generación de las tarjetas de conceptos')
         else:
+            self.env['product.template'].flush_model(['default_code_key'])
             self.env.cr.execute('SELECT cbr.COL1, cbr.COL2 FROM crm_basico_line cbr WHERE cbr.LEAD_ID = ' + str(self.id) + ''' AND cbr.COMBO_EX IS FALSE 
                 AND NOT EXISTS(SELECT * FROM crm_basico_relacion cbr2 WHERE cbr.COL1 = cbr2.COL1 AND cbr.LEAD_ID = cbr2.LEAD_ID) 
-                AND NOT EXISTS(SELECT * FROM product_template pt WHERE pt.DEFAULT_CODE = cbr.COL1) GROUP BY 1, 2 ORDER BY 1''')
+                AND NOT EXISTS(SELECT * FROM product_template pt WHERE pt.DEFAULT_CODE_KEY = UPPER(TRIM(cbr.COL1))) GROUP BY 1, 2 ORDER BY 1''')
             ex_basicos = self.env.cr.dictfetchall()
             mensaje = ''
             for x in ex_basicos:
@@ -1421,51 +1416,31 @@ class CrmLead(models.Model):
             if not record.doctomatriz_id:
                 raise ValidationError('Se debe de seleccionar el tipo de documento a cargar')
 
-            inicio = record.doctomatriz_id.inicio_datos
-            for x in record.doctomatriz_id.configdoc_ids:
-                if x.no_columna != '*':
-                    if x.columna == 'concepto':
-                        conc = int(x.no_columna) - 1
-                    if x.columna == 'codigo':
-                        cod = int(x.no_columna) - 1
-                    if x.columna == 'descripcion':
-                        desc = int(x.no_columna) - 1
-                    if x.columna == 'unidad':
-                        uni = int(x.no_columna) - 1
-                    if x.columna == 'precio_unitario':
-                        prec = int(x.no_columna) - 1
-                    if x.columna == 'cantidad':
-                        qty = int(x.no_columna) - 1
-                    if x.columna == 'importe':
-                        imp = int(x.no_columna) - 1
-
-            attachment = docto.attachment_id
-            decoded_data = base64.b64decode(attachment.datas)
-            workbook = openpyxl.load_workbook(filename=io.BytesIO(decoded_data), data_only=True)
-            sheet = workbook.active
-            registros = []
-            contador = 1
-            for row in sheet.iter_rows(values_only=True):
-                if contador < inicio:
-                    contador += 1
-                    continue
-
-                concepto = self.env['crm.concept.line'].search([('lead_id','=',record.id), ('concept_id.default_code','=',row[conc])])
-                if concepto:
-                    concept_id = concepto
-                    continue
+            columns = get_column_map(record.doctomatriz_id, ('concepto', 'codigo', 'descripcion', 'unidad', 'precio_unitario', 'cantidad', 'importe'))
+            # Conceptos del lead por código normalizado en memoria (el primero por código) en lugar de una búsqueda por renglón
+            conceptos = {}
+            for concepto in self.env['crm.concept.line'].search([('lead_id', '=', record.id), ('concept_id.default_code_key', '!=', False)]):
+                conceptos.setdefault(concepto.concept_id.default_code_key, concepto)
+            record._load_lines(record.__iter_combo(docto.attachment_id, columns, conceptos, record.doctomatriz_id.inicio_datos))
+
+    def __iter_combo(self, attachment, columns, conceptos, inicio):
+        conc, cod, desc, uni, prec, qty, imp = (columns[name] for name in ('concepto', 'codigo', 'descripcion', 'unidad', 'precio_unitario', 'cantidad', 'importe'))
+        concept_id = self.env['crm.concept.line']
+        for row in iter_attachment_rows(attachment, width=max(conc, cod, desc, uni, prec, qty, imp) + 1, start=inicio):
+            concepto = conceptos.get(self.env['product.template']._normalize_default_code(row[conc]))
+            if concepto:
+                concept_id = concepto
+                continue
 
-                if row[qty] == None:
-                    continue
-                if len(str(row[qty]).replace(' ', '')) == 0:
-                    continue
-                if not isinstance(row[imp], (int, float)):
-                    continue
+            if row[qty] == None:
+                continue
+            if len(str(row[qty]).replace(' ', '')) == 0:
+                continue
+            if not isinstance(row[imp], (int, float)):
+                continue
 
-                registro = {'concept_id': concept_id.concept_id.id, 'col1': row[cod], 'col2': row[desc], 'col3': row[uni], 'col4': row[prec], 'col5': '', 
-                    'col6': row[qty], 'col7': row[imp]}
-                registros.append((0, 0, registro))
-            record.write({'combo_ids': registros})
+            yield 'combo_ids', {'concept_id': concept_id.concept_id.id, 'col1': row[cod], 'col2': row[desc], 'col3': row[uni], 'col4': row[prec],
+                'col5': '', 'col6': row[qty], 'col7': row[imp]}
 
 
     def action_generar_combo(self):
@@ -1477,8 +1452,9 @@ class CrmLead(models.Model):
         if count == 0:
             raise UserError('Las tarjetas de conceptos fueron generados correctamente')
         else:
+            self.env['product.template'].flush_model(['default_code_key'])
             self.env.cr.execute('SELECT ccl.COL1, ccl.COL2 FROM crm_combo_line ccl WHERE ccl.LEAD_ID = ' + str(self.id) + ''' AND ccl.COMBO_EX IS FALSE 
-                AND ccl.COL1 IS NOT NULL AND NOT EXISTS(SELECT * FROM product_template pt WHERE pt.DEFAULT_CODE = ccl.COL1) 
+                AND ccl.COL1 IS NOT NULL AND NOT EXISTS(SELECT * FROM product_template pt WHERE pt.DEFAULT_CODE_KEY = UPPER(TRIM(ccl.COL1))) 
                 AND NOT EXISTS(SELECT * FROM crm_basico_relacion cbr WHERE cbr.COL1 = ccl.COL1 and ccl.LEAD_ID = cbr.LEAD_ID) GROUP BY 1, 2 ORDER BY 1''')
             ex_basicos = self.env.cr.dictfetchall()
             mensaje = ''
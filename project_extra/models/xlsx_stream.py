@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from odoo.exceptions import ValidationError
+import io
+import os
+import openpyxl
+
+LOAD_BATCH_SIZE = 1000   # Renglones que se acumulan antes de escribirlos en las tablas de líneas
+
+
+def attachment_source(attachment):
+    """ Origen del libro para openpyxl: la ruta del filestore cuando el adjunto vive ahí (sin pasar por base64),
+    o los bytes crudos cuando está guardado en la base de datos. """
+    attachment = attachment.sudo()
+    if attachment.store_fname:
+        path = attachment._full_path(attachment.store_fname)
+        if os.path.isfile(path):
+            return path
+    return io.BytesIO(attachment.raw or b'')
+
+
+def iter_attachment_rows(attachment, width=0, start=1, first_sheet=False):
+    """ Recorre los renglones (solo valores) de la hoja activa (o la primera) en modo read-only, sin cargar el
+    libro completo en memoria. Los renglones se rellenan con None hasta `width` columnas y se omiten los
+    anteriores a `start` (fila donde inician los datos, base 1). """
+    workbook = openpyxl.load_workbook(attachment_source(attachment), read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0] if first_sheet else workbook.active
+        # Algunos generadores de XLSX declaran mal la dimensión de la hoja; se ignora para no truncar renglones
+        sheet.reset_dimensions()
+        for row in sheet.iter_rows(min_row=max(start or 1, 1), values_only=True):
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            yield row
+    finally:
+        workbook.close()
+
+
+def get_column_map(tipodoc, required=()):
+    """ Índices (base 0) de las columnas configuradas en el tipo de documento (configdoc_ids); las marcadas con '*'
+    no se leen del archivo. Valida que existan las columnas requeridas. """
+    columns = {}
+    for config in tipodoc.configdoc_ids:
+        if config.no_columna and config.no_columna != '*':
+            try:
+                columns[config.columna] = int(config.no_columna) - 1
+            except ValueError:
+                raise ValidationError('El número de columna "%s" del tipo de documento %s no es válido.' % (config.no_columna, tipodoc.display_name))
+    faltantes = [name for name in required if name not in columns]
+    if faltantes:
+        raise ValidationError('El tipo de documento %s no tiene configuradas las columnas: %s' % (tipodoc.display_name, ', '.join(faltantes)))
+    return columns